@@ -1,62 +1,53 @@
+import argparse
 import asyncio
-import time
-import aiohttp
-from typing import List, Dict
-import numpy as np
-from tqdm import tqdm
-
-class Benchmarker:
-    def __init__(self, base_url: str):
-        self.base_url = base_url
-
-    async def run_inference(self, model_name: str, input_text: str) -> Dict:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{self.base_url}/inference", json={"model_name": model_name, "input_text": input_text}) as response:
-                return await response.json()
-
-    async def run_benchmark(self, model_name: str, input_texts: List[str], num_iterations: int = 100, concurrency: int = 10):
-        latencies = []
-        throughputs = []
-
-        async def worker(input_text: str):
-            start_time = time.time()
-            await self.run_inference(model_name, input_text)
-            end_time = time.time()
-            return end_time - start_time
-
-        for _ in tqdm(range(num_iterations)):
-            start_time = time.time()
-            tasks = [worker(text) for text in input_texts[:concurrency]]
-            batch_latencies = await asyncio.gather(*tasks)
-            end_time = time.time()
-
-            latencies.extend(batch_latencies)
-            throughput = len(batch_latencies) / (end_time - start_time)
-            throughputs.append(throughput)
-
-        return {
-            "average_latency": np.mean(latencies),
-            "p50_latency": np.percentile(latencies, 50),
-            "p95_latency": np.percentile(latencies, 95),
-            "p99_latency": np.percentile(latencies, 99),
-            "average_throughput": np.mean(throughputs),
-            "max_throughput": np.max(throughputs),
-        }
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from benchmarking import Benchmarker
+
+INPUT_TEXTS = [
+    "Hello, how are you?",
+    "What's the weather like today?",
+    "Can you tell me a joke?",
+    "What's the capital of France?",
+    "How do I make a pizza?",
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the /inference endpoint")
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--model-name", default="gpt2")
+    parser.add_argument("--mode", choices=["closed", "open", "sweep"], default="closed",
+                        help="closed: fixed-concurrency waves; open: fixed arrival rate; sweep: find the saturation rate")
+    parser.add_argument("--num-iterations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=50.0, help="Target requests per second in open mode")
+    parser.add_argument("--rates", type=float, nargs="+", default=[10, 25, 50, 100, 200, 400],
+                        help="Target rates to try in sweep mode")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per open-loop run")
+    parser.add_argument("--arrival", choices=["poisson", "fixed"], default="poisson")
+    parser.add_argument("--latency-slo", type=float, default=None, help="p99 latency (seconds) that counts as saturated")
+    return parser.parse_args()
 
 async def main():
-    benchmarker = Benchmarker("http://localhost:8080")
-    model_name = "gpt2"
-    input_texts = [
-        "Hello, how are you?",
-        "What's the weather like today?",
-        "Can you tell me a joke?",
-        "What's the capital of France?",
-        "How do I make a pizza?",
-    ]
-    results = await benchmarker.run_benchmark(model_name, input_texts)
+    args = parse_args()
+    benchmarker = Benchmarker(args.base_url)
+    if args.mode == "closed":
+        results = await benchmarker.run_benchmark(args.model_name, INPUT_TEXTS, args.num_iterations, args.concurrency)
+    elif args.mode == "open":
+        results = await benchmarker.run_open_loop(args.model_name, INPUT_TEXTS, args.rate, args.duration, args.arrival)
+    else:
+        sweep = await benchmarker.sweep_rates(args.model_name, INPUT_TEXTS, args.rates, args.duration, args.arrival,
+                                              latency_slo=args.latency_slo)
+        for run in sweep["runs"]:
+            print(f"rate={run['target_rate']}: offered={run['offered_rate']:.1f} throughput={run['achieved_throughput']:.1f} "
+                  f"backlog={run['backlog']} p99={run['p99_latency']:.4f} errors={run['errors']}")
+        results = {"saturation_rate": sweep["saturation_rate"], "max_sustainable_rate": sweep["max_sustainable_rate"]}
     print("Benchmark Results:")
     for key, value in results.items():
         print(f"{key}: {value}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
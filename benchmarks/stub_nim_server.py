@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import numpy as np
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from tensor_codec import TENSOR_CONTENT_TYPE, encode_tensors, decode_tensors
+
+# A stand-in for NIM that needs no GPU. Each inference call sleeps for
+# batch_latency + per_item_latency * batch_size and returns random float32 logits,
+# so batching and client changes can be measured on a laptop.
+
+class StubNIMServer:
+    def __init__(self, batch_latency: float = 0.01, per_item_latency: float = 0.0005, vocab_size: int = 1024,
+                 per_token_logits: bool = False, max_concurrency: int = 1, token_interval: float = 0.005):
+        self.batch_latency = batch_latency
+        self.per_item_latency = per_item_latency
+        self.vocab_size = vocab_size
+        self.per_token_logits = per_token_logits
+        self.max_concurrency = max_concurrency
+        self.token_interval = token_interval
+        self.models = {}
+        self.batches_served = 0
+        self._rng = np.random.default_rng(0)
+        self._gpu = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/models/{model_name}/infer", self.infer)
+        app.router.add_post("/models/{model_name}/infer/stream", self.stream)
+        app.router.add_get("/models/{model_name}/status", self.status)
+        app.router.add_post("/models/{model_name}", self.deploy)
+        app.router.add_delete("/models/{model_name}", self.undeploy)
+        return app
+
+    async def _simulate_batch(self, batch_size: int):
+        # Like a GPU, the stub runs at most max_concurrency batches at a time.
+        if self._gpu is None:
+            self._gpu = asyncio.Semaphore(self.max_concurrency)
+        async with self._gpu:
+            await asyncio.sleep(self.batch_latency + self.per_item_latency * batch_size)
+        self.batches_served += 1
+
+    async def infer(self, request: web.Request) -> web.Response:
+        binary = request.content_type == TENSOR_CONTENT_TYPE
+        body = decode_tensors(await request.read()) if binary else await request.json()
+        input_ids = np.asarray(body["input_ids"])
+        if input_ids.ndim == 1:
+            input_ids = input_ids[np.newaxis, :]
+        await self._simulate_batch(input_ids.shape[0])
+
+        shape = (*input_ids.shape, self.vocab_size) if self.per_token_logits else (input_ids.shape[0], self.vocab_size)
+        logits = self._rng.standard_normal(shape, dtype=np.float32)
+        if TENSOR_CONTENT_TYPE in request.headers.get("Accept", ""):
+            return web.Response(body=bytes(encode_tensors({"logits": logits})), content_type=TENSOR_CONTENT_TYPE)
+        return web.json_response({"logits": logits.tolist()})
+
+    async def stream(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        max_new_tokens = body.get("parameters", {}).get("max_new_tokens", 16)
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        await self._simulate_batch(1)
+        for index in range(max_new_tokens):
+            token_id = int(self._rng.integers(self.vocab_size))
+            await response.write((json.dumps({"index": index, "token_id": token_id}) + "\n").encode("utf-8"))
+            await asyncio.sleep(self.token_interval)
+        await response.write_eof()
+        return response
+
+    async def status(self, request: web.Request) -> web.Response:
+        model_name = request.match_info["model_name"]
+        return web.json_response({"status": "running" if model_name in self.models else "unknown", "num_layers": 12})
+
+    async def deploy(self, request: web.Request) -> web.Response:
+        model_name = request.match_info["model_name"]
+        self.models[model_name] = await request.json()
+        return web.json_response({"status": "success", "model": model_name})
+
+    async def undeploy(self, request: web.Request) -> web.Response:
+        model_name = request.match_info["model_name"]
+        self.models.pop(model_name, None)
+        return web.json_response({"status": "success", "model": model_name})
+
+def make_stub_tokenizer(path: str, texts):
+    # A whitespace word-level tokenizer built from the benchmark prompts, so the
+    # service can tokenize without downloading a model.
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {"[PAD]": 0, "[UNK]": 1}
+    for text in texts:
+        for word in text.split():
+            vocab.setdefault(word, len(vocab))
+    tokenizer = Tokenizer(models.WordLevel(vocab=vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    PreTrainedTokenizerFast(tokenizer_object=tokenizer, unk_token="[UNK]", pad_token="[PAD]").save_pretrained(path)
+    return path
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a local stub NIM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--batch-latency", type=float, default=0.01, help="Fixed seconds per batch")
+    parser.add_argument("--per-item-latency", type=float, default=0.0005, help="Extra seconds per request in a batch")
+    parser.add_argument("--vocab-size", type=int, default=1024, help="Width of the returned logits")
+    parser.add_argument("--per-token-logits", action="store_true", help="Return logits for every input position")
+    parser.add_argument("--max-concurrency", type=int, default=1, help="Batches the simulated GPU runs at once")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = StubNIMServer(args.batch_latency, args.per_item_latency, args.vocab_size, args.per_token_logits,
+                           args.max_concurrency)
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None)
@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List
+import numpy as np
+import yaml
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+BASELINES_DIR = os.path.join(BENCHMARKS_DIR, "baselines")
+sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+
+from benchmarking import Benchmarker
+from dynamic_batcher import DynamicBatcher, batch_inference
+from tensor_codec import encode_tensors, decode_tensors
+
+E2E_PROMPTS = [
+    "Hello, how are you?",
+    "What's the weather like today?",
+    "Can you tell me a joke?",
+    "Summarize the plot of a long novel about a sailor who spends years chasing a white whale across the sea",
+    "Translate good morning into French",
+    "Write a short poem about autumn leaves falling in a quiet park at dusk",
+]
+
+def _timed(func, iterations: int) -> float:
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start_time) / iterations
+
+def bench_batcher_dispatch(num_requests: int = 20000, max_batch_size: int = 32) -> Dict[str, float]:
+    async def handler(model_name, batch):
+        return batch
+
+    async def run():
+        batcher = DynamicBatcher(max_batch_size, 0.001, handler, length_buckets=[16, 64, 256])
+        requests = [{"input_ids": np.ones(length, dtype=np.int64)} for length in np.resize([5, 30, 120], num_requests)]
+        start_time = time.perf_counter()
+        await asyncio.gather(*[batcher.add_request("gpt2", request) for request in requests])
+        elapsed = time.perf_counter() - start_time
+        await batcher.stop()
+        return elapsed
+
+    elapsed = asyncio.run(run())
+    return {"requests_per_sec": num_requests / elapsed, "overhead_us_per_request": elapsed / num_requests * 1e6}
+
+def bench_batch_inference(iterations: int = 200, batch_size: int = 32, vocab_size: int = 256) -> Dict[str, float]:
+    lengths = np.random.default_rng(0).integers(5, 200, size=batch_size)
+    batch = [{"input_ids": np.arange(length), "attention_mask": np.ones(length, dtype=np.int64)} for length in lengths]
+    logits = np.zeros((batch_size, int(lengths.max()), vocab_size), dtype=np.float32)
+
+    class InProcessClient:
+        async def inference(self, model_name, input_data):
+            return {"logits": logits}
+
+    client = InProcessClient()
+    loop = asyncio.new_event_loop()
+    try:
+        seconds = _timed(lambda: loop.run_until_complete(batch_inference(client, "gpt2", batch)), iterations)
+    finally:
+        loop.close()
+    return {"batch_latency_us": seconds * 1e6}
+
+def bench_tensor_codec(iterations: int = 20, batch_size: int = 32, vocab_size: int = 50257) -> Dict[str, float]:
+    logits = np.random.default_rng(0).standard_normal((batch_size, vocab_size), dtype=np.float32)
+    body = bytes(encode_tensors({"logits": logits}))
+    json_body = json.dumps({"logits": logits.tolist()})
+    return {
+        "binary_encode_ms": _timed(lambda: encode_tensors({"logits": logits}), iterations) * 1e3,
+        "binary_decode_ms": _timed(lambda: decode_tensors(body), iterations) * 1e3,
+        "json_decode_ms": _timed(lambda: np.asarray(json.loads(json_body)["logits"], dtype=np.float32), iterations) * 1e3,
+    }
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_until_listening(port: int, process: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before listening on {port}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+def _wait_until_ready(port: int, process: subprocess.Popen, timeout: float = 120.0):
+    from urllib.request import urlopen
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before becoming ready")
+        try:
+            with urlopen(f"http://127.0.0.1:{port}/ready", timeout=0.5) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Service on port {port} not ready after {timeout}s")
+
+def _write_e2e_config(directory: str, nim_port: int) -> str:
+    from stub_nim_server import make_stub_tokenizer
+
+    with open(os.path.join(ROOT_DIR, "config", "config.yaml")) as f:
+        config = yaml.safe_load(f)
+    config["nim_base_url"] = f"http://127.0.0.1:{nim_port}"
+    config["model_config"] = {
+        "stub": {
+            "model_path": make_stub_tokenizer(os.path.join(directory, "tokenizer"), E2E_PROMPTS),
+            "num_gpus": 1,
+            "max_batch_size": 32,
+            "max_latency": 0.005,
+        }
+    }
+    config["monitoring"]["prometheus_port"] = _free_port()
+    # Every request should exercise the batcher and the NIM client, not the cache.
+    config["response_cache"] = {"enabled": False}
+    config_path = os.path.join(directory, "config.yaml")
+    with open(config_path, "w") as f:
+        yaml.safe_dump(config, f)
+    return config_path
+
+def bench_startup(runs: int = 3) -> Dict[str, float]:
+    # Import time of the service module, and time from launching the server to /ready answering.
+    import_script = "import sys, time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    import_times, ready_times = [], []
+    with tempfile.TemporaryDirectory() as directory:
+        config_path = _write_e2e_config(directory, _free_port())
+        env = dict(os.environ, CONFIG_PATH=config_path, PYTHONPATH=os.path.join(ROOT_DIR, "src"))
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, "-c", import_script], env=env, cwd=ROOT_DIR,
+                                    capture_output=True, text=True, check=True).stdout
+            import_times.append(float(output.strip().splitlines()[-1]))
+
+            port = _free_port()
+            start_time = time.perf_counter()
+            app = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "serve", "--config", config_path, "--port", str(port)],
+                cwd=ROOT_DIR,
+            )
+            try:
+                _wait_until_ready(port, app)
+                ready_times.append(time.perf_counter() - start_time)
+            finally:
+                app.terminate()
+                app.wait(timeout=30)
+    return {"import_seconds": float(np.median(import_times)), "time_to_ready_seconds": float(np.median(ready_times))}
+
+def bench_end_to_end(rates: List[float], duration: float, batch_latency: float, per_item_latency: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        nim_port, app_port = _free_port(), _free_port()
+        processes = []
+        try:
+            nim = subprocess.Popen([
+                sys.executable, os.path.join(BENCHMARKS_DIR, "stub_nim_server.py"), "--port", str(nim_port),
+                "--batch-latency", str(batch_latency), "--per-item-latency", str(per_item_latency),
+            ])
+            processes.append(nim)
+            config_path = _write_e2e_config(directory, nim_port)
+            app = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "serve", "--config", config_path, "--port", str(app_port)],
+                cwd=ROOT_DIR,
+            )
+            processes.append(app)
+            _wait_until_listening(nim_port, nim)
+            _wait_until_listening(app_port, app)
+
+            benchmarker = Benchmarker(f"http://127.0.0.1:{app_port}")
+            # Warm up the tokenizer and connection pool before measuring.
+            asyncio.run(benchmarker.run_open_loop("stub", E2E_PROMPTS, rate=20, duration=0.5, arrival="fixed"))
+            for rate in rates:
+                run = asyncio.run(benchmarker.run_open_loop("stub", E2E_PROMPTS, rate, duration, "poisson", seed=0))
+                results[f"e2e_rate_{int(rate)}"] = {
+                    key: run[key] for key in ("achieved_throughput", "p50_latency", "p99_latency", "errors")
+                }
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait(timeout=30)
+    return results
+
+def run_suite(include_e2e: bool, rates: List[float], duration: float) -> Dict[str, Any]:
+    results = {
+        "batcher_dispatch": bench_batcher_dispatch(),
+        "batch_inference": bench_batch_inference(),
+        "tensor_codec": bench_tensor_codec(),
+        "startup": bench_startup(),
+    }
+    if include_e2e:
+        results.update(bench_end_to_end(rates, duration, batch_latency=0.01, per_item_latency=0.0005))
+    return {
+        "metadata": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+def higher_is_better(metric: str) -> bool:
+    return "throughput" in metric or metric.endswith("_per_sec")
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.1) -> List[Dict[str, Any]]:
+    rows = []
+    for benchmark, metrics in baseline["results"].items():
+        for metric, base_value in metrics.items():
+            value = current["results"].get(benchmark, {}).get(metric)
+            if value is None:
+                continue
+            if base_value == 0:
+                change = 0.0 if value == 0 else float("inf")
+            else:
+                change = (value - base_value) / abs(base_value)
+            regressed = change < -tolerance if higher_is_better(metric) else change > tolerance
+            rows.append({"benchmark": benchmark, "metric": metric, "baseline": base_value, "current": value,
+                         "change": change, "regression": regressed})
+    return rows
+
+def serve(config_path: str, port: int):
+    # Runs the real FastAPI app outside a cluster for the end-to-end benchmark.
+    import uvicorn
+
+    os.environ["CONFIG_PATH"] = config_path
+    import main
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite with regression baselines")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and write a JSON result file")
+    run_parser.add_argument("--output", default="bench_results.json")
+    run_parser.add_argument("--save-baseline", metavar="NAME", help=f"Also store the results as {BASELINES_DIR}/NAME.json")
+    run_parser.add_argument("--skip-e2e", action="store_true", help="Only run the microbenchmarks")
+    run_parser.add_argument("--rates", type=float, nargs="+", default=[50, 200])
+    run_parser.add_argument("--duration", type=float, default=5.0)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare a result file against a baseline")
+    compare_parser.add_argument("baseline", help="Baseline name or path to a JSON file")
+    compare_parser.add_argument("current", help="Path to a JSON result file")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative change before flagging")
+
+    serve_parser = subparsers.add_parser("serve", help=argparse.SUPPRESS)
+    serve_parser.add_argument("--config", required=True)
+    serve_parser.add_argument("--port", type=int, required=True)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.command == "serve":
+        serve(args.config, args.port)
+        return 0
+
+    if args.command == "run":
+        report = run_suite(not args.skip_e2e, args.rates, args.duration)
+        paths = [args.output]
+        if args.save_baseline:
+            os.makedirs(BASELINES_DIR, exist_ok=True)
+            paths.append(os.path.join(BASELINES_DIR, f"{args.save_baseline}.json"))
+        for path in paths:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+        for benchmark, metrics in report["results"].items():
+            print(benchmark, json.dumps(metrics))
+        return 0
+
+    baseline_path = args.baseline
+    if not os.path.exists(baseline_path):
+        baseline_path = os.path.join(BASELINES_DIR, f"{args.baseline}.json")
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare_results(baseline, current, args.tolerance)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else "ok"
+        print(f"{row['benchmark']:<24} {row['metric']:<28} {row['baseline']:>14.4f} {row['current']:>14.4f} "
+              f"{row['change']:>+8.1%}  {flag}")
+    return 1 if any(row["regression"] for row in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# Bump when the layout of a cached artifact changes, so stale entries stop matching.
+CACHE_FORMAT = 1
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+class ArtifactCache:
+    # On-disk cache of derived model artifacts (e.g. optimized ONNX exports). An entry is keyed
+    # by a hash of the source weights plus the conversion settings, so it is reused across
+    # redeploys and rollouts and rebuilt only when either changes. Entries are built in a
+    # temporary directory and renamed into place, so concurrent builders never see a partial
+    # artifact; the least recently used entries are evicted to stay under max_bytes.
+    def __init__(self, directory: str = "artifacts", max_bytes: int = 50 * 1024 ** 3, hub_timeout: float = 10.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hub_timeout = hub_timeout
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._fingerprints: Dict[str, Any] = {}
+
+    def fingerprint(self, model_path: str) -> str:
+        # Content hash of every file under model_path. Hashing multi-GB weights is not free,
+        # so results are remembered per file by (size, mtime) in the process.
+        if not os.path.exists(model_path):
+            # A hub model id: the revision it resolves to stands in for the content, so new
+            # upstream weights get a new key. Only an id that cannot be resolved keys by name.
+            revision = self.hub_revision(model_path)
+            return hashlib.sha256(f"id:{model_path}@{revision or ''}".encode("utf-8")).hexdigest()
+        if os.path.isfile(model_path):
+            paths = [model_path]
+            base = os.path.dirname(model_path)
+        else:
+            base = model_path
+            paths = sorted(os.path.join(root, name) for root, _, files in os.walk(model_path) for name in files)
+        digest = hashlib.sha256()
+        for path in paths:
+            digest.update(os.path.relpath(path, base).encode("utf-8") + b"\0")
+            digest.update(self._file_hash(path).encode("ascii"))
+        return digest.hexdigest()
+
+    def hub_revision(self, model_id: str) -> Optional[str]:
+        # Commit sha of the hub's current revision, or offline, of the snapshot in the local
+        # Hugging Face cache, which is what from_pretrained would load.
+        try:
+            import huggingface_hub
+        except ImportError:
+            return None
+        try:
+            return huggingface_hub.HfApi().model_info(model_id, timeout=self.hub_timeout).sha
+        except Exception:
+            pass
+        try:
+            return os.path.basename(huggingface_hub.snapshot_download(model_id, local_files_only=True))
+        except Exception:
+            return None
+
+    def _file_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._fingerprints.get(os.path.abspath(path))
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        with self._lock:
+            self._fingerprints[os.path.abspath(path)] = (signature, digest.hexdigest())
+        return digest.hexdigest()
+
+    def make_key(self, model_path: str, settings: Optional[Dict[str, Any]] = None) -> str:
+        material = json.dumps([CACHE_FORMAT, self.fingerprint(model_path), settings or {}], sort_keys=True, default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path(key)
+        if not os.path.isdir(path):
+            return None
+        # The entry directory's mtime is its last use, which drives LRU eviction.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_or_build(self, key: str, build: Callable[[str], None]) -> str:
+        # Returns the entry directory for key, calling build(directory) to fill it on a miss.
+        path = self.get(key)
+        if path is not None:
+            return path
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        # One build per key in this process; other processes are kept apart by the atomic rename.
+        with build_lock:
+            path = self.get(key)
+            if path is not None:
+                return path
+            os.makedirs(self.directory, exist_ok=True)
+            staging = tempfile.mkdtemp(prefix=".build-", dir=self.directory)
+            try:
+                build(staging)
+                with open(os.path.join(staging, ".complete"), "w") as f:
+                    json.dump({"size": directory_size(staging), "created": time.time()}, f)
+                os.rename(staging, self.path(key))
+            except OSError:
+                # Another process finished the same entry first; keep theirs.
+                if not os.path.isdir(self.path(key)):
+                    raise
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        self.evict(keep=key)
+        return self.path(key)
+
+    def entries(self):
+        # (key, size, last used) for every complete entry, least recently used first.
+        result = []
+        if not os.path.isdir(self.directory):
+            return result
+        for key in os.listdir(self.directory):
+            path = self.path(key)
+            if key.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                with open(os.path.join(path, ".complete")) as f:
+                    size = json.load(f)["size"]
+                result.append((key, size, os.stat(path).st_mtime))
+            except (OSError, ValueError, KeyError):
+                continue
+        return sorted(result, key=lambda entry: entry[2])
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep: Optional[str] = None):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            total -= size
@@ -1,11 +1,25 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, List, Optional, Tuple
 import kubernetes
 from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+
+logger = logging.getLogger(__name__)
 
 class AutoScaler:
-    def __init__(self):
-        config.load_incluster_config()
-        self.apps_v1 = client.AppsV1Api()
-        self.autoscaling_v2 = client.AutoscalingV2Api()
+    def __init__(self, api_client: Optional[client.ApiClient] = None):
+        # Pass an ApiClient to talk to a different cluster or a fake API server.
+        if api_client is None:
+            config.load_incluster_config()
+            api_client = client.ApiClient()
+        self.apps_v1 = client.AppsV1Api(api_client)
+        self.autoscaling_v2 = client.AutoscalingV2Api(api_client)
+        self.coordination_v1 = client.CoordinationV1Api(api_client)
 
     def scale_deployment(self, name, namespace, replicas):
         body = {
@@ -15,6 +29,49 @@ class AutoScaler:
         }
         self.apps_v1.patch_namespaced_deployment_scale(name, namespace, body)
 
+    def get_replicas(self, name, namespace) -> int:
+        return self.apps_v1.read_namespaced_deployment_scale(name, namespace).spec.replicas
+
+    def acquire_lease(self, name, namespace, holder, duration) -> bool:
+        # Takes or renews a coordination.k8s.io Lease; True while `holder` holds it. Writes
+        # carry the lease's resourceVersion, so of two pods racing for it only one succeeds.
+        now = datetime.now(timezone.utc)
+        try:
+            lease = self.coordination_v1.read_namespaced_lease(name, namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            body = client.V1Lease(
+                metadata=client.V1ObjectMeta(name=name, namespace=namespace),
+                spec=client.V1LeaseSpec(holder_identity=holder, lease_duration_seconds=duration,
+                                        acquire_time=now, renew_time=now),
+            )
+            try:
+                self.coordination_v1.create_namespaced_lease(namespace, body)
+            except ApiException as e:
+                if e.status == 409:
+                    return False
+                raise
+            return True
+
+        spec = lease.spec
+        expired = spec.renew_time is None or (now - spec.renew_time).total_seconds() > (spec.lease_duration_seconds or duration)
+        if spec.holder_identity != holder:
+            if not expired:
+                return False
+            spec.acquire_time = now
+            spec.lease_transitions = (spec.lease_transitions or 0) + 1
+        spec.holder_identity = holder
+        spec.renew_time = now
+        spec.lease_duration_seconds = duration
+        try:
+            self.coordination_v1.replace_namespaced_lease(name, namespace, lease)
+        except ApiException as e:
+            if e.status == 409:
+                return False
+            raise
+        return True
+
     def update_hpa(self, name, namespace, min_replicas, max_replicas, target_cpu_utilization):
         body = client.V2HorizontalPodAutoscaler(
             api_version="autoscaling/v2",
@@ -42,4 +99,167 @@ class AutoScaler:
                 ]
             )
         )
-        self.autoscaling_v2.replace_namespaced_horizontal_pod_autoscaler(name, namespace, body)
\ No newline at end of file
+        self.autoscaling_v2.replace_namespaced_horizontal_pod_autoscaler(name, namespace, body)
+
+def windowed_percentile(previous: List[Tuple[float, float]], current: List[Tuple[float, float]],
+                        percent: float) -> Optional[float]:
+    # Percentile of the observations recorded between two cumulative histogram snapshots,
+    # interpolated linearly within the bucket that contains it.
+    before = dict(previous)
+    window = [(upper, count - before.get(upper, 0.0)) for upper, count in current]
+    if not window or window[-1][1] <= 0:
+        return None
+    rank = window[-1][1] * percent / 100.0
+    lower_bound, lower_count = 0.0, 0.0
+    for upper, count in window:
+        if count >= rank:
+            if math.isinf(upper):
+                return lower_bound
+            fraction = (rank - lower_count) / (count - lower_count) if count > lower_count else 1.0
+            return lower_bound + (upper - lower_bound) * fraction
+        lower_bound, lower_count = upper, count
+    return lower_bound
+
+class ScalingController:
+    # Sizes a deployment from the signals that actually precede overload for an inference
+    # service: queue depth, request rate and tail latency, instead of CPU. Each signal is
+    # compared with its per-replica target and the worst ratio drives the replica count,
+    # as in the HPA formula desired = ceil(current * observed / target). Scale-up follows
+    # the request-rate trend `lookahead` seconds ahead and happens at once; scale-down
+    # waits until every recommendation in the last `scale_down_cooldown` seconds agreed.
+    # Every pod runs a controller; with `lease_name` set, only the pod holding that Lease
+    # scales, so replicas do not overwrite each other's decisions.
+    def __init__(self, auto_scaler: AutoScaler, monitoring, deployment: str, namespace: str = "default",
+                 min_replicas: int = 1, max_replicas: int = 10, target_queue_depth: float = 32,
+                 target_request_rate: Optional[float] = None, target_p95: Optional[float] = None,
+                 tolerance: float = 0.1, lookahead: float = 60.0, scale_down_cooldown: float = 300.0,
+                 interval: float = 15.0, endpoint: str = "inference", lease_name: Optional[str] = None,
+                 identity: Optional[str] = None):
+        self.auto_scaler = auto_scaler
+        self.monitoring = monitoring
+        self.deployment = deployment
+        self.namespace = namespace
+        self.min_replicas = min_replicas
+        self.max_replicas = max_replicas
+        self.target_queue_depth = target_queue_depth
+        self.target_request_rate = target_request_rate
+        self.target_p95 = target_p95
+        self.tolerance = tolerance
+        self.lookahead = lookahead
+        self.scale_down_cooldown = scale_down_cooldown
+        self.interval = interval
+        self.endpoint = endpoint
+        self.lease_name = lease_name
+        self.identity = identity
+        self.replicas: Optional[int] = None
+        self.request_rate: Optional[float] = None
+        self.rate_trend = 0.0
+        self.last_scale_up: Optional[float] = None
+        self._recommendations: Deque[Tuple[float, int]] = deque()
+        self._last_tick: Optional[Tuple[float, int, List[Tuple[float, float]]]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def observe(self, now: float) -> Optional[dict]:
+        # Turns cumulative counters into rates over the last tick; None on the first call.
+        count = self.monitoring.request_count()
+        buckets = self.monitoring.latency_buckets(self.endpoint)
+        previous, self._last_tick = self._last_tick, (now, count, buckets)
+        if previous is None or now <= previous[0]:
+            return None
+        elapsed = now - previous[0]
+        rate = (count - previous[1]) / elapsed
+        if self.request_rate is not None:
+            # Smoothed rate of change, used to scale ahead of a ramp instead of after it.
+            self.rate_trend = 0.5 * self.rate_trend + 0.5 * (rate - self.request_rate) / elapsed
+        self.request_rate = rate
+        return {
+            "queue_depth": self.monitoring.queue_depth(),
+            "request_rate": rate,
+            "predicted_request_rate": max(0.0, rate + self.rate_trend * self.lookahead),
+            "p95_latency": windowed_percentile(previous[2], buckets, 95),
+        }
+
+    def load_ratio(self, signals: dict) -> float:
+        # Signals come from this replica, so each ratio is per-replica load over its target.
+        ratios = [signals["queue_depth"] / self.target_queue_depth]
+        if self.target_request_rate:
+            ratios.append(max(signals["request_rate"], signals["predicted_request_rate"]) / self.target_request_rate)
+        if self.target_p95 and signals["p95_latency"] is not None:
+            ratios.append(signals["p95_latency"] / self.target_p95)
+        return max(ratios)
+
+    def desired_replicas(self, current: int, load: float) -> int:
+        if abs(load - 1.0) <= self.tolerance:
+            return current
+        return min(self.max_replicas, max(self.min_replicas, math.ceil(current * load)))
+
+    def tick(self, now: Optional[float] = None) -> Optional[int]:
+        # Runs one control step and returns the new replica count if it changed.
+        now = time.monotonic() if now is None else now
+        if self.lease_name is not None and not self.is_leader():
+            # Another pod scales; start afresh if this one takes over later.
+            self.replicas = None
+            self._last_tick = None
+            self._recommendations.clear()
+            return None
+        if self.replicas is None:
+            self.replicas = self.auto_scaler.get_replicas(self.deployment, self.namespace)
+        signals = self.observe(now)
+        if signals is None:
+            return None
+        desired = self.desired_replicas(self.replicas, self.load_ratio(signals))
+        self._recommendations.append((now, desired))
+        while self._recommendations and self._recommendations[0][0] < now - self.scale_down_cooldown:
+            self._recommendations.popleft()
+
+        if desired > self.replicas:
+            target = desired
+            self.last_scale_up = now
+        else:
+            # Scale down only to the highest recommendation in the cooldown window, and not
+            # until a full cooldown has passed since the last scale-up.
+            target = max(recommended for _, recommended in self._recommendations)
+            if self.last_scale_up is not None and now - self.last_scale_up < self.scale_down_cooldown:
+                target = self.replicas
+        target = min(self.max_replicas, max(self.min_replicas, target))
+        if target == self.replicas:
+            return None
+        self.auto_scaler.scale_deployment(self.deployment, self.namespace, target)
+        self.replicas = target
+        return target
+
+    def is_leader(self) -> bool:
+        # The lease outlives a few missed ticks, so a pod that is merely slow keeps it.
+        duration = max(1, math.ceil(3 * self.interval))
+        return self.auto_scaler.acquire_lease(self.lease_name, self.namespace, self.identity, duration)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="autoscaler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        # Kubernetes calls block, so the loop runs on its own thread like the metrics sampler.
+        while not self._stop.is_set():
+            self._safe_tick()
+            self._stop.wait(self.interval)
+
+    def _safe_tick(self):
+        try:
+            self.tick()
+        except Exception as e:
+            # A failed API call is retried on the next tick. Missing RBAC shows up here as a
+            # 403 on every tick, so report each failure instead of scaling silently never.
+            self.replicas = None
+            reason = str(e.status) if isinstance(e, ApiException) else type(e).__name__
+            logger.exception("Autoscaling %s/%s failed (%s)", self.namespace, self.deployment, reason)
+            self.monitoring.record_autoscaler_error(reason)
@@ -0,0 +1,169 @@
+import collections
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+class LatencyCurve:
+    # Exponentially weighted least-squares fit of batch latency = intercept + slope * batch_size,
+    # so old observations fade out as the model, hardware or input lengths change.
+    def __init__(self, decay: float = 0.98):
+        self.decay = decay
+        self.weight = 0.0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xx = 0.0
+        self.sum_xy = 0.0
+
+    def observe(self, batch_size: int, latency: float):
+        self.weight = self.decay * self.weight + 1.0
+        self.sum_x = self.decay * self.sum_x + batch_size
+        self.sum_y = self.decay * self.sum_y + latency
+        self.sum_xx = self.decay * self.sum_xx + batch_size * batch_size
+        self.sum_xy = self.decay * self.sum_xy + batch_size * latency
+
+    def fit(self) -> Optional[Tuple[float, float]]:
+        # Returns (intercept, slope), or None until at least two batch sizes have been seen.
+        if self.weight == 0:
+            return None
+        mean_x = self.sum_x / self.weight
+        mean_y = self.sum_y / self.weight
+        variance = self.sum_xx / self.weight - mean_x * mean_x
+        if variance < 1e-6:
+            return None
+        slope = max(0.0, (self.sum_xy / self.weight - mean_x * mean_y) / variance)
+        return max(0.0, mean_y - slope * mean_x), slope
+
+    def predict(self, batch_size: int) -> Optional[float]:
+        fit = self.fit()
+        if fit is None:
+            return None
+        intercept, slope = fit
+        return intercept + slope * batch_size
+
+class ModelBatchState:
+    def __init__(self, batch_size: int, window: float, latency_window: int):
+        self.batch_size = batch_size
+        self.window = window
+        self.curve = LatencyCurve()
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.arrivals = 0
+        self.arrival_rate: Optional[float] = None
+        self.last_decision: Optional[float] = None
+
+class AdaptiveBatchController:
+    # Tunes each model's batch size and batching window online. Larger batches raise
+    # throughput but take longer to fill and to run, so the controller picks the largest
+    # batch whose predicted fill time plus run time fits the p95 target. It backs off
+    # multiplicatively when the observed p95 goes over the target, but never below the batch
+    # size needed to keep up with the arrival rate.
+    def __init__(self, target_p95: float = 0.25, min_batch_size: int = 1, min_window: float = 0.001,
+                 decision_interval: float = 1.0, headroom: float = 0.8, backoff: float = 0.75,
+                 latency_window: int = 512, model_targets: Optional[Dict[str, float]] = None,
+                 concurrency: int = 1, monitoring=None):
+        self.target_p95 = target_p95
+        self.min_batch_size = min_batch_size
+        self.min_window = min_window
+        self.decision_interval = decision_interval
+        self.headroom = headroom
+        self.backoff = backoff
+        self.latency_window = latency_window
+        self.model_targets = model_targets or {}
+        # Batches of one model that can run at once; sets the throughput of a given batch size.
+        self.concurrency = concurrency
+        self.monitoring = monitoring
+        self.states: Dict[str, ModelBatchState] = {}
+
+    def state(self, model_name: str, max_batch_size: int, max_window: float) -> ModelBatchState:
+        state = self.states.get(model_name)
+        if state is None:
+            # Start from the configured limits and let the measurements move them.
+            state = ModelBatchState(max_batch_size, max_window, self.latency_window)
+            self.states[model_name] = state
+        return state
+
+    def limits(self, model_name: str) -> Optional[Tuple[int, float]]:
+        state = self.states.get(model_name)
+        return (state.batch_size, state.window) if state is not None else None
+
+    def observe_arrival(self, model_name: str):
+        state = self.states.get(model_name)
+        if state is not None:
+            state.arrivals += 1
+
+    def observe_batch(self, model_name: str, batch_size: int, latency: float, request_latencies: List[float],
+                      now: float, max_batch_size: int, max_window: float) -> Optional[Tuple[int, float]]:
+        # Returns the new (batch_size, window) when a decision is made, otherwise None.
+        state = self.state(model_name, max_batch_size, max_window)
+        state.curve.observe(batch_size, latency)
+        state.latencies.extend(request_latencies)
+        if state.last_decision is None:
+            state.last_decision = now
+            state.arrivals = 0
+            return None
+        elapsed = now - state.last_decision
+        if elapsed < self.decision_interval:
+            return None
+        rate = state.arrivals / elapsed
+        state.arrival_rate = rate if state.arrival_rate is None else 0.5 * (state.arrival_rate + rate)
+        state.arrivals = 0
+        state.last_decision = now
+        self._decide(model_name, state, max_batch_size, max_window)
+        return state.batch_size, state.window
+
+    def _decide(self, model_name: str, state: ModelBatchState, max_batch_size: int, max_window: float):
+        target = self.model_targets.get(model_name, self.target_p95)
+        p95 = float(np.percentile(state.latencies, 95)) if state.latencies else 0.0
+        # Each decision is judged only on the requests served under the previous one.
+        state.latencies.clear()
+        if p95 > target:
+            # Shrinking below capacity would let the queue, and with it p95, grow without bound.
+            batch_size = max(self.min_batch_size, int(state.batch_size * self.backoff),
+                             self._capacity_batch_size(state, max_batch_size))
+            window = max(self.min_window, state.window * self.backoff)
+        else:
+            batch_size = self._best_batch_size(state, target, max_batch_size, max_window)
+            window = self._fill_window(state, batch_size, target, max_window)
+        state.batch_size = min(batch_size, max_batch_size)
+        state.window = min(window, max_window)
+        if self.monitoring is not None:
+            self.monitoring.update_batching_decision(model_name, state.batch_size, state.window,
+                                                     state.arrival_rate or 0.0, p95)
+
+    def _capacity_batch_size(self, state: ModelBatchState, max_batch_size: int) -> int:
+        # Smallest batch size whose predicted throughput covers the arrival rate with headroom
+        # left to drain a backlog; the largest batch when none does.
+        if not state.arrival_rate or state.curve.fit() is None:
+            return self.min_batch_size
+        required = state.arrival_rate / self.headroom
+        for batch_size in range(self.min_batch_size, max_batch_size + 1):
+            latency = state.curve.predict(batch_size)
+            if latency <= 0 or self.concurrency * batch_size / latency >= required:
+                return batch_size
+        return max_batch_size
+
+    def _fill_time(self, state: ModelBatchState, batch_size: int, max_window: float) -> float:
+        # Expected wait for the batch to fill at the current arrival rate; the window caps it.
+        if not state.arrival_rate:
+            return max_window
+        return min((batch_size - 1) / state.arrival_rate, max_window)
+
+    def _best_batch_size(self, state: ModelBatchState, target: float, max_batch_size: int, max_window: float) -> int:
+        budget = target * self.headroom
+        # Grow at most 2x per decision so a poor fit cannot jump straight to an extreme.
+        upper = min(max_batch_size, max(state.batch_size * 2, self.min_batch_size))
+        fit = state.curve.fit()
+        if fit is None:
+            # Only one batch size seen so far: probe upwards to learn the curve.
+            return min(upper, state.batch_size + max(1, state.batch_size // 4))
+        intercept, slope = fit
+        best = self.min_batch_size
+        for batch_size in range(self.min_batch_size, upper + 1):
+            if self._fill_time(state, batch_size, max_window) + intercept + slope * batch_size <= budget:
+                best = batch_size
+        return best
+
+    def _fill_window(self, state: ModelBatchState, batch_size: int, target: float, max_window: float) -> float:
+        # Wait just long enough to fill the batch at the current arrival rate, without
+        # spending more of the latency budget than the batch's own run time leaves over.
+        predicted = state.curve.predict(batch_size)
+        slack = target * self.headroom - predicted if predicted is not None else max_window
+        return max(self.min_window, min(self._fill_time(state, batch_size, max_window), slack))
@@ -1,38 +1,109 @@
 import asyncio
+import math
 import time
 import aiohttp
-from typing import List, Dict
+from typing import List, Dict, Optional
 import numpy as np
 from tqdm import tqdm
 
+class LatencyHistogram:
+    # Log-bucketed histogram in the spirit of HdrHistogram: every bucket spans a fixed
+    # relative width, so percentiles are accurate to `precision` from microseconds to minutes.
+    def __init__(self, min_value: float = 1e-6, max_value: float = 600.0, precision: float = 0.01):
+        self.min_value = min_value
+        self.max_value = max_value
+        self._log_base = math.log1p(precision)
+        self.counts = np.zeros(self._index(max_value) + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _index(self, value: float) -> int:
+        value = min(max(value, self.min_value), self.max_value)
+        return int(math.log(value / self.min_value) / self._log_base)
+
+    def record(self, value: float):
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram"):
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> float:
+        if self.count == 0:
+            return float("nan")
+        rank = max(1, math.ceil(self.count * percent / 100.0))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        # Report the bucket's upper edge, capped by the largest value actually seen.
+        return min(self.min_value * math.exp((index + 1) * self._log_base), self.max)
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else float("nan")
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "average_latency": self.mean(),
+            "p50_latency": self.percentile(50),
+            "p90_latency": self.percentile(90),
+            "p95_latency": self.percentile(95),
+            "p99_latency": self.percentile(99),
+            "p999_latency": self.percentile(99.9),
+            "max_latency": self.max,
+        }
+
+def arrival_times(rate: float, duration: float, arrival: str = "poisson", seed: Optional[int] = None) -> np.ndarray:
+    if rate <= 0 or duration <= 0:
+        return np.empty(0)
+    if arrival == "fixed":
+        return np.arange(0.0, duration, 1.0 / rate)
+    if arrival == "poisson":
+        rng = np.random.default_rng(seed)
+        chunks = []
+        last = 0.0
+        while last < duration:
+            chunk = last + np.cumsum(rng.exponential(1.0 / rate, size=max(16, int(rate * duration))))
+            chunks.append(chunk)
+            last = chunk[-1]
+        times = np.concatenate(chunks)
+        return times[times < duration]
+    raise ValueError(f"Unknown arrival process: {arrival}")
+
 class Benchmarker:
     def __init__(self, base_url: str):
         self.base_url = base_url
 
-    async def run_inference(self, model_name: str, input_text: str) -> Dict:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{self.base_url}/inference", json={"model_name": model_name, "input_text": input_text}) as response:
-                return await response.json()
+    async def run_inference(self, model_name: str, input_text: str, session: Optional[aiohttp.ClientSession] = None) -> Dict:
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                return await self.run_inference(model_name, input_text, session)
+        async with session.post(f"{self.base_url}/inference", json={"model_name": model_name, "input_text": input_text}) as response:
+            return await response.json()
 
     async def run_benchmark(self, model_name: str, input_texts: List[str], num_iterations: int = 100, concurrency: int = 10):
         latencies = []
         throughputs = []
 
-        async def worker(input_text: str):
-            start_time = time.time()
-            await self.run_inference(model_name, input_text)
-            end_time = time.time()
-            return end_time - start_time
+        async with aiohttp.ClientSession() as session:
+            async def worker(input_text: str):
+                start_time = time.perf_counter()
+                await self.run_inference(model_name, input_text, session)
+                end_time = time.perf_counter()
+                return end_time - start_time
 
-        for _ in tqdm(range(num_iterations)):
-            start_time = time.time()
-            tasks = [worker(text) for text in input_texts[:concurrency]]
-            batch_latencies = await asyncio.gather(*tasks)
-            end_time = time.time()
+            for _ in tqdm(range(num_iterations)):
+                start_time = time.perf_counter()
+                tasks = [worker(text) for text in input_texts[:concurrency]]
+                batch_latencies = await asyncio.gather(*tasks)
+                end_time = time.perf_counter()
 
-            latencies.extend(batch_latencies)
-            throughput = len(batch_latencies) / (end_time - start_time)
-            throughputs.append(throughput)
+                latencies.extend(batch_latencies)
+                throughput = len(batch_latencies) / (end_time - start_time)
+                throughputs.append(throughput)
 
         return {
             "average_latency": np.mean(latencies),
@@ -43,6 +114,91 @@ class Benchmarker:
             "max_throughput": np.max(throughputs),
         }
 
+    async def run_open_loop(self, model_name: str, input_texts: List[str], rate: float, duration: float = 30.0,
+                            arrival: str = "poisson", seed: Optional[int] = None, timeout: float = 60.0) -> Dict:
+        schedule = arrival_times(rate, duration, arrival, seed)
+        histogram = LatencyHistogram()
+        errors = 0
+
+        async def timed_request(session: aiohttp.ClientSession, input_text: str, intended_start: float):
+            nonlocal errors
+            try:
+                async with session.post(f"{self.base_url}/inference",
+                                        json={"model_name": model_name, "input_text": input_text}) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+                return
+            # Latency counts from when the request was due, not when it went out, so a
+            # lagging generator or a saturated server cannot hide queueing delay.
+            histogram.record(time.perf_counter() - intended_start)
+
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            tasks = []
+            start_time = time.perf_counter()
+            for i, offset in enumerate(schedule):
+                intended_start = start_time + offset
+                delay = intended_start - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                input_text = input_texts[i % len(input_texts)]
+                tasks.append(asyncio.create_task(timed_request(session, input_text, intended_start)))
+            # Requests still open when the schedule ends: a server that keeps up only has the
+            # last few in flight, a saturated one has a queue that grew for the whole run.
+            delay = start_time + duration - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            backlog = sum(1 for task in tasks if not task.done())
+            completed_on_schedule = histogram.count
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start_time
+
+        results = {
+            "target_rate": rate,
+            "arrival": arrival,
+            "requests_sent": len(schedule),
+            "requests_completed": histogram.count,
+            "errors": errors,
+            # What the schedule actually offered; Poisson arrivals rarely hit the nominal rate exactly.
+            "offered_rate": len(schedule) / duration,
+            "backlog": backlog,
+            "completed_on_schedule": completed_on_schedule,
+            "achieved_throughput": histogram.count / elapsed if elapsed > 0 else 0.0,
+        }
+        results.update(histogram.summary())
+        return results
+
+    async def sweep_rates(self, model_name: str, input_texts: List[str], rates: List[float], duration: float = 30.0,
+                          arrival: str = "poisson", latency_slo: Optional[float] = None,
+                          min_efficiency: float = 0.95, max_error_rate: float = 0.01,
+                          seed: Optional[int] = None) -> Dict:
+        runs = []
+        saturation_rate = None
+        for rate in sorted(rates):
+            result = await self.run_open_loop(model_name, input_texts, rate, duration, arrival, seed)
+            runs.append(result)
+            sent = max(result["requests_sent"], 1)
+            # Judged against the requests actually sent, and only on what finished within the
+            # schedule, so neither a short Poisson draw nor the final drain reads as saturation.
+            saturated = (
+                result["completed_on_schedule"] < min_efficiency * result["requests_sent"]
+                or result["errors"] / sent > max_error_rate
+                or (latency_slo is not None and result["p99_latency"] > latency_slo)
+            )
+            if saturated:
+                saturation_rate = rate
+                break
+        sustained = runs[:-1] if saturation_rate is not None else runs
+        return {
+            "runs": runs,
+            "saturation_rate": saturation_rate,
+            "max_sustainable_rate": sustained[-1]["target_rate"] if sustained else None,
+        }
+
 async def main():
     benchmarker = Benchmarker("http://localhost:8000")
     model_name = "gpt2"
@@ -59,4 +215,4 @@ async def main():
         print(f"{key}: {value}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Union
+
+# Offline jobs send large numbers of inputs for one model in a single request. Inputs go to the
+# batcher in groups of the model's batch size, and results come back as they finish. At most
+# max_in_flight inputs are read but not yet written back; past that, reading stops and the
+# client's upload is held back by TCP flow control.
+
+def _parse_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        # Reported at the line's index instead of failing the whole job.
+        return e
+
+def _input_text(item: Any) -> str:
+    if isinstance(item, Exception):
+        raise ValueError(f"Invalid JSON: {item}")
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict) and isinstance(item.get("input_text"), str):
+        return item["input_text"]
+    raise ValueError("Each input must be a string or an object with an input_text string")
+
+async def read_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[Any]]:
+    # Yields the inputs on each chunk's complete lines as soon as the chunk arrives.
+    buffer = b""
+    async for data in chunks:
+        buffer += data
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        items = [_parse_line(line) for line in lines if line.strip()]
+        if items:
+            yield items
+    if buffer.strip():
+        yield [_parse_line(buffer)]
+
+def parse_json_inputs(body: bytes) -> List[Any]:
+    # A JSON array of inputs, or an object with an "inputs" array.
+    inputs = json.loads(body)
+    if isinstance(inputs, dict):
+        inputs = inputs.get("inputs")
+    if not isinstance(inputs, list):
+        raise ValueError("Expected a JSON array of inputs or an object with an inputs array")
+    return inputs
+
+async def _once(inputs: List[Any]) -> AsyncIterator[List[Any]]:
+    yield inputs
+
+async def run_bulk(batcher, tokenizer_registry, model_name: str, inputs: Union[List[Any], AsyncIterator[List[Any]]],
+                   priority: str = "bulk", max_in_flight: int = 1024, monitoring=None) -> AsyncIterator[Dict[str, Any]]:
+    # Yields {"index": i, "result": ...} or {"index": i, "error": "..."} for each input in the
+    # order results complete, then {"error": "..."} if reading the inputs failed part way.
+    if isinstance(inputs, list):
+        inputs = _once(inputs)
+    loop = asyncio.get_running_loop()
+    group_size = batcher.batch_limits(model_name)[0]
+    window = asyncio.Semaphore(max(max_in_flight, group_size))
+    completions: asyncio.Queue = asyncio.Queue()
+    pending = set()
+    read_errors = []
+
+    def complete(index: int, future: asyncio.Future):
+        pending.discard(future)
+        completions.put_nowait((index, future))
+
+    def fail(index: int, error: Exception):
+        future = loop.create_future()
+        future.set_exception(error)
+        completions.put_nowait((index, future))
+
+    async def submit(indices: List[int], texts: List[str]):
+        tokenized = await tokenizer_registry.tokenize_batch(model_name, texts)
+        # Waits while the queue is over its bulk share, so interactive traffic goes first.
+        futures = await batcher.submit_batch(model_name, tokenized, priority)
+        if monitoring is not None:
+            for _ in futures:
+                monitoring.record_inference_request()
+        for index, future in zip(indices, futures):
+            pending.add(future)
+            future.add_done_callback(lambda future, index=index: complete(index, future))
+
+    async def read():
+        index = 0
+        try:
+            async for items in inputs:
+                for start in range(0, len(items), group_size):
+                    indices, texts = [], []
+                    for item in items[start:start + group_size]:
+                        await window.acquire()
+                        try:
+                            texts.append(_input_text(item))
+                            indices.append(index)
+                        except ValueError as e:
+                            fail(index, e)
+                        index += 1
+                    if texts:
+                        try:
+                            await submit(indices, texts)
+                        except Exception as e:
+                            for failed_index in indices:
+                                fail(failed_index, e)
+        except Exception as e:
+            read_errors.append(e)
+        finally:
+            completions.put_nowait(None)
+
+    reader = asyncio.ensure_future(read())
+    done_reading = False
+    try:
+        while not (done_reading and completions.empty() and not pending):
+            completion = await completions.get()
+            if completion is None:
+                done_reading = True
+                continue
+            index, future = completion
+            error = asyncio.CancelledError("cancelled") if future.cancelled() else future.exception()
+            if error is not None:
+                yield {"index": index, "error": str(error)}
+            else:
+                yield {"index": index, "result": future.result()}
+            # Released only once the result is handed on, so a slow reader slows the intake.
+            window.release()
+        for error in read_errors:
+            yield {"error": str(error)}
+    finally:
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        if pending:
+            for future in list(pending):
+                future.cancel()
+            batcher.discard_cancelled(model_name)
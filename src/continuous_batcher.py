@@ -0,0 +1,233 @@
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Sequence, Tuple
+
+_DONE = object()
+
+class GenerationSequence:
+    def __init__(self, input_ids: Sequence[int], max_new_tokens: int, eos_token_id: Optional[int] = None):
+        self.input_ids = [int(token_id) for token_id in input_ids]
+        self.generated: List[int] = []
+        self.max_new_tokens = max_new_tokens
+        self.eos_token_id = eos_token_id
+        self.cancelled = False
+        # Backend-owned per-sequence data, such as a KV cache; released when the sequence leaves.
+        self.state: Any = None
+        self.tokens: asyncio.Queue = asyncio.Queue()
+
+    @property
+    def token_ids(self) -> List[int]:
+        return self.input_ids + self.generated
+
+    def finished(self) -> bool:
+        if self.cancelled or len(self.generated) >= self.max_new_tokens:
+            return True
+        return self.eos_token_id is not None and bool(self.generated) and self.generated[-1] == self.eos_token_id
+
+class StepBackend:
+    # A model that advances a batch of sequences by one decode step. The batch can change
+    # between calls: sequences join with no generated tokens (prefill) and leave once finished.
+    async def step(self, model_name: str, sequences: List[GenerationSequence]) -> List[int]:
+        raise NotImplementedError
+
+    def release(self, model_name: str, sequence: GenerationSequence):
+        pass
+
+    def close(self):
+        pass
+
+class ContinuousBatcher:
+    # Iteration-level scheduler: instead of holding a batch until its longest request is done,
+    # waiting requests join the running batch and finished ones leave it after every step.
+    def __init__(self, backend: StepBackend, max_batch_size: int = 32, max_new_tokens: int = 64,
+                 model_limits: Optional[Dict[str, Dict[str, Any]]] = None, monitoring=None):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens
+        self.model_limits = model_limits or {}
+        self.monitoring = monitoring
+        self.waiting: Dict[str, Deque[GenerationSequence]] = collections.defaultdict(collections.deque)
+        self.running: Dict[str, List[GenerationSequence]] = collections.defaultdict(list)
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def generate(self, model_name: str, input_ids: Sequence[int], max_new_tokens: Optional[int] = None,
+                       eos_token_id: Optional[int] = None) -> AsyncIterator[int]:
+        sequence = GenerationSequence(input_ids, max_new_tokens or self.max_new_tokens, eos_token_id)
+        self.waiting[model_name].append(sequence)
+        self._ensure_running(model_name)
+        try:
+            while True:
+                token = await sequence.tokens.get()
+                if token is _DONE:
+                    return
+                if isinstance(token, BaseException):
+                    raise token
+                yield token
+        finally:
+            # A consumer that stops early (e.g. a disconnected client) leaves at the next step.
+            sequence.cancelled = True
+
+    async def complete(self, model_name: str, input_ids: Sequence[int], max_new_tokens: Optional[int] = None,
+                       eos_token_id: Optional[int] = None) -> List[int]:
+        return [token async for token in self.generate(model_name, input_ids, max_new_tokens, eos_token_id)]
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for model_name in set(self.waiting) | set(self.running):
+            for sequence in list(self.waiting[model_name]) + self.running[model_name]:
+                self._finish(model_name, sequence, asyncio.CancelledError())
+        self.waiting.clear()
+        self.running.clear()
+
+    def _ensure_running(self, model_name: str):
+        task = self._tasks.get(model_name)
+        if task is None or task.done():
+            self._tasks[model_name] = asyncio.get_running_loop().create_task(self._run(model_name))
+
+    def _finish(self, model_name: str, sequence: GenerationSequence, outcome: Any = _DONE):
+        sequence.tokens.put_nowait(outcome)
+        self.backend.release(model_name, sequence)
+
+    async def _run(self, model_name: str):
+        max_batch_size = self.model_limits.get(model_name, {}).get("max_batch_size", self.max_batch_size)
+        waiting = self.waiting[model_name]
+        running = self.running[model_name]
+        try:
+            while waiting or running:
+                while waiting and len(running) < max_batch_size:
+                    sequence = waiting.popleft()
+                    if not sequence.cancelled:
+                        running.append(sequence)
+                if not running:
+                    continue
+                if self.monitoring is not None:
+                    self.monitoring.update_batch_size(len(running), model_name)
+                try:
+                    next_tokens = await self.backend.step(model_name, running)
+                    if len(next_tokens) != len(running):
+                        raise RuntimeError(f"Backend returned {len(next_tokens)} tokens for {len(running)} sequences")
+                except Exception as e:
+                    for sequence in running:
+                        self._finish(model_name, sequence, e)
+                    running.clear()
+                    continue
+                for sequence, token in zip(running, next_tokens):
+                    if not sequence.cancelled:
+                        sequence.generated.append(int(token))
+                        sequence.tokens.put_nowait(int(token))
+                still_running = []
+                for sequence in running:
+                    if sequence.finished():
+                        self._finish(model_name, sequence)
+                    else:
+                        still_running.append(sequence)
+                running[:] = still_running
+        finally:
+            if self._tasks.get(model_name) is asyncio.current_task():
+                del self._tasks[model_name]
+
+def _cache_layers(past_key_values) -> List[Tuple[Any, Any]]:
+    # (key, value) per layer, from either a Cache object or the legacy tuple format.
+    if hasattr(past_key_values, "layers"):
+        return [(layer.keys, layer.values) for layer in past_key_values.layers]
+    return [(key, value) for key, value in past_key_values]
+
+def _make_cache(layers: List[Tuple[Any, Any]]):
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        return tuple(layers)
+    return DynamicCache(layers)
+
+class TransformersStepBackend(StepBackend):
+    # Greedy decoding with a local Hugging Face causal LM. A joining sequence is prefilled
+    # once and keeps its own KV cache in `state`; each step then feeds one new token per
+    # sequence over the per-sequence caches, left-padded into one batch. Keeping the caches
+    # per sequence lets any of them join or leave between steps.
+    def __init__(self, model_config: Optional[Dict[str, Dict[str, Any]]] = None, device: str = "cpu",
+                 models: Optional[Dict[str, Any]] = None):
+        self.model_config = model_config or {}
+        self.device = device
+        self._models: Dict[str, Any] = dict(models or {})
+        # One thread keeps torch from oversubscribing cores across concurrent steps.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decode")
+
+    def _load(self, model_name: str):
+        model = self._models.get(model_name)
+        if model is None:
+            from transformers import AutoModelForCausalLM
+
+            model_path = self.model_config.get(model_name, {}).get("model_path", model_name)
+            model = AutoModelForCausalLM.from_pretrained(model_path).to(self.device).eval()
+            self._models[model_name] = model
+        return model
+
+    def _prefill(self, model, sequence: GenerationSequence) -> int:
+        import torch
+
+        input_ids = torch.tensor([sequence.token_ids], dtype=torch.long, device=self.device)
+        output = model(input_ids=input_ids, use_cache=True)
+        sequence.state = _cache_layers(output.past_key_values)
+        return int(output.logits[0, -1, :].argmax())
+
+    def _decode(self, model, sequences: List[GenerationSequence]) -> List[int]:
+        import torch
+
+        # Each cache holds every token but the last generated one, which is this step's input.
+        lengths = [len(sequence.token_ids) - 1 for sequence in sequences]
+        max_length = max(lengths)
+        layers = []
+        for layer in range(len(sequences[0].state)):
+            keys, values = [], []
+            for sequence, length in zip(sequences, lengths):
+                key, value = sequence.state[layer]
+                padding = (0, 0, max_length - length, 0)
+                keys.append(torch.nn.functional.pad(key, padding))
+                values.append(torch.nn.functional.pad(value, padding))
+            layers.append((torch.cat(keys), torch.cat(values)))
+        attention_mask = torch.zeros((len(sequences), max_length + 1), dtype=torch.long)
+        for row, length in enumerate(lengths):
+            attention_mask[row, max_length - length:] = 1
+        output = model(
+            input_ids=torch.tensor([[sequence.token_ids[-1]] for sequence in sequences], dtype=torch.long, device=self.device),
+            attention_mask=attention_mask.to(self.device),
+            position_ids=torch.tensor([[length] for length in lengths], dtype=torch.long, device=self.device),
+            past_key_values=_make_cache(layers),
+            use_cache=True,
+        )
+        merged = _cache_layers(output.past_key_values)
+        for row, (sequence, length) in enumerate(zip(sequences, lengths)):
+            start = max_length - length
+            sequence.state = [(key[row:row + 1, :, start:], value[row:row + 1, :, start:]) for key, value in merged]
+        return output.logits[:, -1, :].argmax(dim=-1).tolist()
+
+    def _step(self, model_name: str, sequences: List[GenerationSequence]) -> List[int]:
+        import torch
+
+        model = self._load(model_name)
+        next_tokens: Dict[int, int] = {}
+        with torch.no_grad():
+            decoding = []
+            for row, sequence in enumerate(sequences):
+                if sequence.state is None:
+                    next_tokens[row] = self._prefill(model, sequence)
+                else:
+                    decoding.append(row)
+            if decoding:
+                tokens = self._decode(model, [sequences[row] for row in decoding])
+                next_tokens.update(zip(decoding, tokens))
+        return [next_tokens[row] for row in range(len(sequences))]
+
+    async def step(self, model_name: str, sequences: List[GenerationSequence]) -> List[int]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._step, model_name, list(sequences))
+
+    def release(self, model_name: str, sequence: GenerationSequence):
+        sequence.state = None
+
+    def close(self):
+        self._executor.shutdown(wait=False)
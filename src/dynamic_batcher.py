@@ -1,41 +1,396 @@
 import asyncio
-from typing import List, Dict, Any
+import bisect
+import contextvars
+from contextlib import nullcontext
+from typing import List, Dict, Any, Callable, Awaitable, Optional, Tuple
 import numpy as np
 
+BatchHandler = Callable[[str, List[Dict[str, Any]]], Awaitable[List[Any]]]
+
+# Lower rank is served first; bulk traffic is also shed before interactive traffic.
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+class QueueFullError(Exception):
+    def __init__(self, model_name: str, reason: str, retry_after: float):
+        super().__init__(f"Rejected request for {model_name}: {reason}")
+        self.model_name = model_name
+        self.retry_after = retry_after
+
+class DeadlineExceededError(Exception):
+    def __init__(self, model_name: str, reason: str = "deadline expired"):
+        super().__init__(f"Request for {model_name}: {reason}")
+        self.model_name = model_name
+
+class PendingRequest:
+    def __init__(self, payload: Dict[str, Any], future: asyncio.Future, enqueued_at: float, trace: Any = None,
+                 priority: str = "interactive", deadline: Optional[float] = None):
+        self.payload = payload
+        self.future = future
+        self.enqueued_at = enqueued_at
+        self.trace = trace
+        self.priority = priority
+        self.rank = PRIORITIES[priority]
+        self.deadline = deadline
+
+    def expire(self, model_name: str):
+        if not self.future.done():
+            self.future.set_exception(DeadlineExceededError(model_name))
+
+def _rank_index(requests: List[PendingRequest], rank: int, after: bool = False) -> int:
+    # Binary search over a rank-ordered queue: the index of the first request of `rank`, or with
+    # `after`, the index just past the last one. bisect's key= argument needs Python 3.10.
+    low, high = 0, len(requests)
+    while low < high:
+        middle = (low + high) // 2
+        if requests[middle].rank < rank or (after and requests[middle].rank == rank):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+class BatchQueue:
+    def __init__(self, model_name: str, max_batch_size: int, max_latency: float, bucket: Optional[int] = None):
+        self.model_name = model_name
+        self.bucket = bucket
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.current_batch: List[PendingRequest] = []
+
+    def add(self, pending: PendingRequest):
+        # Keep the queue ordered by priority, first-come first-served within a class.
+        if not self.current_batch or self.current_batch[-1].rank <= pending.rank:
+            self.current_batch.append(pending)
+        else:
+            self.current_batch.insert(_rank_index(self.current_batch, pending.rank, after=True), pending)
+
+    def flush_deadline(self) -> Optional[float]:
+        if not self.current_batch:
+            return None
+        # Higher-priority arrivals jump ahead, so the oldest request is the head of one of
+        # the priority classes rather than necessarily the head of the queue.
+        oldest = self.current_batch[0].enqueued_at
+        if self.current_batch[-1].rank != self.current_batch[0].rank:
+            for rank in range(self.current_batch[0].rank + 1, self.current_batch[-1].rank + 1):
+                index = _rank_index(self.current_batch, rank)
+                oldest = min(oldest, self.current_batch[index].enqueued_at)
+        return oldest + self.max_latency
+
+    def is_ready(self, now: float) -> bool:
+        if len(self.current_batch) >= self.max_batch_size:
+            return True
+        deadline = self.flush_deadline()
+        return deadline is not None and now >= deadline
+
+    def take_batch(self, now: Optional[float] = None) -> List[PendingRequest]:
+        batch = self.current_batch[:self.max_batch_size]
+        self.current_batch = self.current_batch[self.max_batch_size:]
+        if now is not None:
+            for pending in batch:
+                if pending.deadline is not None and pending.deadline <= now:
+                    pending.expire(self.model_name)
+        # Callers that were cancelled or expired while queued no longer need a slot.
+        return [pending for pending in batch if not pending.future.done()]
+
 class DynamicBatcher:
-    def __init__(self, max_batch_size: int, max_latency: float):
+    def __init__(self, max_batch_size: int, max_latency: float, batch_handler: BatchHandler,
+                 model_limits: Optional[Dict[str, Dict[str, Any]]] = None, max_concurrent_batches: int = 4,
+                 length_buckets: Optional[List[int]] = None, tracer=None, max_queue_depth: Optional[int] = None,
+                 queue_wait_slo: Optional[float] = None, bulk_share: float = 0.5, controller=None):
         self.max_batch_size = max_batch_size
         self.max_latency = max_latency
-        self.current_batch: List[Dict[str, Any]] = []
+        self.batch_handler = batch_handler
+        self.model_limits = model_limits or {}
+        self.length_buckets = sorted(length_buckets) if length_buckets else []
+        self.tracer = tracer
+        self.max_queue_depth = max_queue_depth
+        self.queue_wait_slo = queue_wait_slo
+        self.bulk_share = bulk_share
+        self.max_concurrent_batches = max_concurrent_batches
+        self.controller = controller
+        self._batch_latency: Dict[str, float] = {}
+        self.queues: Dict[Tuple[str, Optional[int]], BatchQueue] = {}
         self.event = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_concurrent_batches)
+        self._next_queue = 0
+        self._dispatch_task: Optional[asyncio.Task] = None
+        self._batch_tasks = set()
 
-    async def add_request(self, request: Dict[str, Any]) -> List[Dict[str, Any]]:
-        self.current_batch.append(request)
-        if len(self.current_batch) >= self.max_batch_size:
-            return await self._process_batch()
-        elif len(self.current_batch) == 1:
-            asyncio.create_task(self._wait_for_batch())
+    def get_queue(self, model_name: str, bucket: Optional[int] = None) -> BatchQueue:
+        queue = self.queues.get((model_name, bucket))
+        if queue is None:
+            queue = BatchQueue(model_name, *self.batch_limits(model_name), bucket)
+            self.queues[(model_name, bucket)] = queue
+        return queue
+
+    def batch_limits(self, model_name: str) -> Tuple[int, float]:
+        # The adaptive controller's current choice, within the configured limits.
+        if self.controller is not None:
+            limits = self.controller.limits(model_name)
+            if limits is not None:
+                return limits
+        return self._limit(model_name, "max_batch_size"), self._limit(model_name, "max_latency")
+
+    def _limit(self, model_name: str, key: str) -> Any:
+        return self.model_limits.get(model_name, {}).get(key, getattr(self, key))
+
+    def bucket_for(self, model_name: str, request: Dict[str, Any]) -> Optional[int]:
+        buckets = self.model_limits.get(model_name, {}).get("length_buckets", self.length_buckets)
+        if not buckets or "input_ids" not in request:
+            return None
+        # Requests longer than the largest bucket share an unbounded overflow bucket.
+        index = bisect.bisect_left(buckets, np.size(request["input_ids"]))
+        return buckets[index] if index < len(buckets) else None
+
+    def queue_depth(self, model_name: Optional[str] = None) -> int:
+        return sum(
+            len(queue.current_batch) for queue in self.queues.values()
+            if model_name is None or queue.model_name == model_name
+        )
+
+    def estimated_queue_wait(self, model_name: str) -> float:
+        # Batches already queued ahead, each taking the recent average batch latency,
+        # spread over the dispatch slots.
+        batch_latency = self._batch_latency.get(model_name)
+        if batch_latency is None:
+            return 0.0
+        batches_ahead = -(-self.queue_depth(model_name) // self.batch_limits(model_name)[0])
+        return batches_ahead * batch_latency / self.max_concurrent_batches
+
+    def check_admission(self, model_name: str, priority: str = "interactive"):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        limits = self.model_limits.get(model_name, {})
+        max_depth = limits.get("max_queue_depth", self.max_queue_depth)
+        slo = limits.get("queue_wait_slo", self.queue_wait_slo)
+        if max_depth is None and slo is None:
+            return
+        # Bulk requests only get a share of the queue, so they are shed first.
+        share = 1.0 if PRIORITIES[priority] == 0 else self.bulk_share
+        estimated_wait = self.estimated_queue_wait(model_name)
+        retry_after = max(estimated_wait, limits.get("max_latency", self.max_latency))
+        if max_depth is not None and self.queue_depth(model_name) >= max_depth * share:
+            raise QueueFullError(model_name, f"{priority} queue is full", retry_after)
+        if slo is not None and estimated_wait > slo * share:
+            raise QueueFullError(
+                model_name, f"estimated queue wait {estimated_wait:.3f}s exceeds {slo * share:.3f}s", retry_after
+            )
+
+    def check_deadline(self, model_name: str, deadline: Optional[float]):
+        # Fails fast when the request could not be answered before its deadline.
+        if deadline is None:
+            return
+        now = asyncio.get_running_loop().time()
+        if deadline <= now:
+            raise DeadlineExceededError(model_name, "deadline expired before enqueue")
+        if self.estimated_queue_wait(model_name) > deadline - now:
+            raise DeadlineExceededError(model_name, "deadline is shorter than the estimated queue wait")
+
+    async def add_request(self, model_name: str, request: Dict[str, Any], priority: str = "interactive",
+                          deadline: Optional[float] = None) -> Any:
+        # deadline is an absolute time on the event loop clock (loop.time()).
+        self.check_admission(model_name, priority)
+        if self.controller is not None:
+            self.controller.observe_arrival(model_name)
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self.check_deadline(model_name, deadline)
+        queue = self.get_queue(model_name, self.bucket_for(model_name, request))
+        trace = self.tracer.current() if self.tracer is not None else None
+        pending = PendingRequest(request, loop.create_future(), now, trace, priority, deadline)
+        queue.add(pending)
         self.event.set()
-        return []
-
-    async def _wait_for_batch(self):
-        await asyncio.sleep(self.max_latency)
-        if self.current_batch:
-            await self._process_batch()
-
-    async def _process_batch(self) -> List[Dict[str, Any]]:
-        batch_to_process = self.current_batch
-        self.current_batch = []
-        self.event.clear()
-        return batch_to_process
-
-async def batch_inference(nim_client, model_name: str, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    combined_input = {
-        "input_ids": np.concatenate([item["input_ids"] for item in batch]),
-        "attention_mask": np.concatenate([item["attention_mask"] for item in batch])
-    }
-    
-    result = await nim_client.inference(model_name, combined_input)
-    
-    split_results = np.array_split(result["logits"], len(batch))
-    return [{"logits": r} for r in split_results]
\ No newline at end of file
+        timer = loop.call_at(deadline, pending.expire, model_name) if deadline is not None else None
+        try:
+            return await pending.future
+        except (asyncio.CancelledError, DeadlineExceededError):
+            # Give up the place in the queue so no GPU time is spent on an answer nobody will read.
+            if pending in queue.current_batch:
+                queue.current_batch.remove(pending)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    async def submit_batch(self, model_name: str, requests: List[Dict[str, Any]],
+                           priority: str = "bulk") -> List[asyncio.Future]:
+        # Enqueues many requests at once for bulk jobs: one admission check and one wake-up of
+        # the dispatcher, and a queue that fills past max_batch_size dispatches full batches
+        # right away. Where add_request would be rejected, this waits for room instead.
+        # Returns one future per request; cancel them with discard_cancelled.
+        while True:
+            try:
+                self.check_admission(model_name, priority)
+                break
+            except QueueFullError as e:
+                await asyncio.sleep(e.retry_after)
+        if self.controller is not None:
+            for _ in requests:
+                self.controller.observe_arrival(model_name)
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        futures = []
+        for request in requests:
+            pending = PendingRequest(request, loop.create_future(), now, None, priority)
+            self.get_queue(model_name, self.bucket_for(model_name, request)).add(pending)
+            futures.append(pending.future)
+        self.event.set()
+        return futures
+
+    def discard_cancelled(self, model_name: str):
+        # Drops queued requests whose futures were cancelled, so they stop counting towards
+        # queue depth and admission before their batch would have been dispatched.
+        for queue in self.queues.values():
+            if queue.model_name == model_name:
+                queue.current_batch = [pending for pending in queue.current_batch if not pending.future.done()]
+
+    def start(self):
+        self._ensure_started()
+
+    async def stop(self):
+        if self._dispatch_task is not None:
+            self._dispatch_task.cancel()
+            try:
+                await self._dispatch_task
+            except asyncio.CancelledError:
+                pass
+            self._dispatch_task = None
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        for queue in self.queues.values():
+            for pending in queue.current_batch:
+                if not pending.future.done():
+                    pending.future.cancel()
+            queue.current_batch = []
+
+    def _ensure_started(self):
+        if self._dispatch_task is None or self._dispatch_task.done():
+            # Start from an empty context so the loop does not inherit the first caller's trace.
+            loop = asyncio.get_running_loop()
+            self._dispatch_task = contextvars.Context().run(loop.create_task, self._dispatch_loop())
+
+    async def _dispatch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            try:
+                queue = await self._wait_for_ready_queue(loop)
+            except BaseException:
+                self._slots.release()
+                raise
+            batch = queue.take_batch(loop.time())
+            if not batch:
+                self._slots.release()
+                continue
+            task = loop.create_task(self._process_batch(queue.model_name, batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._on_batch_done)
+
+    def _on_batch_done(self, task: asyncio.Task):
+        self._batch_tasks.discard(task)
+        self._slots.release()
+
+    async def _wait_for_ready_queue(self, loop: asyncio.AbstractEventLoop) -> BatchQueue:
+        while True:
+            now = loop.time()
+            queue = self._next_ready_queue(now)
+            if queue is not None:
+                return queue
+            deadlines = [d for d in (q.flush_deadline() for q in self.queues.values()) if d is not None]
+            self.event.clear()
+            if not deadlines:
+                await self.event.wait()
+                continue
+            # Wake up at the earliest flush deadline. A timer is used rather than
+            # wait_for, which can swallow a cancellation that races with the event.
+            timer = loop.call_at(min(deadlines), self.event.set)
+            try:
+                await self.event.wait()
+            finally:
+                timer.cancel()
+
+    def _next_ready_queue(self, now: float) -> Optional[BatchQueue]:
+        # Round-robin over the queues so a busy model or bucket cannot starve the
+        # others of dispatch slots.
+        queues = list(self.queues.values())
+        for offset in range(len(queues)):
+            index = (self._next_queue + offset) % len(queues)
+            if queues[index].is_ready(now):
+                self._next_queue = index + 1
+                return queues[index]
+        return None
+
+    async def _process_batch(self, model_name: str, batch: List[PendingRequest]):
+        batch_trace = nullcontext()
+        if self.tracer is not None:
+            now = asyncio.get_running_loop().time()
+            for pending in batch:
+                self.tracer.record("queue_wait", now - pending.enqueued_at, trace=pending.trace, model_name=model_name)
+            batch_trace = self.tracer.batch(model_name, [pending.trace for pending in batch])
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        try:
+            with batch_trace:
+                results = await self.batch_handler(model_name, [pending.payload for pending in batch])
+            self._observe_batch_latency(model_name, loop.time() - start_time, batch)
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch handler returned {len(results)} results for {len(batch)} requests")
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+        for pending, result in zip(batch, results):
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    def _observe_batch_latency(self, model_name: str, latency: float, batch: List[PendingRequest], alpha: float = 0.2):
+        previous = self._batch_latency.get(model_name)
+        self._batch_latency[model_name] = latency if previous is None else previous + alpha * (latency - previous)
+        if self.controller is None:
+            return
+        now = asyncio.get_running_loop().time()
+        decision = self.controller.observe_batch(
+            model_name, len(batch), latency, [now - pending.enqueued_at for pending in batch], now,
+            self._limit(model_name, "max_batch_size"), self._limit(model_name, "max_latency"),
+        )
+        if decision is not None:
+            for queue in self.queues.values():
+                if queue.model_name == model_name:
+                    queue.max_batch_size, queue.max_latency = decision
+            # A smaller batch size or window may make a waiting queue ready right away.
+            self.event.set()
+
+def pad_batch(batch: List[Dict[str, Any]], pad_token_id: int = 0) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    input_ids = [np.ravel(item["input_ids"]) for item in batch]
+    lengths = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(batch))
+    max_length = int(lengths.max()) if len(batch) else 0
+
+    padded_ids = np.full((len(batch), max_length), pad_token_id, dtype=np.int64)
+    attention_mask = np.zeros((len(batch), max_length), dtype=np.int64)
+    for row, (ids, item) in enumerate(zip(input_ids, batch)):
+        length = lengths[row]
+        padded_ids[row, :length] = ids
+        attention_mask[row, :length] = np.ravel(item["attention_mask"]) if "attention_mask" in item else 1
+    return {"input_ids": padded_ids, "attention_mask": attention_mask}, lengths
+
+def unpad_output(output: Any, lengths: np.ndarray) -> List[np.ndarray]:
+    output = np.asarray(output)
+    if output.shape[0] != len(lengths):
+        raise ValueError(f"Expected {len(lengths)} rows in model output, got {output.shape[0]}")
+    if output.ndim < 3:
+        # One row per request (e.g. classification logits); nothing to strip.
+        return [output[row] for row in range(len(lengths))]
+    return [output[row, :length] for row, length in enumerate(lengths)]
+
+async def batch_inference(backend, model_name: str, batch: List[Dict[str, Any]], pad_token_id: int = 0,
+                          tracer=None) -> List[Dict[str, Any]]:
+    # backend is an InferenceBackend: the NIM client, a local onnxruntime backend or a router.
+    with tracer.span("batch_assembly") if tracer else nullcontext():
+        combined_input, lengths = pad_batch(batch, pad_token_id)
+
+    result = await backend.inference(model_name, combined_input)
+
+    with tracer.span("result_split") if tracer else nullcontext():
+        return [{"logits": r} for r in unpad_output(result["logits"], lengths)]
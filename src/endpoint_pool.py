@@ -0,0 +1,121 @@
+import collections
+import time
+from typing import Deque, List, Optional, Sequence, Union
+import numpy as np
+
+ROUTING_STRATEGIES = ("least_outstanding", "ewma")
+
+class Endpoint:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def __repr__(self):
+        return f"Endpoint({self.url!r}, outstanding={self.outstanding}, ewma_latency={self.ewma_latency})"
+
+class EndpointPool:
+    # The NIM replicas behind one client. Tracks requests in flight and an EWMA of latency per
+    # replica to route each call, ejects a replica for ejection_time after max_failures
+    # consecutive failures, and keeps a window of recent latencies that sets the hedging delay.
+    #
+    # least_outstanding sends each call to the replica with the fewest requests in flight, ties
+    # going to the lower EWMA latency; ewma weighs each replica's EWMA latency by its load.
+    def __init__(self, urls: Union[str, Sequence[str]], strategy: str = "least_outstanding",
+                 ewma_decay: float = 0.3, max_failures: int = 3, ejection_time: float = 30.0,
+                 hedge_percentile: float = 95.0, min_hedge_delay: float = 0.01, max_hedge_ratio: float = 0.1,
+                 latency_window: int = 200, monitoring=None):
+        if isinstance(urls, str):
+            urls = [urls]
+        if not urls:
+            raise ValueError("At least one NIM endpoint is required")
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.strategy = strategy
+        self.ewma_decay = ewma_decay
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.monitoring = monitoring
+        self.latencies: Deque[float] = collections.deque(maxlen=latency_window)
+        self._hedged: Deque[bool] = collections.deque(maxlen=latency_window)
+
+    def __iter__(self):
+        return iter(self.endpoints)
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def available(self, now: Optional[float] = None) -> List[Endpoint]:
+        now = time.monotonic() if now is None else now
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.ejected_until <= now]
+        # With every replica ejected, keep sending to all of them rather than failing every request.
+        return healthy or list(self.endpoints)
+
+    def _cost(self, endpoint: Endpoint) -> tuple:
+        # A replica without samples yet counts as fastest, so new replicas get measured.
+        latency = endpoint.ewma_latency or 0.0
+        if self.strategy == "ewma":
+            return (latency * (endpoint.outstanding + 1), endpoint.outstanding)
+        return (endpoint.outstanding, latency)
+
+    def pick(self, exclude: Sequence[Endpoint] = ()) -> Optional[Endpoint]:
+        candidates = [endpoint for endpoint in self.available() if endpoint not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=self._cost)
+
+    def _update_ewma(self, endpoint: Endpoint, latency: float):
+        if endpoint.ewma_latency is None:
+            endpoint.ewma_latency = latency
+        else:
+            endpoint.ewma_latency += self.ewma_decay * (latency - endpoint.ewma_latency)
+
+    def record_success(self, endpoint: Endpoint, latency: float):
+        endpoint.failures = 0
+        self._update_ewma(endpoint, latency)
+        self.latencies.append(latency)
+
+    def record_cancelled(self, endpoint: Endpoint, elapsed: float):
+        # A call abandoned for a faster hedge took at least this long; without this, a stalled
+        # replica whose calls always lose would keep its old, fast EWMA.
+        if endpoint.ewma_latency is None or elapsed > endpoint.ewma_latency:
+            self._update_ewma(endpoint, elapsed)
+
+    def record_failure(self, endpoint: Endpoint, now: Optional[float] = None):
+        endpoint.failures += 1
+        if endpoint.failures >= self.max_failures:
+            self.eject(endpoint, now)
+
+    def eject(self, endpoint: Endpoint, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        if endpoint.ejected_until <= now and self.monitoring is not None:
+            self.monitoring.record_endpoint_ejection(endpoint.url)
+        endpoint.ejected_until = now + self.ejection_time
+        endpoint.failures = 0
+
+    def reinstate(self, endpoint: Endpoint):
+        endpoint.ejected_until = 0.0
+        endpoint.failures = 0
+
+    def hedge_delay(self, min_samples: int = 20) -> Optional[float]:
+        # How long to wait on a call before sending a duplicate to another replica: the recent
+        # p95, so only the slowest few percent of calls are hedged. None until there is a baseline.
+        if len(self.latencies) < min_samples:
+            return None
+        return max(self.min_hedge_delay, float(np.percentile(self.latencies, self.hedge_percentile)))
+
+    def hedge_allowed(self) -> bool:
+        # Caps duplicates at max_hedge_ratio of recent calls, so a slowdown on every replica
+        # does not double the load on all of them.
+        return sum(self._hedged) < self.max_hedge_ratio * max(len(self._hedged), 1)
+
+    def record_request(self, hedged: bool):
+        self._hedged.append(hedged)
+        if hedged and self.monitoring is not None:
+            self.monitoring.record_hedged_request()
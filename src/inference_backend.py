@@ -0,0 +1,222 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+# onnxruntime is imported when the first local model loads, so NIM-only deployments never load it.
+
+_ONNX_DTYPES = {
+    "tensor(int64)": np.int64,
+    "tensor(int32)": np.int32,
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+    "tensor(double)": np.float64,
+    "tensor(bool)": np.bool_,
+}
+
+class InferenceBackend:
+    # Runs one padded batch: input_data maps input names (input_ids, attention_mask) to arrays of
+    # shape (batch, sequence) and the result maps output names (logits) to arrays. AsyncNIMClient
+    # implements the same interface against a remote NIM service.
+    async def inference(self, model_name: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class BackendRouter(InferenceBackend):
+    # Sends each model to the backend named by its `backend` setting in model_config.
+    def __init__(self, backends: Dict[str, InferenceBackend], model_backends: Optional[Dict[str, str]] = None,
+                 default: str = "nim"):
+        unknown = set((model_backends or {}).values()) - set(backends)
+        if unknown:
+            raise ValueError(f"Unknown inference backend(s): {', '.join(sorted(unknown))}")
+        self.backends = backends
+        self.model_backends = model_backends or {}
+        self.default = default
+
+    def backend_for(self, model_name: str) -> InferenceBackend:
+        return self.backends[self.model_backends.get(model_name, self.default)]
+
+    async def inference(self, model_name: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.backend_for(model_name).inference(model_name, input_data)
+
+    async def close(self):
+        for backend in self.backends.values():
+            await backend.close()
+
+class PooledSession:
+    # One InferenceSession with its IO binding and reusable input staging buffers. A session
+    # is used by one thread at a time, so the buffers need no locking.
+    def __init__(self, session):
+        self.session = session
+        self.binding = session.io_binding()
+        self.inputs = [(arg.name, _ONNX_DTYPES.get(arg.type, np.float32)) for arg in session.get_inputs()]
+        self.outputs = [(arg.name, arg.shape, _ONNX_DTYPES.get(arg.type, np.float32)) for arg in session.get_outputs()]
+        self._buffers: Dict[str, np.ndarray] = {}
+
+    def _staged(self, name: str, dtype, shape, source: Optional[np.ndarray]) -> np.ndarray:
+        # Casts (or zero-fills) into a buffer that grows to the largest batch seen and is reused.
+        size = int(np.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = np.empty(size, dtype=dtype)
+            self._buffers[name] = buffer
+        view = buffer[:size].reshape(shape)
+        if source is None:
+            view.fill(0)
+        else:
+            np.copyto(view, source, casting="unsafe")
+        return view
+
+    def run(self, input_data: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        input_ids = np.asarray(input_data["input_ids"])
+        batch_size, sequence_length = input_ids.shape[:2]
+        binding = self.binding
+        binding.clear_binding_inputs()
+        binding.clear_binding_outputs()
+        for name, dtype in self.inputs:
+            value = input_data.get(name)
+            if value is not None and np.asarray(value).dtype == dtype:
+                # Already the right type: bound without a copy.
+                binding.bind_cpu_input(name, np.ascontiguousarray(value))
+            else:
+                # A wrong dtype, or an input the batch does not carry (e.g. BERT's token_type_ids).
+                binding.bind_cpu_input(name, self._staged(name, dtype, input_ids.shape,
+                                                          None if value is None else np.asarray(value)))
+
+        results: Dict[str, np.ndarray] = {}
+        for name, dims, dtype in self.outputs:
+            shape = _output_shape(dims, batch_size, sequence_length)
+            if shape is None:
+                binding.bind_output(name, "cpu")
+                continue
+            # Outputs are handed to the caller, so each run gets fresh arrays that onnxruntime
+            # writes into directly instead of allocating its own and copying them out.
+            results[name] = np.empty(shape, dtype=dtype)
+            binding.bind_output(name, "cpu", 0, dtype, list(shape), results[name].ctypes.data)
+        self.session.run_with_iobinding(binding)
+        if len(results) < len(self.outputs):
+            for (name, _, _), value in zip(self.outputs, binding.copy_outputs_to_cpu()):
+                results.setdefault(name, value)
+        return results
+
+def _output_shape(dims: List[Any], batch_size: int, sequence_length: int) -> Optional[tuple]:
+    shape = []
+    for dim in dims:
+        if isinstance(dim, int):
+            shape.append(dim)
+        elif dim == "batch":
+            shape.append(batch_size)
+        elif dim == "sequence":
+            shape.append(sequence_length)
+        else:
+            # A dimension the exporter named differently; let onnxruntime size this output.
+            return None
+    return tuple(shape)
+
+class OnnxRuntimeBackend(InferenceBackend):
+    # In-process CPU inference with onnxruntime, for models small enough that the HTTP hop to
+    # NIM costs more than the compute. Each model gets a pool of sessions and its own executor
+    # with one thread per session, so pool_size batches of each model run in parallel with
+    # intra_op_threads threads each. Call prepare() at startup or deploy so that loading (and
+    # exporting, for a model without an onnx_path) is done before the first batch arrives.
+    def __init__(self, model_config: Optional[Dict[str, Dict[str, Any]]] = None, pool_size: int = 2,
+                 intra_op_threads: int = 1, inter_op_threads: int = 1,
+                 resolve_path: Optional[Callable[[str, str], str]] = None):
+        self.model_config = model_config or {}
+        self.pool_size = pool_size
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        # Maps (model_name, model_path) to an .onnx file when a model has no onnx_path, e.g. by
+        # exporting it through the artifact cache.
+        self.resolve_path = resolve_path
+        self._pools: Dict[str, "queue.SimpleQueue[PooledSession]"] = {}
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        # One lock per model, so a slow load or export only holds up batches of that model.
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def onnx_path(self, model_name: str, model_path: Optional[str] = None) -> str:
+        model_cfg = self.model_config.get(model_name, {})
+        if model_path is None and "onnx_path" in model_cfg:
+            return model_cfg["onnx_path"]
+        if self.resolve_path is None:
+            raise ValueError(f"No onnx_path configured for local model {model_name}")
+        return self.resolve_path(model_name, model_path or model_cfg.get("model_path", model_name))
+
+    def _create_session(self, onnx_path: str):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        return onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+    def _load_lock(self, model_name: str) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(model_name, threading.Lock())
+
+    def _executor(self, model_name: str) -> ThreadPoolExecutor:
+        with self._lock:
+            executor = self._executors.get(model_name)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix=f"onnxruntime-{model_name}")
+                self._executors[model_name] = executor
+            return executor
+
+    def load(self, model_name: str, model_path: Optional[str] = None) -> str:
+        # Builds a fresh session pool and swaps it in; batches already running keep the old one.
+        with self._load_lock(model_name):
+            onnx_path = self.onnx_path(model_name, model_path)
+            self._pools[model_name] = self._build_pool(onnx_path)
+        return onnx_path
+
+    def _build_pool(self, onnx_path: str) -> "queue.SimpleQueue[PooledSession]":
+        pool = queue.SimpleQueue()
+        for _ in range(self.pool_size):
+            pool.put(PooledSession(self._create_session(onnx_path)))
+        return pool
+
+    async def prepare(self, model_name: str, model_path: Optional[str] = None) -> str:
+        # Loads on the default executor rather than the model's own, which serves batches.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.load, model_name, model_path)
+
+    def _pool(self, model_name: str) -> "queue.SimpleQueue[PooledSession]":
+        pool = self._pools.get(model_name)
+        if pool is not None:
+            return pool
+        # Not prepared ahead of time: the first batch loads it.
+        with self._load_lock(model_name):
+            pool = self._pools.get(model_name)
+            if pool is None:
+                pool = self._build_pool(self.onnx_path(model_name))
+                self._pools[model_name] = pool
+        return pool
+
+    def _run(self, model_name: str, input_data: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        pool = self._pool(model_name)
+        session = pool.get()
+        try:
+            return session.run(input_data)
+        finally:
+            pool.put(session)
+
+    async def inference(self, model_name: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        # Runs off the event loop; onnxruntime releases the GIL while it computes.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(model_name), self._run, model_name, input_data)
+
+    def unload(self, model_name: str):
+        with self._load_lock(model_name):
+            self._pools.pop(model_name, None)
+
+    async def close(self):
+        with self._lock:
+            executors, self._executors = list(self._executors.values()), {}
+        for executor in executors:
+            executor.shutdown(wait=False)
+        self._pools.clear()
@@ -1,27 +1,217 @@
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
-from nim_client import NIMClient
+from nim_client import HEALTH_CHECK_PATH, AsyncNIMClient
+from artifact_cache import ArtifactCache
+from bulk_inference import parse_json_inputs, read_ndjson, run_bulk
+from endpoint_pool import EndpointPool
+from inference_backend import BackendRouter, OnnxRuntimeBackend
 from model_deployer import ModelDeployer
-from dynamic_batcher import DynamicBatcher, batch_inference
-from model_parallelism import ModelParallelNIMWrapper
+from tokenizer_registry import TokenizerRegistry
+from response_cache import ResponseCache
+from single_flight import SingleFlight
+from batch_controller import AdaptiveBatchController
+from continuous_batcher import ContinuousBatcher, TransformersStepBackend
+from dynamic_batcher import DynamicBatcher, DeadlineExceededError, QueueFullError, batch_inference
 from monitoring import Monitoring
-from auto_scaler import AutoScaler
+from tracing import Tracer
+import numpy as np
+from typing import Dict, Any, Literal, Optional
 import yaml
 import asyncio
+import json
+import math
+import socket
 import time
 import os
 
+# Heavy dependencies (torch, transformers, onnx, kubernetes) are imported where they are first
+# used, and everything that binds a port or talks to the cluster starts in the lifespan, so the
+# module imports quickly and outside a cluster.
+STARTED_AT = time.perf_counter()
+
 # Load configuration
-with open("config/config.yaml", "r") as f:
+with open(os.getenv("CONFIG_PATH", "config/config.yaml"), "r") as f:
     config = yaml.safe_load(f)
 
-nim_client = NIMClient(config["nim_base_url"])
-model_deployer = ModelDeployer(nim_client)
-dynamic_batcher = DynamicBatcher(config["max_batch_size"], config["max_latency"])
-monitoring = Monitoring()
-auto_scaler = AutoScaler()
+monitoring_config = config.get("monitoring", {})
+monitoring = Monitoring(monitoring_config.get("prometheus_port", 8000), monitoring_config.get("latency_buckets"))
+tracing_config = config.get("tracing", {})
+tracer = Tracer(monitoring, tracing_config.get("sample_rate", 0.0), tracing_config.get("trace_file"))
+
+artifact_config = config.get("artifact_cache", {})
+artifact_cache = None
+if artifact_config.get("enabled", True):
+    artifact_cache = ArtifactCache(
+        artifact_config.get("directory", "artifacts"),
+        max_bytes=artifact_config.get("max_bytes", 50 * 1024 ** 3),
+    )
+
+nim_client_config = config.get("nim_client", {})
+onnx_config = config.get("onnx", {})
+routing_config = nim_client_config.get("routing", {})
+nim_endpoints = EndpointPool(
+    config.get("nim_endpoints") or config["nim_base_url"],
+    strategy=routing_config.get("strategy", "least_outstanding"),
+    max_failures=routing_config.get("max_failures", 3),
+    ejection_time=routing_config.get("ejection_time", 30.0),
+    hedge_percentile=routing_config.get("hedge_percentile", 95.0),
+    min_hedge_delay=routing_config.get("min_hedge_delay", 0.01),
+    max_hedge_ratio=routing_config.get("max_hedge_ratio", 0.1),
+    monitoring=monitoring,
+)
+nim_client = AsyncNIMClient(
+    nim_endpoints,
+    pool_size=nim_client_config.get("pool_size", 100),
+    request_timeout=nim_client_config.get("request_timeout", 30.0),
+    keepalive_timeout=nim_client_config.get("keepalive_timeout", 30.0),
+    wire_format=nim_client_config.get("wire_format", "binary"),
+    tracer=tracer,
+    artifact_cache=artifact_cache,
+    optimization_level=onnx_config.get("optimization_level", "extended"),
+    quantize=onnx_config.get("quantize", False),
+    benchmark_onnx=onnx_config.get("benchmark", True),
+    hedge=routing_config.get("hedge", False),
+)
+tokenizer_config = config.get("tokenizers", {})
+tokenizer_registry = TokenizerRegistry(
+    config.get("model_config", {}),
+    max_loaded=tokenizer_config.get("max_loaded", 8),
+    num_workers=tokenizer_config.get("num_workers", 4),
+)
+model_deployer = ModelDeployer(nim_client, tokenizer_registry)
+auto_scaler = None
+
+cache_config = config.get("response_cache", {})
+response_cache = None
+if cache_config.get("enabled", True):
+    response_cache = ResponseCache(
+        max_bytes=cache_config.get("max_bytes", 256 * 1024 * 1024),
+        ttl=cache_config.get("ttl", 300.0),
+        monitoring=monitoring,
+    )
+
+# Models with `backend: local` run in-process on onnxruntime; the rest go to NIM.
+model_backends = {
+    model_name: model_cfg.get("backend", "nim") for model_name, model_cfg in config.get("model_config", {}).items()
+}
+inference_backend = nim_client
+local_backend = None
+if "local" in model_backends.values():
+    local_config = config.get("local_backend", {})
+    local_backend = OnnxRuntimeBackend(
+        config.get("model_config", {}),
+        pool_size=local_config.get("pool_size", 2),
+        intra_op_threads=local_config.get("intra_op_threads", 1),
+        inter_op_threads=local_config.get("inter_op_threads", 1),
+        resolve_path=lambda model_name, model_path: nim_client.prepare_onnx(model_path),
+    )
+    inference_backend = BackendRouter({"nim": nim_client, "local": local_backend}, model_backends)
+
+# Models deployed with num_gpus > 1 run through their pipeline-parallel wrapper.
+pipeline_config = config.get("pipeline_parallel", {})
+pipelines = {}
+
+async def process_batch(model_name, batch):
+    monitoring.update_batch_size(len(batch), model_name)
+    start_time = time.perf_counter()
+    backend = pipelines.get(model_name, inference_backend)
+    results = await batch_inference(backend, model_name, batch, tokenizer_registry.pad_token_id(model_name), tracer)
+    monitoring.record_model_latency(time.perf_counter() - start_time, model_name)
+    return results
+
+model_limits = {
+    model_name: {
+        key: model_cfg[key]
+        for key in ("max_batch_size", "max_latency", "length_buckets", "max_queue_depth", "queue_wait_slo")
+        if key in model_cfg
+    }
+    for model_name, model_cfg in config.get("model_config", {}).items()
+}
+admission_config = config.get("admission", {})
+bulk_config = config.get("bulk_inference", {})
+adaptive_config = config.get("adaptive_batching", {})
+batch_controller = None
+if adaptive_config.get("enabled", False):
+    batch_controller = AdaptiveBatchController(
+        target_p95=adaptive_config.get("target_p95", 0.25),
+        min_batch_size=adaptive_config.get("min_batch_size", 1),
+        min_window=adaptive_config.get("min_window", 0.001),
+        decision_interval=adaptive_config.get("decision_interval", 1.0),
+        concurrency=config.get("max_concurrent_batches", 4),
+        model_targets={
+            model_name: model_cfg["target_p95"]
+            for model_name, model_cfg in config.get("model_config", {}).items() if "target_p95" in model_cfg
+        },
+        monitoring=monitoring,
+    )
+dynamic_batcher = DynamicBatcher(
+    config["max_batch_size"],
+    config["max_latency"],
+    process_batch,
+    model_limits=model_limits,
+    max_concurrent_batches=config.get("max_concurrent_batches", 4),
+    length_buckets=config.get("length_buckets"),
+    tracer=tracer,
+    max_queue_depth=admission_config.get("max_queue_depth"),
+    queue_wait_slo=admission_config.get("queue_wait_slo"),
+    bulk_share=admission_config.get("bulk_share", 0.5),
+    controller=batch_controller,
+)
+single_flight = SingleFlight(monitoring)
+
+kubernetes_config = config.get("kubernetes", {})
+autoscaling_config = config.get("autoscaling", {})
+scaling_controller = None
+
+def get_auto_scaler():
+    # Created on first use: loading the in-cluster config fails anywhere but in a pod.
+    global auto_scaler
+    if auto_scaler is None:
+        from auto_scaler import AutoScaler
+
+        auto_scaler = AutoScaler()
+    return auto_scaler
+
+def create_scaling_controller():
+    from auto_scaler import ScalingController
+
+    return ScalingController(
+        get_auto_scaler(),
+        monitoring,
+        kubernetes_config.get("deployment_name", "nim-gen-ai"),
+        kubernetes_config.get("namespace", "default"),
+        min_replicas=autoscaling_config.get("min_replicas", 1),
+        max_replicas=autoscaling_config.get("max_replicas", 10),
+        target_queue_depth=autoscaling_config.get("target_queue_depth", 32),
+        target_request_rate=autoscaling_config.get("target_request_rate"),
+        target_p95=autoscaling_config.get("target_p95"),
+        tolerance=autoscaling_config.get("tolerance", 0.1),
+        lookahead=autoscaling_config.get("lookahead", 60.0),
+        scale_down_cooldown=autoscaling_config.get("scale_down_cooldown", 300.0),
+        interval=autoscaling_config.get("interval", 15.0),
+        lease_name=autoscaling_config.get("lease_name", f"{kubernetes_config.get('deployment_name', 'nim-gen-ai')}-autoscaler"),
+        # The pod name, unique among the replicas
+        identity=socket.gethostname(),
+    )
+
+# Models with `scheduler: continuous` stream from a local decoder that batches per step.
+continuous_models = {
+    model_name for model_name, model_cfg in config.get("model_config", {}).items()
+    if model_cfg.get("scheduler") == "continuous"
+}
+continuous_batcher = None
+if continuous_models:
+    continuous_config = config.get("continuous_batching", {})
+    continuous_batcher = ContinuousBatcher(
+        TransformersStepBackend(config.get("model_config", {}), device=continuous_config.get("device", "cpu")),
+        max_batch_size=config["max_batch_size"],
+        max_new_tokens=continuous_config.get("max_new_tokens", 64),
+        model_limits=model_limits,
+        monitoring=monitoring,
+    )
 
 class DeployRequest(BaseModel):
     model_name: str
@@ -31,83 +221,363 @@ class DeployRequest(BaseModel):
 class InferenceRequest(BaseModel):
     model_name: str
     input_text: str
+    parameters: Dict[str, Any] = {}
+    priority: Literal["interactive", "bulk"] = "interactive"
+    # Time budget in milliseconds from when the request is received; overrides the deadline header
+    deadline_ms: Optional[float] = None
+
+DEADLINE_HEADER = "x-request-deadline-ms"
 
-async def update_metrics_periodically():
+class ClientDisconnectedError(Exception):
+    pass
+
+def request_deadline(request: InferenceRequest, http_request: Request) -> Optional[float]:
+    deadline_ms = request.deadline_ms
+    if deadline_ms is None and DEADLINE_HEADER in http_request.headers:
+        try:
+            deadline_ms = float(http_request.headers[DEADLINE_HEADER])
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid {DEADLINE_HEADER} header")
+    if deadline_ms is None:
+        return None
+    return asyncio.get_running_loop().time() + deadline_ms / 1000.0
+
+async def wait_for_deadline(model_name: str, work, deadline: Optional[float]):
+    if deadline is None:
+        return await work
+    try:
+        return await asyncio.wait_for(work, max(deadline - asyncio.get_running_loop().time(), 0.0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceededError(model_name)
+
+async def wait_for_disconnect(http_request: Request):
     while True:
-        monitoring.collect_metrics()
-        await asyncio.sleep(60)  # Update metrics every 60 seconds
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def cancel_on_disconnect(http_request: Request, work):
+    # Queued work is cancelled as soon as the client goes away instead of running to completion.
+    work = asyncio.ensure_future(work)
+    disconnect = asyncio.ensure_future(wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not work.done():
+            work.cancel()
+            await asyncio.wait({work})
+    if work.cancelled():
+        raise ClientDisconnectedError()
+    return work.result()
+
+def preload_tokenizers():
+    for model_name in config.get("model_config", {}):
+        try:
+            tokenizer_registry.get(model_name)
+        except Exception:
+            # The first request for the model retries the load and reports the error.
+            pass
+
+def preload_local_models():
+    for model_name, backend in model_backends.items():
+        if backend == "local":
+            try:
+                local_backend.load(model_name)
+            except Exception:
+                # The model's first batch retries the load and reports the error.
+                pass
+
+def serialize_result(result):
+    return {key: np.asarray(value).tolist() for key, value in result.items()}
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    asyncio.create_task(update_metrics_periodically())
+    global scaling_controller
+    monitoring.start_server()
+    monitoring.start_sampler(monitoring_config.get("update_interval", 60))
+    dynamic_batcher.start()
+    monitoring.track_queue_depth(dynamic_batcher.queue_depth, asyncio.get_running_loop())
+    if autoscaling_config.get("enabled", False):
+        scaling_controller = create_scaling_controller()
+        scaling_controller.start()
+    if len(nim_endpoints) > 1:
+        # Replicas that stop answering are taken out of routing until they recover.
+        nim_client.start_health_checks(
+            routing_config.get("health_check_path", HEALTH_CHECK_PATH),
+            routing_config.get("health_check_interval", 10.0),
+        )
+    if config.get("startup", {}).get("preload_tokenizers", True):
+        # Loads in the background so the pod reports ready without waiting for transformers.
+        asyncio.get_running_loop().run_in_executor(None, preload_tokenizers)
+    if local_backend is not None:
+        # Sessions for local models (and their ONNX export, if needed) load in the background
+        # too, rather than on each model's first batch.
+        asyncio.get_running_loop().run_in_executor(None, preload_local_models)
+    monitoring.record_startup_time(time.perf_counter() - STARTED_AT)
     yield
     # Shutdown
-    # Add any cleanup code here if needed
+    if scaling_controller is not None:
+        scaling_controller.stop()
+    monitoring.stop_sampler()
+    await dynamic_batcher.stop()
+    if continuous_batcher is not None:
+        await continuous_batcher.stop()
+        continuous_batcher.backend.close()
+    await nim_client.close()
+    if local_backend is not None:
+        await local_backend.close()
+    tokenizer_registry.close()
+    tracer.close()
+    monitoring.stop_server()
 
 app = FastAPI(lifespan=lifespan)
 
 @app.post("/deploy")
+@monitoring.measure_request_time("deploy")
 async def deploy_model(request: DeployRequest):
     try:
-        result = await model_deployer.prepare_and_deploy_model(request.model_name, request.model_path)
+        if model_backends.get(request.model_name) == "local":
+            # Runs in-process: export and load the sessions here instead of deploying to NIM.
+            result = {"backend": "local", "onnx_path": await local_backend.prepare(request.model_name, request.model_path)}
+        else:
+            result = await model_deployer.prepare_and_deploy_model(request.model_name, request.model_path)
+        tokenizer_registry.evict(request.model_name)
+        if response_cache is not None:
+            response_cache.invalidate_model(request.model_name)
+        pipelines.pop(request.model_name, None)
         if request.num_gpus > 1:
-            # Initialize model parallelism
-            ModelParallelNIMWrapper(nim_client, request.model_name, request.num_gpus)
+            # Initialize pipeline parallelism across the GPUs
+            from model_parallelism import ModelParallelNIMWrapper
+
+            pipeline = ModelParallelNIMWrapper(
+                nim_client,
+                request.model_name,
+                request.num_gpus,
+                num_micro_batches=pipeline_config.get("micro_batches"),
+                model_info=await nim_client.get_model_status(request.model_name),
+                monitoring=monitoring,
+            )
+            if pipeline_config.get("profile_layers", True):
+                probe_length = pipeline_config.get("probe_length", 128)
+                await pipeline.rebalance(np.ones((1, probe_length), dtype=np.int64), np.ones((1, probe_length), dtype=np.int64))
+            pipelines[request.model_name] = pipeline
         return {"message": "Model deployed successfully", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/inference")
-async def inference(request: InferenceRequest):
+@monitoring.measure_request_time("inference")
+async def inference(request: InferenceRequest, http_request: Request):
+    deadline = request_deadline(request, http_request)
     try:
         monitoring.record_inference_request()
-        
-        @monitoring.measure_request_time
-        async def process_inference():
-            tokenized_input = {"input_ids": [1, 2, 3], "attention_mask": [1, 1, 1]}  # Mocked tokenization
-            batch = await dynamic_batcher.add_request(tokenized_input)
-            if batch:
-                monitoring.update_batch_size(len(batch))
-                start_time = time.time()
-                results = await batch_inference(nim_client, request.model_name, batch)
-                latency = time.time() - start_time
-                monitoring.record_model_latency(latency)
-                return results[0]  # Return the result for this specific request
-            return None
-
-        result = await process_inference()
-        if result is None:
-            return {"message": "Request added to batch, please try again later"}
-        return {"result": result}
+        with tracer.trace("inference", request.model_name):
+            if response_cache is not None:
+                cache_key = response_cache.make_key(request.model_name, request.input_text, request.parameters)
+                generation = response_cache.generation(request.model_name)
+                result = response_cache.get(cache_key)
+                if result is not None:
+                    with tracer.span("serialize"):
+                        return {"result": serialize_result(result)}
+            with tracer.span("tokenize"):
+                tokenized_input = await tokenizer_registry.tokenize(request.model_name, request.input_text)
+            # Identical requests already in flight share one batch slot and one result. The shared
+            # work carries no deadline; each caller enforces its own, and the work is dropped from
+            # the queue once every caller has given up.
+            dynamic_batcher.check_deadline(request.model_name, deadline)
+            flight_key = (request.model_name, request.priority, tokenized_input["input_ids"].tobytes())
+            result = await cancel_on_disconnect(http_request, wait_for_deadline(request.model_name, single_flight.do(
+                flight_key,
+                lambda: dynamic_batcher.add_request(request.model_name, tokenized_input, request.priority),
+            ), deadline))
+            if response_cache is not None:
+                response_cache.put(cache_key, request.model_name, result, generation)
+            with tracer.span("serialize"):
+                return {"result": serialize_result(result)}
+    except QueueFullError as e:
+        # Reject quickly instead of queueing work that would miss its latency target.
+        monitoring.record_shed_request(request.model_name, request.priority)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except DeadlineExceededError as e:
+        monitoring.record_expired_request(request.model_name)
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnectedError:
+        # Nobody is left to read the response; 499 mirrors the "client closed request" log convention.
+        monitoring.record_disconnected_request(request.model_name)
+        raise HTTPException(status_code=499, detail="Client disconnected")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def generate_events(request: InferenceRequest, tokenized_input):
+    tokens = continuous_batcher.generate(
+        request.model_name,
+        tokenized_input["input_ids"],
+        request.parameters.get("max_new_tokens"),
+        tokenizer_registry.eos_token_id(request.model_name),
+    )
+    index = 0
+    async for token_id in tokens:
+        yield {"index": index, "token_id": token_id}
+        index += 1
+
+def streaming_backend(model_name: str):
+    # The backend /inference would send the model to, provided it can stream tokens. Local
+    # onnxruntime models and pipeline-parallel deployments only return whole results.
+    backend = pipelines.get(model_name, inference_backend)
+    if isinstance(backend, BackendRouter):
+        backend = backend.backend_for(model_name)
+    return backend if hasattr(backend, "stream_inference") else None
+
+async def stream_tokens(request: InferenceRequest, start_time: float, event_stream: bool, backend=None):
+    def frame(event):
+        data = json.dumps(event)
+        return f"data: {data}\n\n" if event_stream else f"{data}\n"
+
+    try:
+        tokenized_input = await tokenizer_registry.tokenize(request.model_name, request.input_text)
+        if request.model_name in continuous_models:
+            events = generate_events(request, tokenized_input)
+        else:
+            input_data = {key: value[np.newaxis, :] for key, value in tokenized_input.items()}
+            events = backend.stream_inference(request.model_name, input_data, request.parameters)
+        last_token_time = None
+        async for event in events:
+            now = time.perf_counter()
+            if last_token_time is None:
+                monitoring.record_time_to_first_token(request.model_name, now - start_time)
+            else:
+                monitoring.record_inter_token_latency(request.model_name, now - last_token_time)
+            last_token_time = now
+            yield frame(event)
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band.
+        yield frame({"error": str(e)})
+    if event_stream:
+        yield "data: [DONE]\n\n"
+
+@app.post("/inference/stream")
+async def inference_stream(request: InferenceRequest, http_request: Request):
+    backend = None
+    if request.model_name not in continuous_models:
+        backend = streaming_backend(request.model_name)
+        if backend is None:
+            raise HTTPException(status_code=400, detail=f"Model {request.model_name} runs on a backend that cannot "
+                                                        "stream tokens; use /inference or scheduler: continuous")
+    monitoring.record_inference_request()
+    event_stream = "text/event-stream" in http_request.headers.get("accept", "")
+    media_type = "text/event-stream" if event_stream else "application/x-ndjson"
+    return StreamingResponse(stream_tokens(request, time.perf_counter(), event_stream, backend), media_type=media_type)
+
+class DuplexStreamingResponse(StreamingResponse):
+    # Streams the response while the request body is still arriving. StreamingResponse watches
+    # for a disconnect by reading the same receive channel, which would swallow body chunks, so
+    # endpoints using this watch for the disconnect themselves once the body has been read.
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+@app.post("/inference/batch")
+@monitoring.measure_request_time("inference_batch")
+async def inference_batch(model_name: str, http_request: Request, priority: Literal["interactive", "bulk"] = "bulk"):
+    # Bulk inputs for one model, as a JSON array or as NDJSON (one JSON string or
+    # {"input_text": ...} object per line). Results stream back as NDJSON lines tagged with the
+    # input's index, in the order they complete.
+    if model_name not in config.get("model_config", {}):
+        # Fail the job once here rather than once per input line.
+        raise HTTPException(status_code=404, detail=f"Model {model_name} is not configured")
+    body_read = asyncio.Event()
+    content_type = http_request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        async def body():
+            try:
+                async for chunk in http_request.stream():
+                    yield chunk
+            finally:
+                body_read.set()
+
+        inputs = read_ndjson(body())
+    else:
+        try:
+            inputs = parse_json_inputs(await http_request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        body_read.set()
+
+    async def watch_for_disconnect():
+        await body_read.wait()
+        await wait_for_disconnect(http_request)
+
+    async def frames():
+        results = run_bulk(dynamic_batcher, tokenizer_registry, model_name, inputs, priority,
+                           bulk_config.get("max_in_flight", 1024), monitoring)
+        disconnect = asyncio.ensure_future(watch_for_disconnect())
+        try:
+            while True:
+                next_event = asyncio.ensure_future(results.__anext__())
+                await asyncio.wait({next_event, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_event.done():
+                    # Stop reading inputs and drop the ones still queued.
+                    next_event.cancel()
+                    await asyncio.wait({next_event})
+                    monitoring.record_disconnected_request(model_name)
+                    return
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    return
+                if "result" in event:
+                    event["result"] = serialize_result(event["result"])
+                yield json.dumps(event) + "\n"
+        finally:
+            disconnect.cancel()
+            await results.aclose()
+
+    return DuplexStreamingResponse(frames(), media_type="application/x-ndjson")
+
 @app.post("/undeploy/{model_name}")
+@monitoring.measure_request_time("undeploy")
 async def undeploy_model(model_name: str):
     try:
-        result = await model_deployer.undeploy_model(model_name)
+        if model_backends.get(model_name) == "local":
+            local_backend.unload(model_name)
+            result = {"backend": "local"}
+        else:
+            result = await model_deployer.undeploy_model(model_name)
+        tokenizer_registry.evict(model_name)
+        if response_cache is not None:
+            response_cache.invalidate_model(model_name)
+        # Later batches must not keep going through the old stage split.
+        pipelines.pop(model_name, None)
         return {"message": "Model undeployed successfully", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/ready")
+async def ready():
+    # Serving requests means the lifespan startup has finished; models load on first use.
+    return {"status": "ready"}
+
 @app.get("/metrics")
 async def get_metrics():
-    monitoring.collect_metrics()
-    return {"message": "Metrics updated"}
+    return {"message": "Metrics updated", "metrics": monitoring.collect_metrics()}
 
 @app.post("/scale")
+@monitoring.measure_request_time("scale")
 async def scale_deployment(name: str, namespace: str, replicas: int):
     try:
-        auto_scaler.scale_deployment(name, namespace, replicas)
+        get_auto_scaler().scale_deployment(name, namespace, replicas)
         return {"message": f"Scaled deployment {name} to {replicas} replicas"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/update_hpa")
+@monitoring.measure_request_time("update_hpa")
 async def update_hpa(name: str, namespace: str, min_replicas: int, max_replicas: int, target_cpu_utilization: int):
     try:
-        auto_scaler.update_hpa(name, namespace, min_replicas, max_replicas, target_cpu_utilization)
+        get_auto_scaler().update_hpa(name, namespace, min_replicas, max_replicas, target_cpu_utilization)
         return {"message": f"Updated HPA for deployment {name}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
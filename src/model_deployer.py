@@ -1,26 +1,38 @@
 from nim_client import NIMClient
-from typing import Dict, Any
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from tokenizer_registry import TokenizerRegistry
+from typing import Dict, Any, Optional
+import asyncio
+import inspect
+import numpy as np
+
+async def _resolve(result):
+    # Works with both the blocking NIMClient and AsyncNIMClient.
+    if inspect.isawaitable(result):
+        return await result
+    return result
 
 class ModelDeployer:
-    def __init__(self, nim_client: NIMClient):
+    def __init__(self, nim_client: NIMClient, tokenizer_registry: Optional[TokenizerRegistry] = None):
         self.nim_client = nim_client
+        self.tokenizer_registry = tokenizer_registry or TokenizerRegistry()
+
+    async def prepare_and_deploy_model(self, model_name: str, model_path: str) -> Dict[str, Any]:
+        # Check that the checkpoint is readable before converting it. Only config.json is loaded:
+        # the weights are read once, by the ONNX export, and the tokenizer on first inference.
+        from transformers import AutoConfig
 
-    def prepare_and_deploy_model(self, model_name: str, model_path: str) -> Dict[str, Any]:
-        # Load the model and tokenizer
-        model = AutoModelForCausalLM.from_pretrained(model_path)
-        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, AutoConfig.from_pretrained, model_path)
 
         # Deploy the model using NIM
-        deployment_result = self.nim_client.deploy_model(model_name, model_path)
+        deployment_result = await _resolve(self.nim_client.deploy_model(model_name, model_path))
         return deployment_result
 
-    def inference(self, model_name: str, input_text: str) -> Dict[str, Any]:
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        input_data = tokenizer(input_text, return_tensors="np")
-        result = self.nim_client.inference(model_name, input_data)
+    async def inference(self, model_name: str, input_text: str) -> Dict[str, Any]:
+        encoded = await self.tokenizer_registry.tokenize(model_name, input_text)
+        input_data = {key: value[np.newaxis, :] for key, value in encoded.items()}
+        result = await _resolve(self.nim_client.inference(model_name, input_data))
         return result
 
-    def undeploy_model(self, model_name: str) -> Dict[str, Any]:
-        return self.nim_client.undeploy_model(model_name)
\ No newline at end of file
+    async def undeploy_model(self, model_name: str) -> Dict[str, Any]:
+        return await _resolve(self.nim_client.undeploy_model(model_name))
@@ -0,0 +1,169 @@
+import inspect
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+# torch, transformers, onnx and onnxruntime are imported inside the functions that use
+# them, so importing this module (and the service) stays cheap.
+
+ONNX_OPSET = 17
+INPUT_NAMES = ["input_ids", "attention_mask"]
+OUTPUT_NAMES = ["logits"]
+OPTIMIZATION_LEVELS = ("basic", "extended", "all")
+
+def export_onnx(model_path: str, onnx_path: str, opset: int = ONNX_OPSET,
+                benchmark_shape: Optional[tuple] = (1, 32)) -> Optional[Dict[str, Any]]:
+    # Exports a causal LM to ONNX with dynamic batch and sequence axes, taking input_ids and
+    # attention_mask and returning logits, the same tensors batch_inference exchanges with NIM.
+    # Returns the PyTorch model's size and CPU latency as the baseline for the report.
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    model = AutoModelForCausalLM.from_pretrained(model_path).eval()
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask, use_cache=False).logits
+
+    # A fresh Module is in training mode; exporting it that way would bake dropout into the graph.
+    wrapper = LogitsOnly(model).eval()
+    baseline = None
+    if benchmark_shape is not None:
+        input_ids = torch.ones(benchmark_shape, dtype=torch.long)
+        with torch.no_grad():
+            latency = _median_latency(lambda: wrapper(input_ids, torch.ones_like(input_ids)))
+        size = sum(p.numel() * p.element_size() for p in model.parameters())
+        baseline = {"step": "pytorch", "path": model_path, "size_bytes": size, "latency_ms": latency}
+
+    dummy = torch.ones((2, 8), dtype=torch.long)
+    axes = {0: "batch", 1: "sequence"}
+    options = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch defaults to the dynamo exporter, which needs onnxscript.
+        options["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            (dummy, torch.ones_like(dummy)),
+            onnx_path,
+            input_names=INPUT_NAMES,
+            output_names=OUTPUT_NAMES,
+            dynamic_axes={name: axes for name in INPUT_NAMES + OUTPUT_NAMES},
+            opset_version=opset,
+            do_constant_folding=True,
+            **options,
+        )
+    return baseline
+
+def optimize_onnx(onnx_path: str, optimized_path: str, level: str = "extended"):
+    # Runs onnxruntime's graph optimizations (constant folding, redundant node elimination and,
+    # from "extended" up, operator fusions) once, offline, and saves the result so that serving
+    # loads an already optimized graph. "all" adds layout changes tied to the exporting CPU.
+    import onnxruntime
+
+    if level not in OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown optimization level: {level}")
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = {
+        "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }[level]
+    options.optimized_model_filepath = optimized_path
+    onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+def quantize_onnx(onnx_path: str, quantized_path: str):
+    # Dynamic int8 quantization: weights are stored as int8 and activations are quantized at
+    # run time, so no calibration data is needed.
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    # Fused nodes from optimize_onnx carry no inferred output type; they are float.
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8,
+                     extra_options={"DefaultTensorType": onnx.TensorProto.FLOAT})
+
+def _median_latency(run, runs: int = 20, warmup: int = 3) -> float:
+    for _ in range(warmup):
+        run()
+    timings = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start_time)
+    return float(np.median(timings)) * 1e3
+
+def measure_onnx(onnx_path: str, shape: tuple = (1, 32), runs: int = 20) -> Dict[str, float]:
+    import onnxruntime
+
+    start_time = time.perf_counter()
+    session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    load_ms = (time.perf_counter() - start_time) * 1e3
+    feed = {name: np.ones(shape, dtype=np.int64) for name in INPUT_NAMES}
+    return {"load_ms": load_ms, "latency_ms": _median_latency(lambda: session.run(None, feed), runs)}
+
+def optimize_model(model_path: str, directory: str, level: str = "extended", quantize: bool = False,
+                   benchmark_shape: Optional[tuple] = (1, 32)) -> Dict[str, Any]:
+    # Export, optimize and optionally quantize model_path into directory. Writes report.json
+    # with the size and CPU latency after each step and returns the report; report["artifact"]
+    # is the file to serve. Pass benchmark_shape=None to skip the latency measurements.
+    os.makedirs(directory, exist_ok=True)
+    steps: List[Dict[str, Any]] = []
+
+    def record(step: str, path: str):
+        row = {"step": step, "path": os.path.basename(path), "size_bytes": os.path.getsize(path)}
+        if benchmark_shape is not None:
+            row.update(measure_onnx(path, benchmark_shape))
+        steps.append(row)
+
+    onnx_path = os.path.join(directory, "model.onnx")
+    baseline = export_onnx(model_path, onnx_path, benchmark_shape=benchmark_shape)
+    if baseline is not None:
+        steps.append(baseline)
+    record("export", onnx_path)
+
+    artifact = os.path.join(directory, "model_optimized.onnx")
+    optimize_onnx(onnx_path, artifact, level)
+    record("optimize", artifact)
+
+    if quantize:
+        quantized_path = os.path.join(directory, "model_quantized.onnx")
+        quantize_onnx(artifact, quantized_path)
+        artifact = quantized_path
+        record("quantize", artifact)
+
+    report = {
+        "model_path": model_path,
+        "optimization_level": level,
+        "quantize": quantize,
+        "benchmark_shape": list(benchmark_shape) if benchmark_shape is not None else None,
+        "artifact": os.path.basename(artifact),
+        "steps": steps,
+    }
+    with open(os.path.join(directory, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{'step':<10} {'size (MB)':>10} {'latency (ms)':>13} {'load (ms)':>10}"]
+    for step in report["steps"]:
+        latency = f"{step['latency_ms']:.3f}" if "latency_ms" in step else "-"
+        load = f"{step['load_ms']:.1f}" if "load_ms" in step else "-"
+        lines.append(f"{step['step']:<10} {step['size_bytes'] / 1e6:>10.2f} {latency:>13} {load:>10}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export a Hugging Face causal LM to an optimized ONNX model")
+    parser.add_argument("model_path")
+    parser.add_argument("output_dir")
+    parser.add_argument("--level", choices=OPTIMIZATION_LEVELS, default="extended")
+    parser.add_argument("--quantize", action="store_true", help="Apply dynamic int8 quantization")
+    args = parser.parse_args()
+    print(format_report(optimize_model(args.model_path, args.output_dir, args.level, args.quantize)))
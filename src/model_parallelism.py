@@ -1,59 +1,225 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
 import torch
 import torch.nn as nn
 
+def partition_layers(layer_costs: Sequence[float], num_stages: int) -> List[int]:
+    # Splits the layers into num_stages contiguous runs so that the most expensive stage, which
+    # sets the pipeline's throughput, is as cheap as possible. Returns the layer count per stage.
+    num_layers = len(layer_costs)
+    if not 1 <= num_stages <= num_layers:
+        raise ValueError(f"Cannot split {num_layers} layers into {num_stages} stages")
+    prefix = np.concatenate([[0.0], np.cumsum(layer_costs, dtype=float)])
+    # best[k][i]: the lowest max stage cost of putting the first i layers on k stages.
+    best = np.full((num_stages + 1, num_layers + 1), np.inf)
+    split = np.zeros((num_stages + 1, num_layers + 1), dtype=int)
+    best[0][0] = 0.0
+    for k in range(1, num_stages + 1):
+        for i in range(k, num_layers - (num_stages - k) + 1):
+            for j in range(k - 1, i):
+                cost = max(best[k - 1][j], prefix[i] - prefix[j])
+                if cost < best[k][i]:
+                    best[k][i], split[k][i] = cost, j
+    counts = []
+    end = num_layers
+    for k in range(num_stages, 0, -1):
+        start = int(split[k][end])
+        counts.append(end - start)
+        end = start
+    return counts[::-1]
+
+def _split(value, sections: int):
+    if isinstance(value, torch.Tensor):
+        return list(torch.tensor_split(value, sections, dim=0))
+    return np.array_split(np.asarray(value), sections)
+
+def _concat(values: List[Any]):
+    first = values[0]
+    if isinstance(first, torch.Tensor):
+        return torch.cat(values, dim=0)
+    if isinstance(first, np.ndarray):
+        return np.concatenate(values, axis=0)
+    if isinstance(first, tuple):
+        return tuple(_concat(list(parts)) for parts in zip(*values))
+    if isinstance(first, list):
+        # JSON responses from the synchronous client: a list per batch row.
+        return [row for value in values for row in value]
+    return first  # Assuming non-tensor outputs are the same across micro-batches
+
 class ModelParallelNIMWrapper(nn.Module):
-    def __init__(self, nim_client, model_name, num_gpus):
+    # Pipeline-parallel execution of one model whose layers are split across num_gpus NIM stages.
+    # A batch is cut into micro-batches that flow through the stages in order, so while stage 1
+    # runs micro-batch 0, stage 0 already runs micro-batch 1. Each stage call sends the previous
+    # stage's outputs (hidden_states) on with the layer range and the gpu that runs it; the last
+    # stage returns the model outputs (logits).
+    def __init__(self, nim_client, model_name, num_gpus, num_micro_batches: Optional[int] = None,
+                 model_info: Optional[Dict[str, Any]] = None, layer_costs: Optional[Sequence[float]] = None,
+                 monitoring=None):
         super().__init__()
         self.nim_client = nim_client
         self.model_name = model_name
-        self.num_gpus = num_gpus
-        
+        self.monitoring = monitoring
+        if model_info is None:
+            # Get model architecture from NIM
+            model_info = self.nim_client.get_model_status(self.model_name)
+        self.total_layers = model_info['num_layers']
+        self.num_gpus = min(num_gpus, self.total_layers)
+        # Enough micro-batches by default that the fill and drain bubble, (stages - 1) of
+        # (micro-batches + stages - 1) steps, stays around 20%.
+        self.num_micro_batches = num_micro_batches or 4 * self.num_gpus
+        self.layer_costs = list(layer_costs or model_info.get('layer_costs') or [1.0] * self.total_layers)
+        self.last_stats: Dict[str, Any] = {}
+        self._locks: List[asyncio.Lock] = []
+        self._locks_loop: Optional[asyncio.AbstractEventLoop] = None
+
         # Split the model across GPUs
         self.layer_distribution = self._distribute_layers()
 
     def _distribute_layers(self):
-        # Get model architecture from NIM
-        model_info = self.nim_client.get_model_status(self.model_name)
-        total_layers = model_info['num_layers']
-        
-        # Distribute layers evenly across GPUs
-        layers_per_gpu = total_layers // self.num_gpus
-        return [layers_per_gpu] * self.num_gpus
+        if len(self.layer_costs) != self.total_layers:
+            raise ValueError(f"Expected {self.total_layers} layer costs, got {len(self.layer_costs)}")
+        return partition_layers(self.layer_costs, self.num_gpus)
+
+    @property
+    def stage_ranges(self) -> List[tuple]:
+        ranges = []
+        start_layer = 0
+        for count in self.layer_distribution:
+            ranges.append((start_layer, start_layer + count))
+            start_layer += count
+        return ranges
+
+    async def _call_stage(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if asyncio.iscoroutinefunction(self.nim_client.inference):
+            return await self.nim_client.inference(self.model_name, payload)
+        # The synchronous client blocks, so its stage calls run on executor threads.
+        return await asyncio.get_running_loop().run_in_executor(None, self.nim_client.inference, self.model_name, payload)
+
+    async def rebalance(self, input_ids, attention_mask, runs: int = 3) -> List[int]:
+        # Measures what each layer costs on a probe batch and repartitions by it, so that a stage
+        # holding the embedding or the LM head gets fewer transformer layers.
+        per_run = []
+        for _ in range(runs):
+            layer_times = await self._profile_stages(input_ids, attention_mask)
+            if layer_times is None:
+                layer_times = await self._profile_layers(input_ids, attention_mask)
+            per_run.append(layer_times)
+        self.layer_costs = [float(np.median(layer_timings)) for layer_timings in zip(*per_run)]
+        self.layer_distribution = self._distribute_layers()
+        return self.layer_distribution
+
+    async def _profile_stages(self, input_ids, attention_mask) -> Optional[List[float]]:
+        # One pass through the current stages with `profile` set. Stages that support it report
+        # the compute time of each of their layers as `layer_times`, which leaves out the network
+        # and serialization. None if any stage does not report them.
+        activations = {'input_ids': input_ids}
+        layer_times: List[float] = []
+        for gpu_id, (start_layer, end_layer) in enumerate(self.stage_ranges):
+            outputs = dict(await self._call_stage({
+                **activations,
+                'attention_mask': attention_mask,
+                'start_layer': start_layer,
+                'end_layer': end_layer,
+                'gpu': gpu_id,
+                'profile': True,
+            }))
+            reported = outputs.pop('layer_times', None)
+            if reported is None or len(reported) != end_layer - start_layer:
+                return None
+            layer_times.extend(float(seconds) for seconds in reported)
+            activations = outputs
+        return layer_times
+
+    async def _profile_layers(self, input_ids, attention_mask) -> List[float]:
+        # Times each layer as its own stage call. Every call also pays a full round trip, which
+        # would flatten the differences between layers, so the time of a call that runs no
+        # layers is subtracted.
+        stage_of = [gpu_id for gpu_id, (start, end) in enumerate(self.stage_ranges) for _ in range(start, end)]
+
+        async def timed(activations, start_layer, end_layer, gpu_id):
+            start_time = time.perf_counter()
+            outputs = await self._call_stage({
+                **activations,
+                'attention_mask': attention_mask,
+                'start_layer': start_layer,
+                'end_layer': end_layer,
+                'gpu': gpu_id,
+            })
+            return outputs, time.perf_counter() - start_time
+
+        _, round_trip = await timed({'input_ids': input_ids}, 0, 0, 0)
+        activations = {'input_ids': input_ids}
+        layer_times = []
+        for layer in range(self.total_layers):
+            activations, elapsed = await timed(activations, layer, layer + 1, stage_of[layer])
+            layer_times.append(max(elapsed - round_trip, 0.0))
+        return layer_times
+
+    def _stage_locks(self) -> List[asyncio.Lock]:
+        # Shared by every batch in flight, so a stage runs one micro-batch at a time even when the
+        # batcher runs several batches of this model at once. asyncio.Lock belongs to one event
+        # loop, and forward() starts a new loop per call, so the locks are made per loop.
+        loop = asyncio.get_running_loop()
+        if self._locks_loop is not loop or len(self._locks) != len(self.layer_distribution):
+            self._locks_loop = loop
+            self._locks = [asyncio.Lock() for _ in self.layer_distribution]
+        return self._locks
+
+    async def forward_async(self, input_ids, attention_mask):
+        num_micro_batches = max(1, min(self.num_micro_batches, len(input_ids)))
+        micro_batches = list(zip(_split(input_ids, num_micro_batches), _split(attention_mask, num_micro_batches)))
+        # asyncio.Lock wakes waiters in arrival order, so micro-batches keep their order through
+        # every stage.
+        stage_locks = self._stage_locks()
+        stage_busy = [0.0] * len(stage_locks)
+
+        async def run_micro_batch(micro_input_ids, micro_attention_mask):
+            activations = {'input_ids': micro_input_ids}
+            for gpu_id, (start_layer, end_layer) in enumerate(self.stage_ranges):
+                async with stage_locks[gpu_id]:
+                    start_time = time.perf_counter()
+                    # Send request to NIM for partial forward pass
+                    activations = await self._call_stage({
+                        **activations,
+                        'attention_mask': micro_attention_mask,
+                        'start_layer': start_layer,
+                        'end_layer': end_layer,
+                        'gpu': gpu_id,
+                    })
+                    stage_busy[gpu_id] += time.perf_counter() - start_time
+            return activations
+
+        start_time = time.perf_counter()
+        outputs = await asyncio.gather(*[run_micro_batch(*micro_batch) for micro_batch in micro_batches])
+        self._record_utilization(stage_busy, time.perf_counter() - start_time, num_micro_batches)
+        return self._combine_outputs(outputs)
+
+    def _record_utilization(self, stage_busy: List[float], elapsed: float, num_micro_batches: int):
+        # Utilization is the share of stage-time spent computing; the rest is pipeline bubble,
+        # ideally (stages - 1) / (micro-batches + stages - 1) with balanced stages.
+        num_stages = len(stage_busy)
+        utilization = sum(stage_busy) / (num_stages * elapsed) if elapsed > 0 else 0.0
+        self.last_stats = {
+            'micro_batches': num_micro_batches,
+            'stage_busy_seconds': stage_busy,
+            'elapsed_seconds': elapsed,
+            'utilization': utilization,
+            'bubble': 1.0 - utilization,
+            'ideal_bubble': (num_stages - 1) / (num_micro_batches + num_stages - 1),
+        }
+        if self.monitoring is not None:
+            self.monitoring.update_pipeline_utilization(self.model_name, utilization)
 
     def forward(self, input_ids, attention_mask):
-        outputs = None
-        for gpu_id in range(self.num_gpus):
-            device = torch.device(f'cuda:{gpu_id}')
-            start_layer = gpu_id * self.layer_distribution[gpu_id]
-            end_layer = start_layer + self.layer_distribution[gpu_id]
-            
-            # Send request to NIM for partial forward pass
-            partial_output = self.nim_client.inference(
-                self.model_name,
-                {
-                    'input_ids': input_ids.to(device),
-                    'attention_mask': attention_mask.to(device),
-                    'start_layer': start_layer,
-                    'end_layer': end_layer
-                }
-            )
-            
-            if outputs is None:
-                outputs = partial_output
-            else:
-                # Combine outputs from different GPUs
-                outputs = self._combine_outputs(outputs, partial_output)
-        
-        return outputs
-
-    def _combine_outputs(self, outputs1, outputs2):
-        # Combine partial outputs from different GPUs
-        combined_outputs = {}
-        for key in outputs1.keys():
-            if isinstance(outputs1[key], torch.Tensor):
-                combined_outputs[key] = torch.cat([outputs1[key], outputs2[key]], dim=0)
-            elif isinstance(outputs1[key], tuple):
-                combined_outputs[key] = tuple(torch.cat([o1, o2], dim=0) for o1, o2 in zip(outputs1[key], outputs2[key]))
-            else:
-                combined_outputs[key] = outputs1[key]  # Assuming non-tensor outputs are the same across GPUs
-        return combined_outputs
\ No newline at end of file
+        # For synchronous callers; code already on an event loop awaits forward_async.
+        return asyncio.run(self.forward_async(input_ids, attention_mask))
+
+    async def inference(self, model_name: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        # The InferenceBackend interface, so batch_inference can send a model's batches here.
+        return await self.forward_async(input_data['input_ids'], input_data['attention_mask'])
+
+    def _combine_outputs(self, outputs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Reassemble the micro-batch outputs along the batch dimension
+        return {key: _concat([output[key] for output in outputs]) for key in outputs[0]}
@@ -1,40 +1,290 @@
-from prometheus_client import start_http_server, Summary, Counter, Gauge
+from prometheus_client import start_http_server, Counter, Gauge, Histogram, REGISTRY
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple
+import asyncio
+import concurrent.futures
+import functools
+import threading
 import time
 import psutil
 import GPUtil
 
-REQUEST_TIME = Summary('request_processing_seconds', 'Time spent processing request')
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
 INFERENCE_REQUESTS = Counter('inference_requests_total', 'Total number of inference requests')
-MODEL_LATENCY = Summary('model_inference_latency_seconds', 'Latency of model inference')
-BATCH_SIZE = Gauge('current_batch_size', 'Current size of the inference batch')
-GPU_UTILIZATION = Gauge('gpu_utilization_percent', 'GPU utilization percentage')
+BATCH_SIZE = Gauge('current_batch_size', 'Size of the most recently dispatched inference batch', ['model'])
+GPU_UTILIZATION = Gauge('gpu_utilization_percent', 'GPU utilization percentage', ['gpu'])
 MEMORY_USAGE = Gauge('memory_usage_bytes', 'Memory usage in bytes')
+TIME_TO_FIRST_TOKEN = Histogram('time_to_first_token_seconds', 'Time from request arrival to the first streamed token', ['model'],
+                                buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+INTER_TOKEN_LATENCY = Histogram('inter_token_latency_seconds', 'Time between consecutive streamed tokens', ['model'],
+                                buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+COALESCED_REQUESTS = Counter('coalesced_inference_requests_total', 'Number of requests that shared an identical in-flight inference')
+CACHE_HITS = Counter('response_cache_hits_total', 'Number of inference responses served from the cache')
+CACHE_MISSES = Counter('response_cache_misses_total', 'Number of inference requests not found in the cache')
+CACHE_EVICTIONS = Counter('response_cache_evictions_total', 'Number of cache entries evicted to stay within the memory budget')
+CACHE_SIZE = Gauge('response_cache_size_bytes', 'Estimated memory used by cached inference responses')
+CACHE_ENTRIES = Gauge('response_cache_entries', 'Number of cached inference responses')
+EXPIRED_REQUESTS = Counter('expired_inference_requests_total', 'Number of inference requests that missed their deadline',
+                           ['model'])
+DISCONNECTED_REQUESTS = Counter('disconnected_inference_requests_total',
+                                'Number of inference requests abandoned because the client disconnected', ['model'])
+ADAPTIVE_BATCH_SIZE = Gauge('adaptive_batch_size', 'Batch size chosen by the adaptive batching controller', ['model'])
+ADAPTIVE_BATCH_WINDOW = Gauge('adaptive_batch_window_seconds', 'Batching window chosen by the adaptive batching controller',
+                              ['model'])
+ARRIVAL_RATE = Gauge('inference_arrival_rate', 'Observed inference requests per second reaching the batcher', ['model'])
+BATCHER_LATENCY_P95 = Gauge('batcher_latency_p95_seconds', 'Observed p95 of queue wait plus batch latency', ['model'])
+PIPELINE_UTILIZATION = Gauge('pipeline_stage_utilization', 'Share of stage time spent computing in the last pipelined batch',
+                             ['model'])
+PIPELINE_BUBBLE = Gauge('pipeline_bubble_ratio', 'Share of stage time left idle by pipeline fill and drain in the last pipelined batch',
+                        ['model'])
+HEDGED_REQUESTS = Counter('nim_hedged_requests_total', 'Number of NIM inference calls duplicated to a second replica')
+ENDPOINT_EJECTIONS = Counter('nim_endpoint_ejections_total', 'Number of times a NIM replica was ejected from routing',
+                             ['endpoint'])
+STARTUP_TIME = Gauge('service_startup_seconds', 'Time from process import of the service to ready')
+AUTOSCALER_ERRORS = Counter('autoscaler_errors_total', 'Number of failed autoscaler ticks, by HTTP status or error type',
+                            ['reason'])
+SHED_REQUESTS = Counter('shed_inference_requests_total', 'Number of inference requests rejected by admission control',
+                        ['model', 'priority'])
+
+def _model_label(kwargs: Dict[str, Any]) -> str:
+    if "model_name" in kwargs:
+        return str(kwargs["model_name"])
+    request = kwargs.get("request")
+    return str(getattr(request, "model_name", ""))
+
+def _on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
 
 class Monitoring:
-    def __init__(self, port=8000):
-        start_http_server(port)
+    def __init__(self, port: Optional[int] = 8000, latency_buckets: Optional[Sequence[float]] = None,
+                 registry=REGISTRY):
+        buckets = tuple(latency_buckets or DEFAULT_LATENCY_BUCKETS)
+        self.request_latency = Histogram('request_latency_seconds', 'End-to-end request handling time',
+                                         ['endpoint', 'model'], buckets=buckets, registry=registry)
+        self.model_latency = Histogram('model_inference_latency_seconds', 'Latency of one batched model inference',
+                                       ['model'], buckets=buckets, registry=registry)
+        self.stage_latency = Histogram('inference_stage_seconds', 'Time spent in each stage of the inference path',
+                                       ['stage', 'model'], buckets=STAGE_LATENCY_BUCKETS, registry=registry)
+        self.queue_depth_gauge = Gauge('batcher_queue_depth', 'Requests waiting in the dynamic batcher', registry=registry)
+        self._queue_depth_source: Optional[Callable[[], int]] = None
+        self._queue_depth_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_queue_depth = 0
+        self._request_count = 0
+        self._snapshot: Dict[str, Any] = {}
+        self._snapshot_lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop_sampler = threading.Event()
+        # The metrics endpoint is started by start_server(), so building Monitoring binds no port.
+        self.port = port
+        self.registry = registry
+        self._server = None
+
+    def measure_request_time(self, endpoint: str):
+        # Times the awaited handler, labelled by endpoint and by the model named in the
+        # handler's `model_name` or `request.model_name` argument.
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    start_time = time.perf_counter()
+                    response = None
+                    try:
+                        response = await func(*args, **kwargs)
+                        return response
+                    finally:
+                        body = getattr(response, "body_iterator", None)
+                        if body is None:
+                            self.record_request_latency(endpoint, _model_label(kwargs), time.perf_counter() - start_time)
+                        else:
+                            # A streamed response is only done once its last chunk is sent.
+                            response.body_iterator = self._timed_stream(body, endpoint, _model_label(kwargs), start_time)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start_time = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record_request_latency(endpoint, _model_label(kwargs), time.perf_counter() - start_time)
+            return wrapper
+        return decorator
 
-    @REQUEST_TIME.time()
-    def measure_request_time(self, func):
-        return func()
+    async def _timed_stream(self, body, endpoint, model_name, start_time):
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            self.record_request_latency(endpoint, model_name, time.perf_counter() - start_time)
+
+    def record_request_latency(self, endpoint, model_name, latency):
+        self.request_latency.labels(endpoint=endpoint, model=model_name).observe(latency)
+
+    def record_stage_latency(self, stage, model_name, latency):
+        self.stage_latency.labels(stage=stage, model=model_name).observe(latency)
 
     def record_inference_request(self):
         INFERENCE_REQUESTS.inc()
+        self._request_count += 1
+
+    def request_count(self) -> int:
+        return self._request_count
+
+    def track_queue_depth(self, source: Callable[[], int], loop: Optional[asyncio.AbstractEventLoop] = None):
+        # The batcher owns the queues; the gauge reads them whenever it is scraped. The queues
+        # change on `loop`, so reads from other threads (the scrape server, the autoscaler) run
+        # the source there instead of iterating the queues while the loop inserts into them.
+        self._queue_depth_source = source
+        self._queue_depth_loop = loop
+        self.queue_depth_gauge.set_function(self.queue_depth)
+
+    def queue_depth(self, timeout: float = 1.0) -> int:
+        source, loop = self._queue_depth_source, self._queue_depth_loop
+        if source is None:
+            return 0
+        if loop is None or not loop.is_running() or _on_loop(loop):
+            self._last_queue_depth = source()
+            return self._last_queue_depth
+        future = concurrent.futures.Future()
+
+        def read():
+            try:
+                future.set_result(source())
+            except Exception as e:
+                future.set_exception(e)
+
+        loop.call_soon_threadsafe(read)
+        try:
+            self._last_queue_depth = future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # The loop is too busy to answer; report the last value rather than block the caller.
+            pass
+        return self._last_queue_depth
+
+    def latency_buckets(self, endpoint: str = "inference") -> List[Tuple[float, float]]:
+        # Cumulative (upper bound, count) pairs for an endpoint, summed over models.
+        counts: Dict[float, float] = {}
+        for metric in self.request_latency.collect():
+            for sample in metric.samples:
+                if sample.name.endswith("_bucket") and sample.labels.get("endpoint") == endpoint:
+                    upper = float(sample.labels["le"])
+                    counts[upper] = counts.get(upper, 0.0) + sample.value
+        return sorted(counts.items())
+
+    def record_model_latency(self, latency, model_name=""):
+        self.model_latency.labels(model=model_name).observe(latency)
+
+    def update_batch_size(self, size, model_name=""):
+        BATCH_SIZE.labels(model=model_name).set(size)
+
+    def record_time_to_first_token(self, model_name, latency):
+        TIME_TO_FIRST_TOKEN.labels(model=model_name).observe(latency)
+
+    def record_inter_token_latency(self, model_name, latency):
+        INTER_TOKEN_LATENCY.labels(model=model_name).observe(latency)
+
+    def record_coalesced_request(self):
+        COALESCED_REQUESTS.inc()
 
-    def record_model_latency(self, latency):
-        MODEL_LATENCY.observe(latency)
+    def record_startup_time(self, seconds: float):
+        STARTUP_TIME.set(seconds)
 
-    def update_batch_size(self, size):
-        BATCH_SIZE.set(size)
+    def record_shed_request(self, model_name, priority):
+        SHED_REQUESTS.labels(model=model_name, priority=priority).inc()
+
+    def record_expired_request(self, model_name):
+        EXPIRED_REQUESTS.labels(model=model_name).inc()
+
+    def record_disconnected_request(self, model_name):
+        DISCONNECTED_REQUESTS.labels(model=model_name).inc()
+
+    def update_batching_decision(self, model_name, batch_size, window, arrival_rate, latency_p95):
+        ADAPTIVE_BATCH_SIZE.labels(model=model_name).set(batch_size)
+        ADAPTIVE_BATCH_WINDOW.labels(model=model_name).set(window)
+        ARRIVAL_RATE.labels(model=model_name).set(arrival_rate)
+        BATCHER_LATENCY_P95.labels(model=model_name).set(latency_p95)
+
+    def update_pipeline_utilization(self, model_name, utilization):
+        PIPELINE_UTILIZATION.labels(model=model_name).set(utilization)
+        PIPELINE_BUBBLE.labels(model=model_name).set(1.0 - utilization)
+
+    def record_hedged_request(self):
+        HEDGED_REQUESTS.inc()
+
+    def record_endpoint_ejection(self, endpoint):
+        ENDPOINT_EJECTIONS.labels(endpoint=endpoint).inc()
+
+    def record_autoscaler_error(self, reason):
+        AUTOSCALER_ERRORS.labels(reason=reason).inc()
+
+    def record_cache_hit(self):
+        CACHE_HITS.inc()
+
+    def record_cache_miss(self):
+        CACHE_MISSES.inc()
+
+    def record_cache_eviction(self):
+        CACHE_EVICTIONS.inc()
+
+    def update_cache_size(self, size_bytes, entries):
+        CACHE_SIZE.set(size_bytes)
+        CACHE_ENTRIES.set(entries)
 
     def update_gpu_utilization(self):
         gpus = GPUtil.getGPUs()
         for i, gpu in enumerate(gpus):
-            GPU_UTILIZATION.labels(gpu=i).set(gpu.load * 100)
+            GPU_UTILIZATION.labels(gpu=str(i)).set(gpu.load * 100)
+        return [{"gpu": i, "utilization_percent": gpu.load * 100, "memory_used_mb": gpu.memoryUsed} for i, gpu in enumerate(gpus)]
 
     def update_memory_usage(self):
-        MEMORY_USAGE.set(psutil.virtual_memory().used)
+        used = psutil.virtual_memory().used
+        MEMORY_USAGE.set(used)
+        return used
+
+    def sample_system_metrics(self):
+        # GPUtil shells out to nvidia-smi, so this only ever runs on the sampler thread.
+        try:
+            gpus = self.update_gpu_utilization()
+        except Exception:
+            gpus = []
+        snapshot = {"timestamp": time.time(), "memory_usage_bytes": self.update_memory_usage(), "gpus": gpus}
+        with self._snapshot_lock:
+            self._snapshot = snapshot
+
+    def start_server(self):
+        if self.port is None or self._server is not None:
+            return
+        self._server, _ = start_http_server(self.port, registry=self.registry)
+
+    def stop_server(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def start_sampler(self, interval: float = 15.0):
+        if self._sampler is not None and self._sampler.is_alive():
+            return
+        self._stop_sampler.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, args=(interval,), name="metrics-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop_sampler(self):
+        self._stop_sampler.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def _sample_loop(self, interval: float):
+        while not self._stop_sampler.is_set():
+            self.sample_system_metrics()
+            self._stop_sampler.wait(interval)
 
-    def collect_metrics(self):
-        self.update_gpu_utilization()
-        self.update_memory_usage()
\ No newline at end of file
+    def collect_metrics(self) -> Dict[str, Any]:
+        # Returns the latest sampled snapshot without touching nvidia-smi or psutil.
+        with self._snapshot_lock:
+            return dict(self._snapshot)
\ No newline at end of file
@@ -1,50 +1,288 @@
+import asyncio
+import json
+import os
+import time
 import requests
-from typing import Dict, Any
-import onnx
-import onnxruntime
+import aiohttp
+from typing import Dict, Any, Optional, AsyncIterator, Sequence, Union
+import numpy as np
+from artifact_cache import ArtifactCache
+from endpoint_pool import Endpoint, EndpointPool
+from model_optimizer import ONNX_OPSET, optimize_model
+from tensor_codec import TENSOR_CONTENT_TYPE, encode_tensors, decode_tensors
+from tracing import Tracer
+
+# NIM's readiness route; it answers 503 until the server can take requests.
+HEALTH_CHECK_PATH = "/v1/health/ready"
+
+def _to_json_payload(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in input_data.items()}
 
 class NIMClient:
-    def __init__(self, base_url: str):
-        self.base_url = base_url
+    # base_url is one NIM URL, a list of replicas serving the same models, or an EndpointPool
+    # configured with a routing strategy. Deploys go to every replica; inference goes to one.
+    def __init__(self, base_url: Union[str, Sequence[str], EndpointPool], artifact_cache: Optional[ArtifactCache] = None,
+                 optimization_level: str = "extended", quantize: bool = False, benchmark_onnx: bool = True):
+        self.endpoints = EndpointPool(base_url) if isinstance(base_url, (str, list, tuple)) else base_url
+        self.base_url = self.endpoints.endpoints[0].url
+        self.artifact_cache = artifact_cache
+        self.optimization_level = optimization_level
+        self.quantize = quantize
+        # Measuring CPU latency for the report runs the model a few dozen times per step.
+        self.benchmark_onnx = benchmark_onnx
 
     def deploy_model(self, model_name: str, model_path: str) -> Dict[str, Any]:
-        url = f"{self.base_url}/models/{model_name}"
-        
-        # Convert model to ONNX
-        onnx_path = f"{model_path}_onnx"
-        self._convert_to_onnx(model_path, onnx_path)
-        
-        # Optimize ONNX model
-        optimized_onnx_path = f"{onnx_path}_optimized"
-        self._optimize_onnx(onnx_path, optimized_onnx_path)
-        
-        payload = {"model_path": optimized_onnx_path}
-        response = requests.post(url, json=payload)
-        return response.json()
+        payload = {"model_path": self.prepare_onnx(model_path)}
+        results = [requests.post(f"{endpoint.url}/models/{model_name}", json=payload).json() for endpoint in self.endpoints]
+        return results[0]
 
     def inference(self, model_name: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        url = f"{self.base_url}/models/{model_name}/infer"
-        response = requests.post(url, json=input_data)
+        endpoint = self.endpoints.pick()
+        url = f"{endpoint.url}/models/{model_name}/infer"
+        start_time = time.perf_counter()
+        try:
+            response = requests.post(url, json=_to_json_payload(input_data))
+        except requests.RequestException:
+            self.endpoints.record_failure(endpoint)
+            raise
+        self.endpoints.record_success(endpoint, time.perf_counter() - start_time)
         return response.json()
 
     def get_model_status(self, model_name: str) -> Dict[str, Any]:
-        url = f"{self.base_url}/models/{model_name}/status"
+        url = f"{self.endpoints.pick().url}/models/{model_name}/status"
         response = requests.get(url)
         return response.json()
 
     def undeploy_model(self, model_name: str) -> Dict[str, Any]:
-        url = f"{self.base_url}/models/{model_name}"
-        response = requests.delete(url)
-        return response.json()
+        results = [requests.delete(f"{endpoint.url}/models/{model_name}").json() for endpoint in self.endpoints]
+        return results[0]
+
+    def prepare_onnx(self, model_path: str) -> str:
+        if self.artifact_cache is not None:
+            # Reuse the export from an earlier deploy of the same weights and settings.
+            settings = {"opset": ONNX_OPSET, "optimization_level": self.optimization_level, "quantize": self.quantize}
+            key = self.artifact_cache.make_key(model_path, settings)
+            directory = self.artifact_cache.get_or_build(key, lambda staging: self._build_onnx(model_path, staging))
+        else:
+            directory = f"{model_path}_onnx"
+            self._build_onnx(model_path, directory)
+        artifact = "model_quantized.onnx" if self.quantize else "model_optimized.onnx"
+        return os.path.join(directory, artifact)
+
+    def _build_onnx(self, model_path: str, directory: str):
+        # Export, optimize and optionally quantize; report.json next to the model records the
+        # size and CPU latency after each step.
+        optimize_model(model_path, directory, self.optimization_level, self.quantize,
+                       benchmark_shape=(1, 32) if self.benchmark_onnx else None)
+
+class AsyncNIMClient(NIMClient):
+    # With hedge set and more than one replica, an inference call still running after the
+    # endpoint pool's hedge delay (the recent p95) is duplicated to another replica, and the
+    # first response wins.
+    def __init__(self, base_url: Union[str, Sequence[str], EndpointPool], pool_size: int = 100, request_timeout: float = 30.0,
+                 keepalive_timeout: float = 30.0, wire_format: str = "binary", tracer: Optional[Tracer] = None,
+                 artifact_cache: Optional[ArtifactCache] = None, optimization_level: str = "extended",
+                 quantize: bool = False, benchmark_onnx: bool = True, hedge: bool = False):
+        super().__init__(base_url, artifact_cache, optimization_level, quantize, benchmark_onnx)
+        if wire_format not in ("binary", "json"):
+            raise ValueError(f"Unknown wire format: {wire_format}")
+        self.pool_size = pool_size
+        self.request_timeout = request_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.wire_format = wire_format
+        self.tracer = tracer or Tracer()
+        self.hedge = hedge
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # The session is created lazily so that it binds to the running event loop.
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+        return self._session
+
+    async def _request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        async with self._get_session().request(method, url, **kwargs) as response:
+            response.raise_for_status()
+            return await self._read_response(response)
+
+    async def _read_response(self, response: aiohttp.ClientResponse) -> Dict[str, Any]:
+        if response.content_type == TENSOR_CONTENT_TYPE:
+            return decode_tensors(await response.read())
+        return await response.json(content_type=None)
+
+    async def deploy_model(self, model_name: str, model_path: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        optimized_onnx_path = await loop.run_in_executor(None, self.prepare_onnx, model_path)
+        results = await asyncio.gather(*[
+            self._request("POST", f"{endpoint.url}/models/{model_name}", timeout, json={"model_path": optimized_onnx_path})
+            for endpoint in self.endpoints
+        ])
+        return results[0]
+
+    async def inference(self, model_name: str, input_data: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        path = f"/models/{model_name}/infer"
+        if self.wire_format == "binary":
+            payload = {key: np.asarray(value) if isinstance(value, (list, tuple)) else value for key, value in input_data.items()}
+            with self.tracer.span("encode"):
+                body = encode_tensors(payload)
+            headers = {"Content-Type": TENSOR_CONTENT_TYPE, "Accept": f"{TENSOR_CONTENT_TYPE}, application/json"}
+            result = await self._send(path, body, headers, timeout)
+            if result is not None:
+                return result
+        with self.tracer.span("encode"):
+            body = json.dumps(_to_json_payload(input_data)).encode("utf-8")
+        return await self._send(path, body, {"Content-Type": "application/json"}, timeout)
+
+    async def _send(self, path: str, body: bytes, headers: Dict[str, str],
+                    timeout: Optional[float]) -> Optional[Dict[str, Any]]:
+        primary = self.endpoints.pick()
+        delay = self.endpoints.hedge_delay() if self.hedge and len(self.endpoints.available()) > 1 else None
+        if delay is None or not self.endpoints.hedge_allowed():
+            self.endpoints.record_request(hedged=False)
+            return await self._call(primary, path, body, headers, timeout)
+
+        attempts = {asyncio.ensure_future(self._call(primary, path, body, headers, timeout))}
+        hedged = False
+        error: Optional[BaseException] = None
+        try:
+            while attempts:
+                done, attempts = await asyncio.wait(attempts, timeout=None if hedged else delay,
+                                                    return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result()
+                    error = attempt.exception()
+                if not hedged:
+                    # The primary is slower than the recent p95, or failed: try another replica.
+                    hedged = True
+                    backup = self.endpoints.pick(exclude=[primary])
+                    if backup is not None:
+                        attempts.add(asyncio.ensure_future(self._call(backup, path, body, headers, timeout)))
+            raise error
+        finally:
+            self.endpoints.record_request(hedged)
+            for attempt in attempts:
+                attempt.cancel()
+
+    async def _call(self, endpoint: Endpoint, path: str, body: bytes, headers: Dict[str, str],
+                    timeout: Optional[float]) -> Optional[Dict[str, Any]]:
+        endpoint.outstanding += 1
+        start_time = time.perf_counter()
+        try:
+            result = await self._post_inference(endpoint.url + path, body, headers, timeout)
+        except asyncio.CancelledError:
+            self.endpoints.record_cancelled(endpoint, time.perf_counter() - start_time)
+            raise
+        except aiohttp.ClientResponseError as e:
+            # A 4xx is the request's fault, not the replica's.
+            if e.status >= 500:
+                self.endpoints.record_failure(endpoint)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.endpoints.record_failure(endpoint)
+            raise
+        finally:
+            endpoint.outstanding -= 1
+        self.endpoints.record_success(endpoint, time.perf_counter() - start_time)
+        return result
+
+    async def _post_inference(self, url: str, body: bytes, headers: Dict[str, str],
+                              timeout: Optional[float]) -> Optional[Dict[str, Any]]:
+        kwargs = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout is not None else {}
+        with self.tracer.span("nim_round_trip"):
+            async with self._get_session().post(url, data=body, headers=headers, **kwargs) as response:
+                if response.status == 415 and headers["Content-Type"] == TENSOR_CONTENT_TYPE:
+                    # The server does not speak the tensor format; stay on JSON from now on.
+                    self.wire_format = "json"
+                    return None
+                response.raise_for_status()
+                content_type = response.content_type
+                raw = await response.read()
+        with self.tracer.span("decode"):
+            if content_type == TENSOR_CONTENT_TYPE:
+                return decode_tensors(raw)
+            return json.loads(raw)
+
+    async def stream_inference(self, model_name: str, input_data: Dict[str, Any],
+                               parameters: Optional[Dict[str, Any]] = None,
+                               timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        endpoint = self.endpoints.pick()
+        url = f"{endpoint.url}/models/{model_name}/infer/stream"
+        payload = _to_json_payload(input_data)
+        if parameters:
+            payload["parameters"] = parameters
+        # A generation can legitimately outlast request_timeout, so only bound the gap between chunks.
+        read_timeout = timeout if timeout is not None else self.request_timeout
+        client_timeout = aiohttp.ClientTimeout(total=None, sock_read=read_timeout)
+        headers = {"Accept": "application/x-ndjson, text/event-stream"}
+        endpoint.outstanding += 1
+        try:
+            async with self._get_session().post(url, json=payload, headers=headers, timeout=client_timeout) as response:
+                response.raise_for_status()
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    # Accept both NDJSON and server-sent event framing.
+                    if line.startswith("data:"):
+                        line = line[len("data:"):].strip()
+                    elif line.startswith((":", "event:", "id:", "retry:")):
+                        continue
+                    if not line:
+                        continue
+                    if line == "[DONE]":
+                        break
+                    yield json.loads(line)
+        finally:
+            endpoint.outstanding -= 1
+
+    async def get_model_status(self, model_name: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        url = f"{self.endpoints.pick().url}/models/{model_name}/status"
+        return await self._request("GET", url, timeout)
+
+    async def undeploy_model(self, model_name: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        results = await asyncio.gather(*[
+            self._request("DELETE", f"{endpoint.url}/models/{model_name}", timeout) for endpoint in self.endpoints
+        ])
+        return results[0]
+
+    async def check_endpoints(self, path: str = HEALTH_CHECK_PATH, timeout: float = 2.0) -> Dict[str, bool]:
+        # Probes every replica; replicas that cannot be reached or answer with a 5xx are ejected
+        # from routing, and replicas that answer are put back. Like in _call, a 4xx means the
+        # replica is up.
+        async def check(endpoint: Endpoint) -> bool:
+            try:
+                async with self._get_session().get(endpoint.url + path, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    healthy = response.status < 500
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                healthy = False
+            if healthy:
+                self.endpoints.reinstate(endpoint)
+            else:
+                self.endpoints.eject(endpoint)
+            return healthy
+
+        results = await asyncio.gather(*[check(endpoint) for endpoint in self.endpoints])
+        return {endpoint.url: healthy for endpoint, healthy in zip(self.endpoints, results)}
+
+    def start_health_checks(self, path: str = HEALTH_CHECK_PATH, interval: float = 10.0):
+        async def run():
+            while True:
+                await self.check_endpoints(path)
+                await asyncio.sleep(interval)
+
+        if self._health_task is None:
+            self._health_task = asyncio.get_running_loop().create_task(run())
 
-    def _convert_to_onnx(self, model_path: str, onnx_path: str):
-        # Implementation of PyTorch to ONNX conversion
-        pass
-
-    def _optimize_onnx(self, onnx_path: str, optimized_onnx_path: str):
-        onnx_model = onnx.load(onnx_path)
-        optimized_model = onnxruntime.optimize_model(
-            onnx_model,
-            ["eliminate_unused_initializer", "fuse_matmul_add_bias_into_gemm"]
-        )
-        onnx.save(optimized_model, optimized_onnx_path)
\ No newline at end of file
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set
+import numpy as np
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+def estimate_size(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 96
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value) + 48
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(estimate_size(v) for v in value)
+    return 32
+
+def detach(value: Any) -> Any:
+    # Results are often views into a whole batch's response buffer (unpadded rows, zero-copy
+    # decoded tensors). Cache a compact copy so the budget bounds what the cache keeps alive.
+    if isinstance(value, np.ndarray):
+        return value.copy() if value.base is not None else value
+    if isinstance(value, dict):
+        return {k: detach(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [detach(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(detach(v) for v in value)
+    return value
+
+class CacheEntry:
+    def __init__(self, model_name: str, value: Any, size: int, expires_at: float):
+        self.model_name = model_name
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl: float = 300.0, monitoring=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.monitoring = monitoring
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._keys_by_model: Dict[str, Set[str]] = {}
+        self._generations: Dict[str, int] = {}
+
+    @staticmethod
+    def make_key(model_name: str, input_text: str, parameters: Optional[Dict[str, Any]] = None) -> str:
+        material = json.dumps([model_name, normalize_text(input_text), parameters or {}], sort_keys=True, default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def generation(self, model_name: str) -> int:
+        return self._generations.get(model_name, 0)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            if self.monitoring is not None:
+                self.monitoring.record_cache_miss()
+            return None
+        self._entries.move_to_end(key)
+        if self.monitoring is not None:
+            self.monitoring.record_cache_hit()
+        return entry.value
+
+    def put(self, key: str, model_name: str, value: Any, generation: Optional[int] = None):
+        # A result computed before the model was redeployed must not be cached.
+        if generation is not None and generation != self.generation(model_name):
+            return
+        value = detach(value)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = CacheEntry(model_name, value, size, time.monotonic() + self.ttl)
+        self._keys_by_model.setdefault(model_name, set()).add(key)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            if self.monitoring is not None:
+                self.monitoring.record_cache_eviction()
+        self._update_size()
+
+    def invalidate_model(self, model_name: str):
+        self._generations[model_name] = self.generation(model_name) + 1
+        for key in list(self._keys_by_model.get(model_name, ())):
+            self._remove(key)
+        self._update_size()
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_model.clear()
+        self.current_bytes = 0
+        self._update_size()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.current_bytes -= entry.size
+        keys = self._keys_by_model.get(entry.model_name)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_model[entry.model_name]
+
+    def _update_size(self):
+        if self.monitoring is not None:
+            self.monitoring.update_cache_size(self.current_bytes, len(self._entries))
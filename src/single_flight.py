@@ -0,0 +1,40 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class SingleFlight:
+    def __init__(self, monitoring=None):
+        self.monitoring = monitoring
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        elif self.monitoring is not None:
+            self.monitoring.record_coalesced_request()
+
+        self._waiters[key] += 1
+        try:
+            # Shielded so one caller giving up does not cancel the work for the others.
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._in_flight.get(key) is task:
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0:
+                    task.cancel()
+            raise
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            del self._waiters[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved when every waiter has already gone.
+            task.exception()
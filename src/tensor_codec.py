@@ -0,0 +1,66 @@
+import json
+import struct
+from typing import Dict, Any, Union
+import numpy as np
+
+TENSOR_CONTENT_TYPE = "application/x-nim-tensor"
+
+# Wire layout: MAGIC | uint32 little-endian header length | JSON header | tensor buffers.
+# Buffers start at ALIGNMENT-byte offsets so every decoded view is aligned for its dtype.
+MAGIC = b"NIMT"
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<4sI")
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def encode_tensors(data: Dict[str, Any]) -> bytearray:
+    tensors = {}
+    meta = {}
+    for name, value in data.items():
+        if isinstance(value, np.ndarray):
+            if value.dtype.hasobject:
+                raise ValueError(f"Cannot encode object array '{name}'")
+            tensors[name] = np.ascontiguousarray(value)
+        else:
+            meta[name] = value
+
+    # Offsets are relative to the start of the data section, so the header can be
+    # sized before it is written.
+    header = {"tensors": {}, "meta": meta}
+    offset = 0
+    for name, array in tensors.items():
+        offset = _align(offset)
+        header["tensors"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    data_start = _align(_PREFIX.size + len(header_bytes))
+
+    body = bytearray(data_start + offset)
+    _PREFIX.pack_into(body, 0, MAGIC, len(header_bytes))
+    body[_PREFIX.size:_PREFIX.size + len(header_bytes)] = header_bytes
+    view = memoryview(body)
+    for name, array in tensors.items():
+        start = data_start + header["tensors"][name]["offset"]
+        view[start:start + array.nbytes] = array.reshape(-1).view(np.uint8)
+    return body
+
+def decode_tensors(buffer: Union[bytes, bytearray, memoryview]) -> Dict[str, Any]:
+    magic, header_length = _PREFIX.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a NIM tensor payload")
+    header_end = _PREFIX.size + header_length
+    header = json.loads(bytes(buffer[_PREFIX.size:header_end]).decode("utf-8"))
+    data_start = _align(header_end)
+
+    result = dict(header.get("meta", {}))
+    for name, spec in header["tensors"].items():
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        count = int(np.prod(shape, dtype=np.int64))
+        if count == 0:
+            result[name] = np.empty(shape, dtype=dtype)
+            continue
+        # np.frombuffer returns a view over the response body; no copy is made.
+        result[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + spec["offset"]).reshape(shape)
+    return result
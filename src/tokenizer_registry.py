@@ -0,0 +1,123 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+
+def _special_ids(tokenizer) -> Tuple[int, Optional[int]]:
+    eos_token_id = tokenizer.eos_token_id if isinstance(tokenizer.eos_token_id, int) else None
+    pad_token_id = tokenizer.pad_token_id if isinstance(tokenizer.pad_token_id, int) else eos_token_id
+    return (pad_token_id if pad_token_id is not None else 0), eos_token_id
+
+class TokenizerRegistry:
+    def __init__(self, model_config: Optional[Dict[str, Dict[str, Any]]] = None, max_loaded: int = 8,
+                 num_workers: int = 4):
+        self.model_config = model_config or {}
+        self.max_loaded = max_loaded
+        self._tokenizers: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        # Fast tokenizers release the GIL while encoding, so threads are enough to
+        # keep tokenization off the event loop without pickling text to a process pool.
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="tokenizer")
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        # (pad, eos) ids recorded when a tokenizer loads. Eviction keeps them, so the batch loop can
+        # read them without reloading a tokenizer on the event loop.
+        self._special_ids: Dict[str, Tuple[int, Optional[int]]] = {}
+
+    def get(self, model_name: str):
+        with self._lock:
+            tokenizer = self._tokenizers.get(model_name)
+            if tokenizer is not None:
+                self._tokenizers.move_to_end(model_name)
+                return tokenizer
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        # Only one thread loads a given tokenizer; the others wait and reuse it.
+        with load_lock:
+            with self._lock:
+                tokenizer = self._tokenizers.get(model_name)
+            if tokenizer is None:
+                from transformers import AutoTokenizer
+
+                model_path = self.model_config.get(model_name, {}).get("model_path", model_name)
+                tokenizer = AutoTokenizer.from_pretrained(model_path)
+            with self._lock:
+                self._special_ids[model_name] = _special_ids(tokenizer)
+                self._tokenizers[model_name] = tokenizer
+                self._tokenizers.move_to_end(model_name)
+                while len(self._tokenizers) > self.max_loaded:
+                    self._tokenizers.popitem(last=False)
+        return tokenizer
+
+    def evict(self, model_name: str):
+        with self._lock:
+            self._tokenizers.pop(model_name, None)
+
+    def loaded_models(self) -> List[str]:
+        with self._lock:
+            return list(self._tokenizers)
+
+    def special_ids(self, model_name: str) -> Tuple[int, Optional[int]]:
+        # Requests are tokenized before they are batched, so the ids are normally recorded
+        # already; only a model that was never tokenized loads its tokenizer here.
+        with self._lock:
+            special_ids = self._special_ids.get(model_name)
+        if special_ids is None:
+            self.get(model_name)
+            with self._lock:
+                special_ids = self._special_ids[model_name]
+        return special_ids
+
+    def pad_token_id(self, model_name: str) -> int:
+        return self.special_ids(model_name)[0]
+
+    def eos_token_id(self, model_name: str) -> Optional[int]:
+        return self.special_ids(model_name)[1]
+
+    def encode_batch(self, model_name: str, texts: List[str]) -> List[Dict[str, np.ndarray]]:
+        encoded = self.get(model_name)(texts, truncation=True, return_attention_mask=True)
+        return [
+            {"input_ids": np.asarray(input_ids, dtype=np.int64), "attention_mask": np.asarray(attention_mask, dtype=np.int64)}
+            for input_ids, attention_mask in zip(encoded["input_ids"], encoded["attention_mask"])
+        ]
+
+    async def tokenize_batch(self, model_name: str, texts: List[str]) -> List[Dict[str, np.ndarray]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.encode_batch, model_name, list(texts))
+
+    async def tokenize(self, model_name: str, text: str) -> Dict[str, np.ndarray]:
+        # Calls made in the same event-loop iteration are encoded together in one batch.
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(model_name, [])
+        pending.append((text, future))
+        if len(pending) == 1:
+            loop.call_soon(self._flush, model_name)
+        return await future
+
+    def _flush(self, model_name: str):
+        pending = self._pending.pop(model_name, [])
+        if not pending:
+            return
+        task = asyncio.ensure_future(self.tokenize_batch(model_name, [text for text, _ in pending]))
+        task.add_done_callback(partial(self._resolve, pending))
+
+    def _resolve(self, pending: List[Tuple[str, asyncio.Future]], task: asyncio.Future):
+        if task.cancelled():
+            for _, future in pending:
+                future.cancel()
+            return
+        error = task.exception()
+        for index, (_, future) in enumerate(pending):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(task.result()[index])
+
+    def close(self):
+        self._executor.shutdown(wait=False)
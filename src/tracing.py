@@ -0,0 +1,115 @@
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+class Trace:
+    def __init__(self, name: str, model_name: str, sampled: bool):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.model_name = model_name
+        self.sampled = sampled
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+
+    def add_span(self, stage: str, start: float, duration: float, **attributes):
+        if self.sampled:
+            span = {"stage": stage, "start_ms": (start - self.start) * 1e3, "duration_ms": duration * 1e3}
+            span.update(attributes)
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "model": self.model_name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration * 1e3 if self.duration is not None else None,
+            "spans": self.spans,
+        }
+
+class BatchTrace(Trace):
+    # Spans recorded while a batch runs are copied into the trace of every request in it.
+    def __init__(self, model_name: str, members: List[Optional[Trace]]):
+        self.members = [member for member in members if member is not None and member.sampled]
+        super().__init__("batch", model_name, bool(self.members))
+
+    def add_span(self, stage: str, start: float, duration: float, **attributes):
+        for member in self.members:
+            member.add_span(stage, start, duration, batch_id=self.trace_id, **attributes)
+
+class Tracer:
+    def __init__(self, monitoring=None, sample_rate: float = 0.0, trace_file: Optional[str] = None):
+        self.monitoring = monitoring
+        self.sample_rate = sample_rate
+        self.trace_file = trace_file
+        self._file = None
+        self._file_lock = threading.Lock()
+
+    def current(self) -> Optional[Trace]:
+        return _current_trace.get()
+
+    @contextmanager
+    def trace(self, name: str, model_name: str):
+        sampled = self.trace_file is not None and random.random() < self.sample_rate
+        trace = Trace(name, model_name, sampled)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            trace.duration = time.perf_counter() - trace.start
+            if sampled:
+                self._write(trace)
+
+    @contextmanager
+    def batch(self, model_name: str, members: List[Optional[Trace]]):
+        trace = BatchTrace(model_name, members)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+
+    @contextmanager
+    def span(self, stage: str, model_name: Optional[str] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, start=start, model_name=model_name)
+
+    def record(self, stage: str, duration: float, start: Optional[float] = None, trace: Optional[Trace] = None,
+               model_name: Optional[str] = None):
+        trace = trace or _current_trace.get()
+        if model_name is None:
+            model_name = trace.model_name if trace is not None else ""
+        if self.monitoring is not None:
+            self.monitoring.record_stage_latency(stage, model_name, duration)
+        if trace is not None:
+            trace.add_span(stage, start if start is not None else time.perf_counter() - duration, duration)
+
+    def _write(self, trace: Trace):
+        line = json.dumps(trace.to_dict()) + "\n"
+        with self._file_lock:
+            if self._file is None:
+                directory = os.path.dirname(self.trace_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.trace_file, "a", buffering=1)
+            self._file.write(line)
+
+    def close(self):
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,32 @@
+import importlib
+import importlib.abc
+import importlib.util
+import os
+import sys
+
+# Modules in src import their siblings by plain name (as `python src/main.py` runs them), while
+# tests import them through the `src` package, so both directories go on the path.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT_DIR, "src"), ROOT_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+class SrcAliasFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    # Makes `src.X` the same module object as `X`. Loaded twice, a module would register its
+    # Prometheus metrics twice and its classes would not match their copies under the other name.
+    def find_spec(self, fullname, path, target=None):
+        if fullname.startswith("src.") and fullname.count(".") == 1:
+            return importlib.util.spec_from_loader(fullname, self)
+        return None
+
+    def create_module(self, spec):
+        module = importlib.import_module(spec.name[len("src."):])
+        self._spec = module.__spec__
+        return module
+
+    def exec_module(self, module):
+        # The import system set __spec__ to the alias; keep the module's own.
+        module.__spec__ = self._spec
+
+if not any(isinstance(finder, SrcAliasFinder) for finder in sys.meta_path):
+    sys.meta_path.insert(0, SrcAliasFinder())
@@ -0,0 +1,144 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock, patch
+from src.artifact_cache import ArtifactCache
+from src.nim_client import NIMClient
+
+def write_model(directory, weights=b"weights"):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "config.json"), "w") as f:
+        f.write("{}")
+    with open(os.path.join(directory, "model.safetensors"), "wb") as f:
+        f.write(weights)
+    return directory
+
+class TestArtifactCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ArtifactCache(os.path.join(self.tmp.name, "cache"), max_bytes=1024 * 1024)
+        self.model_path = write_model(os.path.join(self.tmp.name, "model"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build_with(self, calls, payload=b"artifact"):
+        def build(directory):
+            calls.append(directory)
+            with open(os.path.join(directory, "model.onnx"), "wb") as f:
+                f.write(payload)
+        return build
+
+    def test_key_follows_weights_and_settings(self):
+        key = self.cache.make_key(self.model_path, {"opset": 17})
+        self.assertEqual(self.cache.make_key(self.model_path, {"opset": 17}), key)
+        self.assertNotEqual(self.cache.make_key(self.model_path, {"opset": 18}), key)
+        # Same weights under another path share the artifact; changed weights do not.
+        copy = write_model(os.path.join(self.tmp.name, "copy"))
+        self.assertEqual(self.cache.make_key(copy, {"opset": 17}), key)
+        write_model(self.model_path, b"retrained")
+        self.assertNotEqual(self.cache.make_key(self.model_path, {"opset": 17}), key)
+
+    @patch("huggingface_hub.HfApi.model_info")
+    def test_hub_id_key_follows_the_resolved_revision(self, model_info):
+        model_info.return_value = MagicMock(sha="a" * 40)
+        key = self.cache.make_key("gpt2", {"opset": 17})
+        self.assertEqual(self.cache.make_key("gpt2", {"opset": 17}), key)
+        # New upstream weights are a new revision, so the stale artifact no longer matches.
+        model_info.return_value = MagicMock(sha="b" * 40)
+        self.assertNotEqual(self.cache.make_key("gpt2", {"opset": 17}), key)
+
+    @patch("huggingface_hub.snapshot_download")
+    @patch("huggingface_hub.HfApi.model_info", side_effect=OSError("offline"))
+    def test_offline_hub_id_uses_the_cached_snapshot(self, model_info, snapshot_download):
+        snapshot_download.return_value = os.path.join(self.tmp.name, "snapshots", "c" * 40)
+        self.assertEqual(self.cache.hub_revision("gpt2"), "c" * 40)
+        snapshot_download.assert_called_once_with("gpt2", local_files_only=True)
+        snapshot_download.side_effect = OSError("not cached")
+        self.assertIsNone(self.cache.hub_revision("gpt2"))
+
+    def test_hit_skips_the_build(self):
+        calls = []
+        key = self.cache.make_key(self.model_path)
+        first = self.cache.get_or_build(key, self.build_with(calls))
+        second = self.cache.get_or_build(key, self.build_with(calls))
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+        with open(os.path.join(first, "model.onnx"), "rb") as f:
+            self.assertEqual(f.read(), b"artifact")
+
+    def test_failed_build_leaves_nothing_behind(self):
+        def build(directory):
+            with open(os.path.join(directory, "model.onnx"), "wb") as f:
+                f.write(b"partial")
+            raise RuntimeError("export failed")
+
+        key = self.cache.make_key(self.model_path)
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_build(key, build)
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+    def test_concurrent_deploys_build_once(self):
+        calls = []
+        key = self.cache.make_key(self.model_path)
+
+        def slow_build(directory):
+            time.sleep(0.05)
+            self.build_with(calls)(directory)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_build(key, slow_build)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(results)), 1)
+
+    def test_losing_a_race_with_another_process_keeps_the_winner(self):
+        key = self.cache.make_key(self.model_path)
+
+        def racing_build(directory):
+            # Another process renames its finished entry into place while this one builds.
+            other = ArtifactCache(self.cache.directory)
+            other.get_or_build(key, self.build_with([], b"winner"))
+            self.build_with([], b"loser")(directory)
+
+        path = self.cache.get_or_build(key, racing_build)
+        with open(os.path.join(path, "model.onnx"), "rb") as f:
+            self.assertEqual(f.read(), b"winner")
+        self.assertEqual([name for name in os.listdir(self.cache.directory) if name.startswith(".")], [])
+
+    def test_evicts_least_recently_used_over_budget(self):
+        self.cache.max_bytes = 2500
+        keys = [self.cache.make_key(self.model_path, {"variant": i}) for i in range(3)]
+        for index, key in enumerate(keys[:2]):
+            path = self.cache.get_or_build(key, self.build_with([], b"x" * 1000))
+            os.utime(path, (index, index))
+        # Touching the older entry makes the other one the eviction candidate.
+        self.cache.get(keys[0])
+        self.cache.get_or_build(keys[2], self.build_with([], b"x" * 1000))
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+        self.assertLessEqual(self.cache.size(), 2500)
+
+    def test_nim_client_reuses_the_export(self):
+        client = NIMClient("http://localhost:8000", artifact_cache=self.cache)
+        with patch.object(client, "_build_onnx") as mock_build, patch("requests.post") as mock_post:
+            mock_build.side_effect = lambda source, directory: open(os.path.join(directory, "model_optimized.onnx"), "wb").close()
+            mock_post.return_value = MagicMock()
+            client.deploy_model("gpt2", self.model_path)
+            client.deploy_model("gpt2", self.model_path)
+        mock_build.assert_called_once()
+        first, second = (call.kwargs["json"]["model_path"] for call in mock_post.call_args_list)
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith(self.cache.directory))
+        self.assertTrue(os.path.exists(first))
+
+if __name__ == '__main__':
+    unittest.main()
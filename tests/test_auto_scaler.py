@@ -0,0 +1,228 @@
+import unittest
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from kubernetes import client
+from prometheus_client import CollectorRegistry, REGISTRY
+from src.auto_scaler import AutoScaler, ScalingController, windowed_percentile
+from src.monitoring import Monitoring
+
+SCALE_PATH = re.compile(r"^/apis/apps/v1/namespaces/([^/]+)/deployments/([^/]+)/scale$")
+LEASE_PATH = re.compile(r"^/apis/coordination.k8s.io/v1/namespaces/([^/]+)/leases(?:/([^/]+))?$")
+
+class FakeKubernetesAPI(BaseHTTPRequestHandler):
+    # Just enough of the apps/v1 scale subresource and coordination/v1 leases for AutoScaler.
+    replicas = {}
+    patches = []
+    leases = {}
+    # Answer every request with 403, as for a service account without the RBAC rules.
+    forbidden = False
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _lease(self):
+        # Returns (namespace, name, body) for lease requests, None for anything else.
+        match = LEASE_PATH.match(self.path.split("?")[0])
+        if match is None:
+            return None
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        namespace, name = match.groups()
+        return namespace, name or body["metadata"]["name"], body
+
+    def _handle_lease(self, method):
+        namespace, name, body = self._lease()
+        stored = self.leases.get((namespace, name))
+        if method == "GET":
+            if stored is None:
+                return self._send_json(404, {"kind": "Status", "code": 404})
+            return self._send_json(200, stored)
+        if method == "POST" and stored is not None:
+            return self._send_json(409, {"kind": "Status", "code": 409})
+        if method == "PUT" and (stored is None or body["metadata"].get("resourceVersion") != stored["metadata"]["resourceVersion"]):
+            return self._send_json(409, {"kind": "Status", "code": 409})
+        version = int(stored["metadata"]["resourceVersion"]) + 1 if stored else 1
+        body["metadata"]["resourceVersion"] = str(version)
+        self.leases[(namespace, name)] = body
+        self._send_json(201 if method == "POST" else 200, body)
+
+    def _scale(self):
+        match = SCALE_PATH.match(self.path.split("?")[0])
+        if match is None or match.groups() not in self.replicas:
+            self.send_error(404)
+            return None
+        return match.groups()
+
+    def _reply(self, key):
+        namespace, name = key
+        self._send_json(200, {
+            "apiVersion": "autoscaling/v1",
+            "kind": "Scale",
+            "metadata": {"name": name, "namespace": namespace},
+            "spec": {"replicas": self.replicas[key]},
+            "status": {"replicas": self.replicas[key]},
+        })
+
+    def do_POST(self):
+        self._handle_lease("POST")
+
+    def do_PUT(self):
+        self._handle_lease("PUT")
+
+    def do_GET(self):
+        if self.forbidden:
+            return self._send_json(403, {"kind": "Status", "code": 403, "reason": "Forbidden"})
+        if LEASE_PATH.match(self.path.split("?")[0]):
+            return self._handle_lease("GET")
+        key = self._scale()
+        if key is not None:
+            self._reply(key)
+
+    def do_PATCH(self):
+        key = self._scale()
+        if key is None:
+            return
+        patch = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.replicas[key] = patch["spec"]["replicas"]
+        self.patches.append(patch["spec"]["replicas"])
+        self._reply(key)
+
+class TestAutoScaler(unittest.TestCase):
+    def setUp(self):
+        FakeKubernetesAPI.replicas = {("genai", "nim-gen-ai"): 2}
+        FakeKubernetesAPI.patches = []
+        FakeKubernetesAPI.leases = {}
+        FakeKubernetesAPI.forbidden = False
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeKubernetesAPI)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        api_client = client.ApiClient(client.Configuration(host=f"http://127.0.0.1:{self.server.server_port}"))
+        self.auto_scaler = AutoScaler(api_client)
+        self.monitoring = Monitoring(port=None, latency_buckets=[0.1, 0.25, 0.5, 1.0, 2.5],
+                                     registry=CollectorRegistry())
+        self.depth = 0
+        self.monitoring.track_queue_depth(lambda: self.depth)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def controller(self, **kwargs):
+        options = dict(min_replicas=1, max_replicas=10, target_queue_depth=10, target_request_rate=100,
+                       target_p95=0.5, lookahead=0, scale_down_cooldown=300)
+        options.update(kwargs)
+        return ScalingController(self.auto_scaler, self.monitoring, "nim-gen-ai", "genai", **options)
+
+    def serve(self, requests, latency=0.05):
+        for _ in range(requests):
+            self.monitoring.record_inference_request()
+            self.monitoring.record_request_latency("inference", "gpt2", latency)
+
+    def test_scale_deployment_round_trip(self):
+        self.assertEqual(self.auto_scaler.get_replicas("nim-gen-ai", "genai"), 2)
+        self.auto_scaler.scale_deployment("nim-gen-ai", "genai", 5)
+        self.assertEqual(self.auto_scaler.get_replicas("nim-gen-ai", "genai"), 5)
+
+    def test_deep_queue_scales_up_at_once(self):
+        controller = self.controller()
+        self.assertIsNone(controller.tick(now=0))
+        self.depth = 30
+        self.serve(50)
+        # 30 queued against a target of 10: three times the load on two replicas.
+        self.assertEqual(controller.tick(now=1), 6)
+        self.assertEqual(FakeKubernetesAPI.replicas[("genai", "nim-gen-ai")], 6)
+
+    def test_slow_requests_scale_up(self):
+        controller = self.controller()
+        controller.tick(now=0)
+        self.serve(20, latency=1.5)
+        self.assertGreater(controller.tick(now=1), 2)
+
+    def test_rising_request_rate_scales_ahead_of_demand(self):
+        predictive = self.controller(lookahead=30)
+        reactive = self.controller(lookahead=0)
+        predictive.observe(0.0)
+        reactive.observe(0.0)
+        for tick, rate in enumerate((60, 70, 80, 90), start=1):
+            self.serve(rate)
+            signals = predictive.observe(float(tick)), reactive.observe(float(tick))
+        # Both see 90 rps now, within tolerance of 100; only the trend predicts the overload.
+        self.assertEqual(signals[1]["request_rate"], 90)
+        self.assertLessEqual(reactive.load_ratio(signals[1]), 1.1)
+        self.assertGreater(predictive.load_ratio(signals[0]), 1.1)
+
+    def test_load_within_tolerance_does_not_scale(self):
+        controller = self.controller()
+        controller.tick(now=0)
+        for tick in range(1, 10):
+            self.depth = 9.5 if tick % 2 else 10.5
+            self.assertIsNone(controller.tick(now=float(tick)))
+        self.assertEqual(FakeKubernetesAPI.patches, [])
+
+    def test_scale_down_waits_for_cooldown(self):
+        controller = self.controller(scale_down_cooldown=60)
+        controller.tick(now=0)
+        self.depth = 40
+        self.assertEqual(controller.tick(now=1), 8)
+        self.depth = 0
+        for now in range(2, 61, 10):
+            self.assertIsNone(controller.tick(now=float(now)))
+        self.assertEqual(controller.tick(now=62), 1)
+        self.assertEqual(FakeKubernetesAPI.patches, [8, 1])
+
+    def test_replicas_stay_within_bounds(self):
+        controller = self.controller(max_replicas=4)
+        controller.tick(now=0)
+        self.depth = 1000
+        self.assertEqual(controller.tick(now=1), 4)
+
+    def test_only_the_lease_holder_scales(self):
+        first = self.controller(lease_name="autoscaler", identity="pod-a", interval=10)
+        second = self.controller(lease_name="autoscaler", identity="pod-b", interval=10)
+        for controller in (first, second):
+            controller.tick(now=0)
+        self.depth = 30
+        self.assertIsNone(second.tick(now=1))
+        self.assertEqual(first.tick(now=1), 6)
+        self.assertEqual(FakeKubernetesAPI.patches, [6])
+        lease = FakeKubernetesAPI.leases[("genai", "autoscaler")]
+        self.assertEqual(lease["spec"]["holderIdentity"], "pod-a")
+        self.assertEqual(lease["spec"]["leaseDurationSeconds"], 30)
+
+        # pod-a stops renewing; once the lease runs out, pod-b takes over.
+        lease["spec"]["renewTime"] = "2000-01-01T00:00:00.000000Z"
+        self.assertIsNone(second.tick(now=2))
+        self.assertEqual(FakeKubernetesAPI.leases[("genai", "autoscaler")]["spec"]["holderIdentity"], "pod-b")
+        self.assertEqual(FakeKubernetesAPI.leases[("genai", "autoscaler")]["spec"]["leaseTransitions"], 1)
+        self.assertIsNone(first.tick(now=3))
+        self.depth = 90
+        self.assertEqual(second.tick(now=3), 10)
+
+    def test_failed_ticks_are_logged_and_counted(self):
+        FakeKubernetesAPI.forbidden = True
+        controller = self.controller(lease_name="autoscaler", identity="pod-a")
+        before = REGISTRY.get_sample_value("autoscaler_errors_total", {"reason": "403"}) or 0.0
+        with self.assertLogs("auto_scaler", level="ERROR") as logs:
+            controller._safe_tick()
+        self.assertIn("genai/nim-gen-ai failed (403)", logs.output[0])
+        self.assertEqual(REGISTRY.get_sample_value("autoscaler_errors_total", {"reason": "403"}) - before, 1)
+        self.assertIsNone(controller.replicas)
+
+class TestWindowedPercentile(unittest.TestCase):
+    def test_uses_only_observations_since_the_previous_snapshot(self):
+        previous = [(0.1, 100), (1.0, 100), (float("inf"), 100)]
+        current = [(0.1, 100), (1.0, 200), (float("inf"), 200)]
+        self.assertAlmostEqual(windowed_percentile(previous, current, 95), 0.955)
+        self.assertIsNone(windowed_percentile(current, current, 95))
+
+if __name__ == '__main__':
+    unittest.main()
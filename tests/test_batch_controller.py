@@ -0,0 +1,120 @@
+import unittest
+import asyncio
+from unittest.mock import ANY, MagicMock
+from src.batch_controller import AdaptiveBatchController, LatencyCurve
+from src.dynamic_batcher import DynamicBatcher
+
+def batch_latency(batch_size):
+    return 0.01 + 0.002 * batch_size
+
+class TestLatencyCurve(unittest.TestCase):
+    def test_fits_a_linear_batch_latency_curve(self):
+        curve = LatencyCurve()
+        self.assertIsNone(curve.predict(8))
+        for batch_size in (1, 4, 8, 16, 4, 1):
+            curve.observe(batch_size, batch_latency(batch_size))
+        intercept, slope = curve.fit()
+        self.assertAlmostEqual(intercept, 0.01, places=6)
+        self.assertAlmostEqual(slope, 0.002, places=6)
+
+    def test_needs_more_than_one_batch_size(self):
+        curve = LatencyCurve()
+        for _ in range(5):
+            curve.observe(8, 0.02)
+        self.assertIsNone(curve.fit())
+
+class TestAdaptiveBatchController(unittest.TestCase):
+    def simulate(self, controller, arrival_rate, extra_latency=0.0, decisions=8, max_batch_size=64, max_window=0.05):
+        # Serve alternating full and half-full batches at the controller's current limits, with
+        # arrivals at a steady rate and each request waiting for its batch to fill. Requests never
+        # queue behind other batches, so controllers here get enough concurrency to keep up.
+        now = 0.0
+        made = []
+        while len(made) < decisions:
+            batch_size, window = controller.limits("gpt2") or (max_batch_size, max_window)
+            for size in (batch_size, max(1, batch_size // 2)):
+                for _ in range(size):
+                    controller.observe_arrival("gpt2")
+                now += size / arrival_rate
+                latency = batch_latency(size)
+                wait = min((size - 1) / arrival_rate, window)
+                decision = controller.observe_batch("gpt2", size, latency, [wait + latency + extra_latency] * size,
+                                                    now, max_batch_size, max_window)
+                if decision is not None:
+                    made.append(decision)
+        return made[-1]
+
+    def test_busy_model_gets_large_batches(self):
+        controller = AdaptiveBatchController(target_p95=0.1, decision_interval=1.0, concurrency=8)
+        batch_size, window = self.simulate(controller, arrival_rate=1000)
+        # (b - 1) / 1000 + 0.01 + 0.002 * b must fit in 80% of the 100ms target.
+        self.assertEqual(batch_size, 23)
+        self.assertAlmostEqual(window, 0.022, places=3)
+
+    def test_quiet_model_gets_smaller_batches_and_waits_less(self):
+        controller = AdaptiveBatchController(target_p95=0.05, decision_interval=1.0, concurrency=8)
+        busy = self.simulate(AdaptiveBatchController(target_p95=0.05, decision_interval=1.0, concurrency=8), arrival_rate=1000)
+        quiet = self.simulate(controller, arrival_rate=100)
+        self.assertLess(quiet[0], busy[0])
+        self.assertGreaterEqual(quiet[0], 1)
+
+    def test_backs_off_when_p95_is_over_target(self):
+        controller = AdaptiveBatchController(target_p95=0.1, decision_interval=1.0, backoff=0.5, concurrency=8)
+        batch_size, window = self.simulate(controller, arrival_rate=1000, extra_latency=0.5, decisions=2)
+        self.assertEqual(batch_size, 16)
+        self.assertAlmostEqual(window, 0.0125)
+
+    def test_decisions_are_reported_to_monitoring(self):
+        monitoring = MagicMock()
+        controller = AdaptiveBatchController(target_p95=0.1, decision_interval=1.0, concurrency=8, monitoring=monitoring)
+        batch_size, window = self.simulate(controller, arrival_rate=1000, decisions=1)
+        monitoring.update_batching_decision.assert_called_with("gpt2", batch_size, window, ANY, ANY)
+        self.assertAlmostEqual(monitoring.update_batching_decision.call_args[0][3], 1000.0, delta=100)
+
+    def test_overload_backoff_keeps_enough_throughput_to_drain_the_queue(self):
+        # One batch at a time, 300 requests/s, and a burst of 1500 requests already queued. Every
+        # request waits behind the queue, so p95 is over target until the backlog is gone.
+        controller = AdaptiveBatchController(target_p95=0.1, decision_interval=1.0, backoff=0.5)
+        arrival_rate, max_batch_size = 300.0, 64
+        now, queued, arrivals = 0.0, 1500.0, 0.0
+        batch_sizes = []
+        while now < 60.0:
+            batch_size = min(controller.limits("gpt2")[0] if controller.limits("gpt2") else max_batch_size,
+                             max(1, int(queued)))
+            latency = batch_latency(batch_size)
+            waits = [queued / batch_size * latency + latency] * batch_size
+            queued -= batch_size
+            now += latency
+            arrivals += arrival_rate * latency
+            queued += arrival_rate * latency
+            for _ in range(int(arrivals)):
+                controller.observe_arrival("gpt2")
+            arrivals -= int(arrivals)
+            if controller.observe_batch("gpt2", batch_size, latency, waits, now, max_batch_size, 0.05):
+                batch_sizes.append(controller.limits("gpt2")[0])
+        # Keeping up with 300/s needs b / (0.01 + 0.002 * b) >= 300, so b >= 8.
+        self.assertGreaterEqual(min(batch_sizes), 8)
+        self.assertLess(queued, 20)
+
+class TestAdaptiveBatching(unittest.TestCase):
+    def test_batcher_applies_controller_decisions(self):
+        async def handler(model_name, batch):
+            await asyncio.sleep(0.001 * len(batch))
+            return [None for _ in batch]
+
+        async def test():
+            controller = AdaptiveBatchController(target_p95=0.005, min_window=0.0005, decision_interval=0.0)
+            batcher = DynamicBatcher(max_batch_size=32, max_latency=0.05, batch_handler=handler, controller=controller)
+            for _ in range(5):
+                await asyncio.gather(*[batcher.add_request("gpt2", {"input": i}) for i in range(8)])
+            batch_size, window = controller.limits("gpt2")
+            self.assertLess(batch_size, 32)
+            self.assertLess(window, 0.05)
+            self.assertEqual(batcher.get_queue("gpt2").max_batch_size, batch_size)
+            self.assertEqual(batcher.batch_limits("gpt2"), (batch_size, window))
+            await batcher.stop()
+
+        asyncio.run(test())
+
+if __name__ == '__main__':
+    unittest.main()
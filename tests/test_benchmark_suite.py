@@ -0,0 +1,61 @@
+import unittest
+import asyncio
+import json
+import os
+from unittest.mock import patch
+import numpy as np
+from aiohttp.test_utils import TestServer
+from benchmarks.stub_nim_server import StubNIMServer
+from benchmarks import suite
+from benchmarks.suite import compare_results
+from src.nim_client import AsyncNIMClient
+
+class TestCompareResults(unittest.TestCase):
+    def test_flags_regressions_in_the_right_direction(self):
+        baseline = {"results": {"e2e": {"achieved_throughput": 100.0, "p99_latency": 0.1, "errors": 0}}}
+        current = {"results": {"e2e": {"achieved_throughput": 85.0, "p99_latency": 0.105, "errors": 0}}}
+        rows = {row["metric"]: row for row in compare_results(baseline, current, tolerance=0.1)}
+        self.assertTrue(rows["achieved_throughput"]["regression"])
+        self.assertFalse(rows["p99_latency"]["regression"])
+        self.assertFalse(rows["errors"]["regression"])
+
+    def test_latency_increase_is_a_regression(self):
+        baseline = {"results": {"micro": {"batch_latency_us": 100.0}}}
+        current = {"results": {"micro": {"batch_latency_us": 150.0}, "new": {"batch_latency_us": 1.0}}}
+        rows = compare_results(baseline, current)
+        self.assertEqual(len(rows), 1)
+        self.assertTrue(rows[0]["regression"])
+
+    def test_reference_baseline_covers_every_benchmark(self):
+        # A benchmark missing from the baseline is silently skipped by compare.
+        with open(os.path.join(suite.BASELINES_DIR, "reference.json")) as f:
+            reference = json.load(f)["results"]
+        with patch.multiple(suite, bench_batcher_dispatch=lambda: {}, bench_batch_inference=lambda: {},
+                            bench_tensor_codec=lambda: {}, bench_startup=lambda: {}):
+            benchmarks = set(suite.run_suite(include_e2e=False, rates=[], duration=0)["results"])
+        self.assertEqual(benchmarks - set(reference), set())
+        self.assertIn("time_to_ready_seconds", reference["startup"])
+        self.assertTrue(any(name.startswith("e2e_rate_") for name in reference))
+
+class TestStubNIMServer(unittest.TestCase):
+    def test_serves_binary_and_json_inference(self):
+        stub = StubNIMServer(batch_latency=0.001, per_item_latency=0.0, vocab_size=16, per_token_logits=True)
+
+        async def test():
+            server = TestServer(stub.make_app())
+            await server.start_server()
+            base_url = str(server.make_url("")).rstrip("/")
+            try:
+                for wire_format in ("binary", "json"):
+                    client = AsyncNIMClient(base_url, wire_format=wire_format)
+                    result = await client.inference("stub", {"input_ids": np.ones((3, 5), dtype=np.int64)})
+                    await client.close()
+                    self.assertEqual(np.asarray(result["logits"]).shape, (3, 5, 16))
+            finally:
+                await server.close()
+
+        asyncio.run(test())
+        self.assertEqual(stub.batches_served, 2)
+
+if __name__ == '__main__':
+    unittest.main()
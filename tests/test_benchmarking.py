@@ -0,0 +1,88 @@
+import unittest
+import asyncio
+import numpy as np
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from src.benchmarking import Benchmarker, LatencyHistogram, arrival_times
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentiles_within_precision(self):
+        values = np.random.default_rng(0).lognormal(mean=-4, sigma=1, size=20000)
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        for percent in (50, 95, 99, 99.9):
+            expected = np.percentile(values, percent)
+            self.assertAlmostEqual(histogram.percentile(percent) / expected, 1.0, delta=0.02)
+        self.assertEqual(histogram.count, len(values))
+        self.assertAlmostEqual(histogram.max, values.max())
+
+    def test_merge(self):
+        first, second = LatencyHistogram(), LatencyHistogram()
+        first.record(0.01)
+        second.record(1.0)
+        first.merge(second)
+        self.assertEqual(first.count, 2)
+        self.assertAlmostEqual(first.percentile(100), 1.0)
+
+class TestArrivalTimes(unittest.TestCase):
+    def test_fixed_rate_is_evenly_spaced(self):
+        times = arrival_times(10, 2.0, "fixed")
+        self.assertEqual(len(times), 20)
+        np.testing.assert_allclose(np.diff(times), 0.1)
+
+    def test_poisson_rate_matches_target(self):
+        times = arrival_times(200, 50.0, "poisson", seed=1)
+        self.assertAlmostEqual(len(times) / 50.0, 200, delta=10)
+        self.assertTrue(np.all(np.diff(times) > 0))
+        self.assertLess(times[-1], 50.0)
+        gaps = np.diff(times)
+        # Exponential gaps have a coefficient of variation of one.
+        self.assertAlmostEqual(gaps.std() / gaps.mean(), 1.0, delta=0.05)
+
+def serial_server(service_time):
+    # A server that handles one request at a time.
+    lock = asyncio.Lock()
+
+    async def inference(request):
+        async with lock:
+            await asyncio.sleep(service_time)
+        return web.json_response({"result": {}})
+
+    app = web.Application()
+    app.router.add_post("/inference", inference)
+    return TestServer(app)
+
+async def with_benchmarker(server, run):
+    await server.start_server()
+    try:
+        return await run(Benchmarker(str(server.make_url("")).rstrip("/")))
+    finally:
+        await server.close()
+
+class TestOpenLoop(unittest.TestCase):
+    def test_latency_includes_queueing_delay(self):
+        # 20 ms per request is far below the offered rate.
+        results = asyncio.run(with_benchmarker(serial_server(0.02), lambda benchmarker: benchmarker.run_open_loop(
+            "gpt2", ["hi"], rate=200, duration=0.25, arrival="fixed")))
+        self.assertEqual(results["requests_sent"], 50)
+        self.assertEqual(results["requests_completed"], 50)
+        self.assertEqual(results["errors"], 0)
+        # 50 requests served 20 ms apart: the last one waits about a second behind the others.
+        self.assertGreater(results["p99_latency"], 0.7)
+        self.assertLess(results["achieved_throughput"], 100)
+        self.assertGreater(results["backlog"], 30)
+
+    def test_sweep_flags_only_rates_beyond_capacity(self):
+        # About 100 requests/s of capacity. The 20/s Poisson run sends only 35 requests in 2s, so
+        # its throughput is below 95% of the nominal rate even though nothing queues.
+        sweep = asyncio.run(with_benchmarker(serial_server(0.01), lambda benchmarker: benchmarker.sweep_rates(
+            "gpt2", ["hi"], [20, 50, 200], duration=2.0, seed=0)))
+        self.assertEqual(sweep["saturation_rate"], 200)
+        self.assertEqual(sweep["max_sustainable_rate"], 50)
+        healthy = sweep["runs"][0]
+        self.assertAlmostEqual(healthy["offered_rate"], 17.5)
+        self.assertLessEqual(healthy["backlog"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
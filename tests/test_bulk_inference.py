@@ -0,0 +1,101 @@
+import unittest
+import asyncio
+import json
+from src.bulk_inference import parse_json_inputs, read_ndjson, run_bulk
+from src.dynamic_batcher import DynamicBatcher
+
+class FakeTokenizerRegistry:
+    def __init__(self):
+        self.calls = []
+
+    async def tokenize_batch(self, model_name, texts):
+        self.calls.append(list(texts))
+        return [{"input": text} for text in texts]
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+class TestBulkInference(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.tokenizer_registry = FakeTokenizerRegistry()
+
+    def make_batcher(self, delays=None, **kwargs):
+        async def handler(model_name, batch):
+            self.batches.append([item["input"] for item in batch])
+            await asyncio.sleep(max((delays or {}).get(item["input"], 0.0) for item in batch))
+            return [{"output": item["input"].upper()} for item in batch]
+
+        return DynamicBatcher(max_batch_size=4, max_latency=0.05, batch_handler=handler, **kwargs)
+
+    def collect(self, batcher, inputs, **kwargs):
+        async def run():
+            try:
+                return [event async for event in run_bulk(batcher, self.tokenizer_registry, "gpt2", inputs, **kwargs)]
+            finally:
+                await batcher.stop()
+
+        return asyncio.run(run())
+
+    def test_inputs_are_fed_as_full_batches(self):
+        inputs = [f"text{i}" for i in range(10)]
+        events = self.collect(self.make_batcher(), inputs)
+        self.assertEqual(sorted(event["index"] for event in events), list(range(10)))
+        for event in events:
+            self.assertEqual(event["result"], {"output": inputs[event["index"]].upper()})
+        self.assertEqual([len(batch) for batch in self.batches], [4, 4, 2])
+        self.assertEqual(self.tokenizer_registry.calls, [inputs[0:4], inputs[4:8], inputs[8:10]])
+
+    def test_results_stream_in_completion_order(self):
+        batcher = self.make_batcher({"slow": 0.2}, max_concurrent_batches=2)
+        events = self.collect(batcher, ["slow", "a", "b", "c", "d", "e", "f", "g"])
+        self.assertEqual([event["index"] for event in events], [4, 5, 6, 7, 0, 1, 2, 3])
+
+    def test_ndjson_lines_split_across_chunks(self):
+        inputs = read_ndjson(chunks(b'"first"\n{"input_te', b'xt": "second"}\nnot json\n', b'{"text": 1}\n"last"'))
+        events = sorted(self.collect(self.make_batcher(), inputs), key=lambda event: event["index"])
+        self.assertEqual(events[0], {"index": 0, "result": {"output": "FIRST"}})
+        self.assertEqual(events[1], {"index": 1, "result": {"output": "SECOND"}})
+        self.assertIn("Invalid JSON", events[2]["error"])
+        self.assertIn("input_text", events[3]["error"])
+        self.assertEqual(events[4], {"index": 4, "result": {"output": "LAST"}})
+
+    def test_reading_stops_while_results_are_not_consumed(self):
+        pulled = []
+
+        async def endless():
+            for i in range(1000):
+                pulled.append(i)
+                yield [f"text{i}"]
+
+        async def run():
+            batcher = self.make_batcher()
+            results = run_bulk(batcher, self.tokenizer_registry, "gpt2", endless(), max_in_flight=8)
+            for _ in range(5):
+                await results.__anext__()
+            await asyncio.sleep(0.2)
+            # At most max_in_flight inputs are held beyond the five results handed on.
+            self.assertLessEqual(len(pulled), 5 + 8 + 1)
+            await results.aclose()
+            self.assertEqual(batcher.queue_depth("gpt2"), 0)
+            await batcher.stop()
+
+        asyncio.run(run())
+
+    def test_full_queue_delays_instead_of_failing(self):
+        # Bulk requests may only fill half of a four-deep queue.
+        batcher = self.make_batcher(max_queue_depth=4, bulk_share=0.5)
+        events = self.collect(batcher, [f"text{i}" for i in range(12)])
+        self.assertEqual(sorted(event["index"] for event in events), list(range(12)))
+        self.assertTrue(all("result" in event for event in events))
+
+    def test_parse_json_inputs(self):
+        self.assertEqual(parse_json_inputs(b'["a", {"input_text": "b"}]'), ["a", {"input_text": "b"}])
+        self.assertEqual(parse_json_inputs(json.dumps({"inputs": ["a"]}).encode()), ["a"])
+        for body in (b'{"text": "a"}', b'"a"', b'[1,'):
+            with self.assertRaises(ValueError):
+                parse_json_inputs(body)
+
+if __name__ == '__main__':
+    unittest.main()
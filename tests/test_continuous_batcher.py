@@ -0,0 +1,179 @@
+import unittest
+import asyncio
+from src.continuous_batcher import ContinuousBatcher, StepBackend, TransformersStepBackend
+
+class StubStepBackend(StepBackend):
+    # Emits the previous token + 1, so every sequence's output is predictable.
+    def __init__(self, step_latency=0.001, fail=False):
+        self.step_latency = step_latency
+        self.fail = fail
+        self.batch_sizes = []
+        self.released = []
+
+    async def step(self, model_name, sequences):
+        self.batch_sizes.append(len(sequences))
+        await asyncio.sleep(self.step_latency)
+        if self.fail:
+            raise RuntimeError("decoder crashed")
+        return [sequence.token_ids[-1] + 1 for sequence in sequences]
+
+    def release(self, model_name, sequence):
+        self.released.append(sequence.input_ids[0])
+
+class TestContinuousBatcher(unittest.TestCase):
+    def test_finished_sequences_leave_the_batch(self):
+        async def test():
+            backend = StubStepBackend()
+            batcher = ContinuousBatcher(backend, max_batch_size=8)
+            short, long = await asyncio.gather(
+                batcher.complete("gpt2", [10], max_new_tokens=2),
+                batcher.complete("gpt2", [20], max_new_tokens=5),
+            )
+            self.assertEqual(short, [11, 12])
+            self.assertEqual(long, [21, 22, 23, 24, 25])
+            self.assertEqual(backend.batch_sizes, [2, 2, 1, 1, 1])
+            self.assertEqual(sorted(backend.released), [10, 20])
+            await batcher.stop()
+
+        asyncio.run(test())
+
+    def test_new_requests_join_the_running_batch(self):
+        async def test():
+            backend = StubStepBackend(step_latency=0.01)
+            batcher = ContinuousBatcher(backend, max_batch_size=8)
+            first = asyncio.create_task(batcher.complete("gpt2", [0], max_new_tokens=10))
+            await asyncio.sleep(0.025)
+            second = await batcher.complete("gpt2", [100], max_new_tokens=2)
+            self.assertEqual(second, [101, 102])
+            # The second request finished while the first was still generating.
+            self.assertFalse(first.done())
+            self.assertEqual(await first, list(range(1, 11)))
+            self.assertIn(2, backend.batch_sizes)
+            self.assertEqual(len(backend.batch_sizes), 10)
+            await batcher.stop()
+
+        asyncio.run(test())
+
+    def test_batch_size_limit_queues_extra_requests(self):
+        async def test():
+            backend = StubStepBackend()
+            batcher = ContinuousBatcher(backend, max_batch_size=2)
+            results = await asyncio.gather(*[
+                batcher.complete("gpt2", [i * 10], max_new_tokens=2) for i in range(3)
+            ])
+            self.assertEqual(results, [[1, 2], [11, 12], [21, 22]])
+            self.assertEqual(max(backend.batch_sizes), 2)
+            await batcher.stop()
+
+        asyncio.run(test())
+
+    def test_generation_stops_at_eos(self):
+        async def test():
+            batcher = ContinuousBatcher(StubStepBackend(), max_new_tokens=10)
+            self.assertEqual(await batcher.complete("gpt2", [1], eos_token_id=4), [2, 3, 4])
+            await batcher.stop()
+
+        asyncio.run(test())
+
+    def test_abandoned_stream_leaves_the_batch(self):
+        async def test():
+            backend = StubStepBackend()
+            batcher = ContinuousBatcher(backend, max_new_tokens=100)
+            tokens = batcher.generate("gpt2", [7])
+            self.assertEqual(await tokens.__anext__(), 8)
+            await tokens.aclose()
+            await asyncio.sleep(0.01)
+            self.assertEqual(backend.released, [7])
+            self.assertLess(len(backend.batch_sizes), 5)
+            await batcher.stop()
+
+        asyncio.run(test())
+
+    def test_backend_errors_reach_every_sequence(self):
+        async def test():
+            batcher = ContinuousBatcher(StubStepBackend(fail=True))
+            results = await asyncio.gather(
+                batcher.complete("gpt2", [1]), batcher.complete("gpt2", [2]), return_exceptions=True
+            )
+            self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+            await batcher.stop()
+
+        asyncio.run(test())
+
+class TestTransformersStepBackend(unittest.TestCase):
+    def test_batched_greedy_decoding_matches_single_sequences(self):
+        import torch
+        from transformers import GPT2Config, GPT2LMHeadModel
+
+        torch.manual_seed(0)
+        model = GPT2LMHeadModel(GPT2Config(vocab_size=64, n_positions=64, n_embd=32, n_layer=2, n_head=2)).eval()
+        prompts = [[5, 9, 13], [1, 2, 3, 4, 5, 6, 7], [42]]
+
+        async def run(together):
+            backend = TransformersStepBackend(models={"tiny": model})
+            batcher = ContinuousBatcher(backend, max_new_tokens=6)
+            try:
+                if together:
+                    return await asyncio.gather(*[batcher.complete("tiny", prompt) for prompt in prompts])
+                return [await batcher.complete("tiny", prompt) for prompt in prompts]
+            finally:
+                await batcher.stop()
+                backend.close()
+
+        batched = asyncio.run(run(True))
+        single = asyncio.run(run(False))
+        self.assertEqual(batched, single)
+        self.assertTrue(all(len(tokens) == 6 for tokens in batched))
+
+    def test_decode_steps_reuse_the_kv_cache(self):
+        import torch
+        from transformers import GPT2Config, GPT2LMHeadModel
+
+        torch.manual_seed(0)
+        model = GPT2LMHeadModel(GPT2Config(vocab_size=64, n_positions=64, n_embd=32, n_layer=2, n_head=2)).eval()
+        input_shapes = []
+        model.register_forward_pre_hook(lambda module, args, kwargs: input_shapes.append(tuple(kwargs["input_ids"].shape)),
+                                        with_kwargs=True)
+
+        def greedy(prompt, steps):
+            # Reference: the full forward pass over the whole history at every step.
+            token_ids = list(prompt)
+            with torch.no_grad():
+                for _ in range(steps):
+                    token_ids.append(int(model(input_ids=torch.tensor([token_ids])).logits[0, -1].argmax()))
+            return token_ids[len(prompt):]
+
+        prompts = [[5, 9, 13, 2, 8], [42, 7], [3, 1, 4, 1]]
+        expected = [greedy(prompt, 8) for prompt in prompts]
+        input_shapes.clear()
+        backend = TransformersStepBackend(models={"tiny": model})
+        batcher = ContinuousBatcher(backend, max_new_tokens=8)
+        sequences, joined = [], []
+        original_step = backend.step
+
+        async def step(model_name, running):
+            sequences.extend(sequence for sequence in running if sequence not in sequences)
+            if len(sequences) == 2 and not joined:
+                # The third prompt joins while the first two are part way through decoding.
+                joined.append(asyncio.ensure_future(batcher.complete("tiny", prompts[2])))
+            return await original_step(model_name, running)
+
+        backend.step = step
+
+        async def run():
+            try:
+                results = await asyncio.gather(*[batcher.complete("tiny", prompt) for prompt in prompts[:2]])
+                return results + [await joined[0]]
+            finally:
+                await batcher.stop()
+                backend.close()
+
+        self.assertEqual(asyncio.run(run()), expected)
+        # One prefill per prompt; every other forward pass feeds a single new token per sequence.
+        self.assertEqual(sorted(shape for shape in input_shapes if shape[1] > 1), [(1, 2), (1, 4), (1, 5)])
+        self.assertEqual(sum(shape[0] for shape in input_shapes if shape[1] == 1), 3 * 7)
+        self.assertIn((3, 1), input_shapes)
+        self.assertTrue(all(sequence.state is None for sequence in sequences))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,38 +1,287 @@
 import unittest
 import asyncio
-from src.dynamic_batcher import DynamicBatcher
+import numpy as np
+from src.dynamic_batcher import (
+    BatchQueue, DeadlineExceededError, DynamicBatcher, PendingRequest, QueueFullError, batch_inference,
+)
 
 class TestDynamicBatcher(unittest.TestCase):
     def setUp(self):
-        self.batcher = DynamicBatcher(max_batch_size=3, max_latency=0.1)
+        self.batches = []
+
+        async def handler(model_name, batch):
+            self.batches.append(batch)
+            return [{"output": item["input"].upper()} for item in batch]
+
+        self.batcher = DynamicBatcher(max_batch_size=3, max_latency=0.1, batch_handler=handler)
 
     def test_add_request(self):
         async def test():
-            result = await self.batcher.add_request({"input": "test"})
-            self.assertEqual(result, [])
-            self.assertEqual(len(self.batcher.current_batch), 1)
+            result = await self.batcher.add_request("gpt2", {"input": "test"})
+            self.assertEqual(result, {"output": "TEST"})
+            self.assertEqual(self.batcher.queue_depth("gpt2"), 0)
+            await self.batcher.stop()
 
         asyncio.run(test())
 
     def test_process_batch(self):
         async def test():
-            await self.batcher.add_request({"input": "test1"})
-            await self.batcher.add_request({"input": "test2"})
-            await self.batcher.add_request({"input": "test3"})
-            result = await self.batcher.add_request({"input": "test4"})
-            self.assertEqual(len(result), 3)
-            self.assertEqual(len(self.batcher.current_batch), 1)
+            inputs = ["test1", "test2", "test3", "test4"]
+            results = await asyncio.gather(*[self.batcher.add_request("gpt2", {"input": text}) for text in inputs])
+            self.assertEqual(results, [{"output": text.upper()} for text in inputs])
+            self.assertEqual([len(batch) for batch in self.batches], [3, 1])
+            await self.batcher.stop()
 
         asyncio.run(test())
 
     def test_wait_for_batch(self):
         async def test():
-            task = asyncio.create_task(self.batcher.add_request({"input": "test"}))
-            await asyncio.sleep(0.2)
-            self.assertEqual(len(self.batcher.current_batch), 0)
-            await task
+            task = asyncio.create_task(self.batcher.add_request("gpt2", {"input": "test"}))
+            await asyncio.sleep(0.05)
+            self.assertFalse(task.done())
+            self.assertEqual(self.batcher.queue_depth("gpt2"), 1)
+            await asyncio.sleep(0.15)
+            self.assertTrue(task.done())
+            self.assertEqual(self.batcher.queue_depth("gpt2"), 0)
+            self.assertEqual(await task, {"output": "TEST"})
+            await self.batcher.stop()
+
+        asyncio.run(test())
+
+    def test_handler_error_propagates_to_every_caller(self):
+        async def failing_handler(model_name, batch):
+            raise ValueError("backend unavailable")
+
+        async def test():
+            batcher = DynamicBatcher(max_batch_size=2, max_latency=0.1, batch_handler=failing_handler)
+            results = await asyncio.gather(
+                batcher.add_request("gpt2", {"input": "a"}),
+                batcher.add_request("gpt2", {"input": "b"}),
+                return_exceptions=True,
+            )
+            self.assertTrue(all(isinstance(r, ValueError) for r in results))
+            await batcher.stop()
+
+        asyncio.run(test())
+
+    def test_cancelled_request_is_not_dispatched(self):
+        async def test():
+            task = asyncio.create_task(self.batcher.add_request("gpt2", {"input": "gone"}))
+            await asyncio.sleep(0)
+            task.cancel()
+            result = await self.batcher.add_request("gpt2", {"input": "kept"})
+            self.assertEqual(result, {"output": "KEPT"})
+            self.assertEqual([[item["input"] for item in batch] for batch in self.batches], [["kept"]])
+            await self.batcher.stop()
+
+        asyncio.run(test())
+
+    def test_per_model_queues_use_their_own_limits(self):
+        dispatched = []
+
+        async def handler(model_name, batch):
+            dispatched.append((model_name, [item["input"] for item in batch]))
+            return [model_name for _ in batch]
+
+        async def test():
+            batcher = DynamicBatcher(
+                max_batch_size=3, max_latency=0.1, batch_handler=handler,
+                model_limits={"bert": {"max_batch_size": 2, "max_latency": 0.01}},
+            )
+            results = await asyncio.gather(
+                batcher.add_request("gpt2", {"input": "g1"}),
+                batcher.add_request("bert", {"input": "b1"}),
+                batcher.add_request("bert", {"input": "b2"}),
+                batcher.add_request("bert", {"input": "b3"}),
+            )
+            self.assertEqual(results, ["gpt2", "bert", "bert", "bert"])
+            self.assertEqual(batcher.get_queue("bert").max_batch_size, 2)
+            self.assertEqual(batcher.get_queue("gpt2").max_batch_size, 3)
+            self.assertIn(("bert", ["b1", "b2"]), dispatched)
+            self.assertIn(("bert", ["b3"]), dispatched)
+            self.assertIn(("gpt2", ["g1"]), dispatched)
+            await batcher.stop()
+
+        asyncio.run(test())
+
+    def test_ready_queues_are_served_round_robin(self):
+        dispatched = []
+
+        async def handler(model_name, batch):
+            dispatched.append(model_name)
+            await asyncio.sleep(0.01)
+            return [None for _ in batch]
+
+        async def test():
+            batcher = DynamicBatcher(max_batch_size=1, max_latency=1.0, batch_handler=handler,
+                                     max_concurrent_batches=1)
+            requests = [batcher.add_request("gpt2", {"input": i}) for i in range(4)]
+            requests += [batcher.add_request("bert", {"input": i}) for i in range(2)]
+            await asyncio.gather(*requests)
+            self.assertEqual(dispatched[:4], ["gpt2", "bert", "gpt2", "bert"])
+            await batcher.stop()
+
+        asyncio.run(test())
+
+    def test_requests_are_grouped_by_length_bucket(self):
+        dispatched = []
+
+        async def handler(model_name, batch):
+            dispatched.append(sorted(len(item["input_ids"]) for item in batch))
+            return [None for _ in batch]
+
+        async def test():
+            batcher = DynamicBatcher(max_batch_size=8, max_latency=0.01, batch_handler=handler,
+                                     length_buckets=[8, 64])
+            await asyncio.gather(*[
+                batcher.add_request("gpt2", {"input_ids": [1] * length})
+                for length in (5, 500, 3, 40, 8)
+            ])
+            self.assertEqual(sorted(dispatched), [[3, 5, 8], [40], [500]])
+            self.assertEqual(batcher.bucket_for("gpt2", {"input_ids": [1] * 9}), 64)
+            self.assertIsNone(batcher.bucket_for("gpt2", {"input_ids": [1] * 65}))
+            await batcher.stop()
+
+        asyncio.run(test())
+
+    def test_full_queue_rejects_bulk_before_interactive(self):
+        async def test():
+            batcher = DynamicBatcher(max_batch_size=8, max_latency=1.0, batch_handler=lambda m, b: None,
+                                     max_queue_depth=4, bulk_share=0.5)
+            queued = [asyncio.create_task(batcher.add_request("gpt2", {"input": i}, "bulk")) for i in range(2)]
+            await asyncio.sleep(0)
+            with self.assertRaises(QueueFullError) as rejected:
+                await batcher.add_request("gpt2", {"input": "late"}, "bulk")
+            self.assertGreater(rejected.exception.retry_after, 0)
+            queued += [asyncio.create_task(batcher.add_request("gpt2", {"input": i})) for i in range(2)]
+            await asyncio.sleep(0)
+            self.assertEqual(batcher.queue_depth("gpt2"), 4)
+            with self.assertRaises(QueueFullError):
+                await batcher.add_request("gpt2", {"input": "late"})
+            await batcher.stop()
+            await asyncio.gather(*queued, return_exceptions=True)
+
+        asyncio.run(test())
+
+    def test_interactive_requests_are_dispatched_before_bulk(self):
+        async def test():
+            batcher = DynamicBatcher(max_batch_size=2, max_latency=0.01, batch_handler=self.batcher.batch_handler,
+                                     max_concurrent_batches=1)
+            requests = [batcher.add_request("gpt2", {"input": f"bulk{i}"}, "bulk") for i in range(2)]
+            requests += [batcher.add_request("gpt2", {"input": f"live{i}"}) for i in range(2)]
+            await asyncio.gather(*requests)
+            self.assertEqual([[item["input"] for item in batch] for batch in self.batches],
+                             [["live0", "live1"], ["bulk0", "bulk1"]])
+            await batcher.stop()
+
+        asyncio.run(test())
+
+    def test_requests_are_shed_when_estimated_wait_exceeds_slo(self):
+        async def slow_handler(model_name, batch):
+            await asyncio.sleep(0.05)
+            return [None for _ in batch]
+
+        async def test():
+            batcher = DynamicBatcher(max_batch_size=1, max_latency=0.001, batch_handler=slow_handler,
+                                     max_concurrent_batches=1, queue_wait_slo=0.12)
+            await batcher.add_request("gpt2", {"input": 0})
+            queued = [asyncio.create_task(batcher.add_request("gpt2", {"input": i})) for i in range(3)]
+            await asyncio.sleep(0)
+            self.assertAlmostEqual(batcher.estimated_queue_wait("gpt2"), 0.15, delta=0.05)
+            with self.assertRaises(QueueFullError) as rejected:
+                await batcher.add_request("gpt2", {"input": "late"})
+            self.assertGreaterEqual(rejected.exception.retry_after, 0.1)
+            await asyncio.gather(*queued)
+            await batcher.stop()
+
+        asyncio.run(test())
+
+    def test_request_expires_in_queue_before_dispatch(self):
+        async def test():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            expiring = asyncio.create_task(self.batcher.add_request("gpt2", {"input": "late"}, deadline=started + 0.02))
+            kept = asyncio.create_task(self.batcher.add_request("gpt2", {"input": "kept"}))
+            with self.assertRaises(DeadlineExceededError):
+                await expiring
+            self.assertLess(loop.time() - started, 0.09)
+            self.assertEqual(self.batcher.queue_depth("gpt2"), 1)
+            self.assertEqual(await kept, {"output": "KEPT"})
+            self.assertEqual([[item["input"] for item in batch] for batch in self.batches], [["kept"]])
+            await self.batcher.stop()
+
+        asyncio.run(test())
+
+    def test_expired_deadline_is_rejected_at_enqueue(self):
+        async def test():
+            loop = asyncio.get_running_loop()
+            with self.assertRaises(DeadlineExceededError):
+                await self.batcher.add_request("gpt2", {"input": "late"}, deadline=loop.time() - 1)
+            self.assertEqual(self.batcher.queue_depth("gpt2"), 0)
+            await self.batcher.stop()
+
+        asyncio.run(test())
+
+    def test_take_batch_drops_expired_requests(self):
+        async def test():
+            loop = asyncio.get_running_loop()
+            queue = BatchQueue("gpt2", max_batch_size=4, max_latency=0.1)
+            expired = PendingRequest({"input": "a"}, loop.create_future(), 0.0, deadline=1.0)
+            live = PendingRequest({"input": "b"}, loop.create_future(), 0.0, deadline=5.0)
+            queue.add(expired)
+            queue.add(live)
+            self.assertEqual(queue.take_batch(now=2.0), [live])
+            self.assertIsInstance(expired.future.exception(), DeadlineExceededError)
+
+        asyncio.run(test())
+
+    def test_queue_orders_by_priority_then_arrival(self):
+        async def test():
+            loop = asyncio.get_running_loop()
+            queue = BatchQueue("gpt2", max_batch_size=8, max_latency=0.1)
+            arrivals = [("bulk", 1.0), ("interactive", 2.0), ("bulk", 3.0), ("interactive", 4.0), ("bulk", 5.0)]
+            for priority, enqueued_at in arrivals:
+                queue.add(PendingRequest({"input": enqueued_at}, loop.create_future(), enqueued_at, priority=priority))
+            self.assertEqual([pending.payload["input"] for pending in queue.current_batch], [2.0, 4.0, 1.0, 3.0, 5.0])
+            # The oldest request is the head of the bulk class, not the head of the queue.
+            self.assertAlmostEqual(queue.flush_deadline(), 1.1)
 
         asyncio.run(test())
 
+class FakeNIMClient:
+    def __init__(self):
+        self.inputs = None
+
+    async def inference(self, model_name, input_data):
+        self.inputs = input_data
+        input_ids = input_data["input_ids"]
+        logits = np.repeat(input_ids[:, :, None].astype(np.float32), 4, axis=2)
+        return {"logits": logits}
+
+class TestBatchInference(unittest.TestCase):
+    def test_pads_into_one_array_and_unpads_results(self):
+        client = FakeNIMClient()
+        batch = [
+            {"input_ids": np.array([[1, 2, 3]]), "attention_mask": np.array([[1, 1, 1]])},
+            {"input_ids": [4], "attention_mask": [1]},
+            {"input_ids": [5, 6, 7, 8, 9], "attention_mask": [1, 1, 1, 1, 1]},
+        ]
+        results = asyncio.run(batch_inference(client, "gpt2", batch))
+
+        self.assertEqual(client.inputs["input_ids"].shape, (3, 5))
+        np.testing.assert_array_equal(client.inputs["input_ids"][1], [4, 0, 0, 0, 0])
+        np.testing.assert_array_equal(client.inputs["attention_mask"][0], [1, 1, 1, 0, 0])
+        self.assertEqual([r["logits"].shape for r in results], [(3, 4), (1, 4), (5, 4)])
+        np.testing.assert_array_equal(results[2]["logits"][:, 0], [5, 6, 7, 8, 9])
+
+    def test_per_request_outputs_are_split_by_row(self):
+        class ClassifierClient:
+            async def inference(self, model_name, input_data):
+                return {"logits": [[0.1, 0.9], [0.8, 0.2]]}
+
+        batch = [{"input_ids": [1, 2]}, {"input_ids": [3, 4, 5]}]
+        results = asyncio.run(batch_inference(ClassifierClient(), "bert", batch))
+        np.testing.assert_array_equal(results[1]["logits"], [0.8, 0.2])
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock
+from src.endpoint_pool import EndpointPool
+
+class TestEndpointPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = EndpointPool(["http://a:8000/", "http://b:8000", "http://c:8000"])
+        self.a, self.b, self.c = self.pool.endpoints
+
+    def test_least_outstanding_breaks_ties_by_latency(self):
+        self.assertEqual(self.a.url, "http://a:8000")
+        self.a.outstanding, self.b.outstanding, self.c.outstanding = 2, 1, 1
+        self.pool.record_success(self.b, 0.05)
+        self.pool.record_success(self.c, 0.01)
+        self.assertIs(self.pool.pick(), self.c)
+        self.c.outstanding = 3
+        self.assertIs(self.pool.pick(), self.b)
+        self.assertIs(self.pool.pick(exclude=[self.b]), self.a)
+
+    def test_ewma_weighs_latency_by_load(self):
+        pool = EndpointPool(["http://a", "http://b"], strategy="ewma", ewma_decay=0.5)
+        fast, slow = pool.endpoints
+        pool.record_success(fast, 0.01)
+        pool.record_success(slow, 0.04)
+        self.assertIs(pool.pick(), fast)
+        fast.outstanding = 4
+        self.assertIs(pool.pick(), slow)
+        # The average moves halfway towards each new sample.
+        pool.record_success(slow, 0.02)
+        self.assertAlmostEqual(slow.ewma_latency, 0.03)
+
+    def test_consecutive_failures_eject_until_the_ejection_time_passes(self):
+        monitoring = MagicMock()
+        pool = EndpointPool(["http://a", "http://b"], max_failures=2, ejection_time=30.0, monitoring=monitoring)
+        a, b = pool.endpoints
+        pool.record_failure(a, now=100.0)
+        pool.record_success(a, 0.01)
+        pool.record_failure(a, now=100.0)
+        self.assertEqual(pool.available(now=100.0), [a, b])
+        pool.record_failure(a, now=100.0)
+        self.assertEqual(pool.available(now=100.0), [b])
+        self.assertEqual(pool.available(now=131.0), [a, b])
+        monitoring.record_endpoint_ejection.assert_called_once_with("http://a")
+
+    def test_every_replica_ejected_falls_back_to_all(self):
+        for endpoint in self.pool:
+            self.pool.eject(endpoint)
+        self.assertEqual(len(self.pool.available()), 3)
+        self.pool.reinstate(self.b)
+        self.assertEqual(self.pool.available(), [self.b])
+
+    def test_hedge_delay_follows_recent_p95(self):
+        pool = EndpointPool(["http://a", "http://b"], min_hedge_delay=0.005)
+        self.assertIsNone(pool.hedge_delay())
+        for latency in range(1, 101):
+            pool.record_success(pool.endpoints[0], latency / 1000)
+        self.assertAlmostEqual(pool.hedge_delay(), 0.09505)
+        pool.latencies.clear()
+        for _ in range(20):
+            pool.record_success(pool.endpoints[0], 0.001)
+        self.assertEqual(pool.hedge_delay(), 0.005)
+
+    def test_hedges_are_capped(self):
+        pool = EndpointPool(["http://a", "http://b"], max_hedge_ratio=0.1)
+        self.assertTrue(pool.hedge_allowed())
+        for _ in range(9):
+            pool.record_request(hedged=False)
+        pool.record_request(hedged=True)
+        self.assertFalse(pool.hedge_allowed())
+        pool.record_request(hedged=False)
+        self.assertTrue(pool.hedge_allowed())
+
+    def test_rejects_bad_configuration(self):
+        with self.assertRaises(ValueError):
+            EndpointPool([])
+        with self.assertRaises(ValueError):
+            EndpointPool("http://a", strategy="random")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import unittest
+import asyncio
+import os
+import tempfile
+import threading
+import numpy as np
+from src.dynamic_batcher import batch_inference
+from src.inference_backend import BackendRouter, InferenceBackend, OnnxRuntimeBackend
+
+def write_sum_model(path, output_dims):
+    # logits = float(input_ids + token_type_ids), with input_ids and token_type_ids as int64.
+    import onnx
+    from onnx import TensorProto, helper
+
+    inputs = [helper.make_tensor_value_info(name, TensorProto.INT64, ["batch", "sequence"])
+              for name in ("input_ids", "token_type_ids")]
+    output = helper.make_tensor_value_info("logits", TensorProto.FLOAT, output_dims)
+    nodes = [
+        helper.make_node("Add", ["input_ids", "token_type_ids"], ["total"]),
+        helper.make_node("Cast", ["total"], ["logits"], to=TensorProto.FLOAT),
+    ]
+    graph = helper.make_graph(nodes, "sum", inputs, [output])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    onnx.save(model, path)
+    return path
+
+class RecordingBackend(InferenceBackend):
+    def __init__(self, name):
+        self.name = name
+        self.models = []
+
+    async def inference(self, model_name, input_data):
+        self.models.append(model_name)
+        return {"logits": np.zeros((len(input_data["input_ids"]), 2)), "backend": self.name}
+
+class TestOnnxRuntimeBackend(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import torch
+        from transformers import GPT2Config, GPT2LMHeadModel
+        from src.model_optimizer import optimize_model
+
+        torch.manual_seed(0)
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.model = GPT2LMHeadModel(GPT2Config(vocab_size=128, n_positions=64, n_embd=32, n_layer=2, n_head=2)).eval()
+        model_path = os.path.join(cls.tmp.name, "tiny-gpt2")
+        cls.model.save_pretrained(model_path)
+        optimize_model(model_path, os.path.join(cls.tmp.name, "onnx"), benchmark_shape=None)
+        cls.onnx_path = os.path.join(cls.tmp.name, "onnx", "model_optimized.onnx")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_batch_inference_matches_pytorch(self):
+        import torch
+
+        backend = OnnxRuntimeBackend({"tiny": {"onnx_path": self.onnx_path}})
+        batch = [{"input_ids": np.array([5, 9, 13])}, {"input_ids": np.array([1, 2, 3, 4, 5, 6])}]
+
+        async def run():
+            try:
+                return await batch_inference(backend, "tiny", batch)
+            finally:
+                await backend.close()
+
+        results = asyncio.run(run())
+        for item, result in zip(batch, results):
+            with torch.no_grad():
+                expected = self.model(input_ids=torch.tensor([item["input_ids"]])).logits[0].numpy()
+            self.assertEqual(result["logits"].shape, expected.shape)
+            np.testing.assert_allclose(result["logits"], expected, atol=1e-4)
+
+    def test_concurrent_batches_share_the_session_pool(self):
+        backend = OnnxRuntimeBackend({"tiny": {"onnx_path": self.onnx_path}}, pool_size=3)
+        rng = np.random.default_rng(0)
+        batches = [{"input_ids": rng.integers(0, 128, size=(4, 16)), "attention_mask": np.ones((4, 16), dtype=np.int64)}
+                   for _ in range(12)]
+
+        async def run():
+            try:
+                return await asyncio.gather(*[backend.inference("tiny", batch) for batch in batches])
+            finally:
+                await backend.close()
+
+        results = asyncio.run(run())
+        self.assertEqual(backend._pools, {})
+        for batch, result in zip(batches, results):
+            # Each result is its own array, not a view of a buffer reused by a later batch.
+            single = OnnxRuntimeBackend({"tiny": {"onnx_path": self.onnx_path}}, pool_size=1)
+            np.testing.assert_allclose(result["logits"], single._run("tiny", batch)["logits"], atol=1e-5)
+        self.assertEqual(len({id(result["logits"]) for result in results}), len(results))
+
+    def test_missing_inputs_are_zero_filled_and_types_cast(self):
+        for output_dims in (["batch", "sequence"], ["n", "m"]):
+            path = write_sum_model(os.path.join(self.tmp.name, f"sum-{output_dims[0]}.onnx"), output_dims)
+            backend = OnnxRuntimeBackend({"sum": {"onnx_path": path}}, pool_size=1)
+            input_ids = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.int32)
+            result = backend._run("sum", {"input_ids": input_ids, "attention_mask": np.ones((2, 3), dtype=np.int64)})
+            np.testing.assert_array_equal(result["logits"], input_ids.astype(np.float32))
+            # The staging buffers are reused for a smaller batch.
+            result = backend._run("sum", {"input_ids": input_ids[:1, :2]})
+            np.testing.assert_array_equal(result["logits"], [[1, 2]])
+
+    def test_model_without_onnx_path_is_resolved(self):
+        resolved = []
+
+        def resolve(model_name, model_path):
+            resolved.append((model_name, model_path))
+            return self.onnx_path
+
+        backend = OnnxRuntimeBackend({"tiny": {"model_path": "path/to/tiny"}}, pool_size=1, resolve_path=resolve)
+        backend._run("tiny", {"input_ids": np.ones((1, 4), dtype=np.int64)})
+        backend._run("tiny", {"input_ids": np.ones((1, 4), dtype=np.int64)})
+        self.assertEqual(resolved, [("tiny", "path/to/tiny")])
+        with self.assertRaises(ValueError):
+            OnnxRuntimeBackend({"other": {}}).onnx_path("other")
+
+    def test_prepare_loads_before_the_first_batch(self):
+        resolved = []
+
+        def resolve(model_name, model_path):
+            resolved.append((model_name, model_path))
+            return self.onnx_path
+
+        backend = OnnxRuntimeBackend({"tiny": {"model_path": "path/to/tiny"}}, pool_size=1, resolve_path=resolve)
+
+        async def run():
+            try:
+                self.assertEqual(await backend.prepare("tiny"), self.onnx_path)
+                await backend.inference("tiny", {"input_ids": np.ones((1, 4), dtype=np.int64)})
+                # Redeploying from a new checkpoint replaces the loaded sessions.
+                await backend.prepare("tiny", "path/to/tiny-v2")
+            finally:
+                await backend.close()
+
+        asyncio.run(run())
+        self.assertEqual(resolved, [("tiny", "path/to/tiny"), ("tiny", "path/to/tiny-v2")])
+
+    def test_loading_one_model_does_not_stall_another(self):
+        loading = threading.Event()
+        release = threading.Event()
+
+        def resolve(model_name, model_path):
+            loading.set()
+            release.wait(5)
+            return self.onnx_path
+
+        backend = OnnxRuntimeBackend({"tiny": {"onnx_path": self.onnx_path}, "slow": {"model_path": "slow"}},
+                                     pool_size=1, resolve_path=resolve)
+        batch = {"input_ids": np.ones((1, 4), dtype=np.int64)}
+
+        async def run():
+            try:
+                slow = asyncio.ensure_future(backend.inference("slow", batch))
+                await asyncio.get_running_loop().run_in_executor(None, loading.wait)
+                # "slow" holds its own load lock and executor thread; "tiny" is served meanwhile.
+                await asyncio.wait_for(backend.inference("tiny", batch), 5)
+                self.assertFalse(slow.done())
+                release.set()
+                await slow
+                self.assertEqual(set(backend._executors), {"tiny", "slow"})
+            finally:
+                release.set()
+                await backend.close()
+
+        asyncio.run(run())
+
+class TestBackendRouter(unittest.TestCase):
+    def test_routes_each_model_to_its_backend(self):
+        nim, local = RecordingBackend("nim"), RecordingBackend("local")
+        router = BackendRouter({"nim": nim, "local": local}, {"bert": "local", "gpt2": "nim"})
+
+        async def run():
+            return [await router.inference(model, {"input_ids": np.ones((1, 2))}) for model in ("bert", "gpt2", "t5")]
+
+        self.assertEqual([result["backend"] for result in asyncio.run(run())], ["local", "nim", "nim"])
+        self.assertEqual(local.models, ["bert"])
+        self.assertEqual(nim.models, ["gpt2", "t5"])
+
+    def test_rejects_unknown_backends(self):
+        with self.assertRaises(ValueError):
+            BackendRouter({"nim": RecordingBackend("nim")}, {"bert": "triton"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+import unittest
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+import numpy as np
+from aiohttp.test_utils import TestServer
+from prometheus_client import REGISTRY
+from benchmarks.stub_nim_server import StubNIMServer
+from src import main
+from src.nim_client import AsyncNIMClient
+from src.inference_backend import BackendRouter
+from src.dynamic_batcher import DynamicBatcher
+from src.single_flight import SingleFlight
+
+async def call(app, method, path, body=b"", headers=(), query="", disconnect_after=None):
+    # Drives the ASGI app directly, so a test can disconnect part way through a request.
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        if disconnect_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query.encode(), "client": ("test", 1), "server": ("test", 80),
+        "headers": [(b"content-type", b"application/json")] + [(k.lower().encode(), v.encode()) for k, v in headers],
+    }
+    await app(scope, receive, send)
+    status = next(message["status"] for message in sent if message["type"] == "http.response.start")
+    return status, b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+
+class ServiceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.delay = 0.0
+
+        async def tokenize(model_name, text):
+            ids = np.array([ord(c) for c in text], dtype=np.int64)
+            return {"input_ids": ids, "attention_mask": np.ones_like(ids)}
+
+        async def tokenize_batch(model_name, texts):
+            return [await tokenize(model_name, text) for text in texts]
+
+        async def handler(model_name, batch):
+            self.batches.append(batch)
+            await asyncio.sleep(self.delay)
+            return [{"logits": np.array([len(item["input_ids"])])} for item in batch]
+
+        self.batcher = DynamicBatcher(8, 0.01, handler)
+        for target, attribute, value in (
+            (main, "dynamic_batcher", self.batcher),
+            (main, "single_flight", SingleFlight()),
+            (main, "response_cache", None),
+            (main.tokenizer_registry, "tokenize", tokenize),
+            (main.tokenizer_registry, "tokenize_batch", tokenize_batch),
+        ):
+            patcher = patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_requests(self, *requests):
+        async def run():
+            try:
+                return await asyncio.gather(*[self.infer(**request) for request in requests])
+            finally:
+                await self.batcher.stop()
+
+        return asyncio.run(run())
+
+    async def infer(self, text="hello", start_after=0.0, headers=(), disconnect_after=None, **fields):
+        await asyncio.sleep(start_after)
+        body = json.dumps({"model_name": "gpt2", "input_text": text, **fields}).encode()
+        return await call(main.app, "POST", "/inference", body, headers, disconnect_after=disconnect_after)
+
+class TestInferenceDeadlines(ServiceTestCase):
+    def test_deadline_header_expires_with_504(self):
+        self.delay = 0.3
+        [(status, body)] = self.run_requests({"headers": [("X-Request-Deadline-Ms", "50")]})
+        self.assertEqual(status, 504)
+        self.assertIn("deadline", json.loads(body)["detail"])
+
+    def test_body_deadline_overrides_header(self):
+        self.delay = 0.05
+        [(status, body)] = self.run_requests({"deadline_ms": 2000, "headers": [("X-Request-Deadline-Ms", "10")]})
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {"result": {"logits": [5]}})
+
+    def test_invalid_deadline_header_is_rejected(self):
+        [(status, _)] = self.run_requests({"headers": [("X-Request-Deadline-Ms", "soon")]})
+        self.assertEqual(status, 400)
+        self.assertEqual(self.batches, [])
+
+    def test_disconnect_cancels_queued_work_with_499(self):
+        self.delay = 1.0
+        [(status, _)] = self.run_requests({"disconnect_after": 0.05})
+        self.assertEqual(status, 499)
+
+class TestCoalescedRequests(ServiceTestCase):
+    def test_follower_keeps_its_own_deadline(self):
+        self.delay = 0.3
+        leader, follower = self.run_requests({}, {"start_after": 0.005, "deadline_ms": 50})
+        self.assertEqual(leader[0], 200)
+        self.assertEqual(follower[0], 504)
+        self.assertEqual(sum(len(batch) for batch in self.batches), 1)
+
+    def test_leader_deadline_does_not_fail_followers(self):
+        self.delay = 0.3
+        leader, follower = self.run_requests({"deadline_ms": 50}, {"start_after": 0.005})
+        self.assertEqual(leader[0], 504)
+        self.assertEqual(follower[0], 200)
+        self.assertEqual(sum(len(batch) for batch in self.batches), 1)
+
+    def test_requests_with_different_priorities_are_not_coalesced(self):
+        responses = self.run_requests({"priority": "bulk"}, {"priority": "interactive"})
+        self.assertEqual([status for status, _ in responses], [200, 200])
+        self.assertEqual(sum(len(batch) for batch in self.batches), 2)
+
+class TestStreamingBackends(unittest.TestCase):
+    def stream_status(self, model_name):
+        body = json.dumps({"model_name": model_name, "input_text": "hello"}).encode()
+        return asyncio.run(call(main.app, "POST", "/inference/stream", body))
+
+    def test_local_models_cannot_stream(self):
+        local = SimpleNamespace(inference=None)
+        router = BackendRouter({"nim": main.nim_client, "local": local}, {"tiny": "local"})
+        with patch.object(main, "inference_backend", router):
+            status, body = self.stream_status("tiny")
+        self.assertEqual(status, 400)
+        self.assertIn("cannot stream", json.loads(body)["detail"])
+
+    def test_pipeline_parallel_models_cannot_stream(self):
+        with patch.dict(main.pipelines, {"gpt2": SimpleNamespace(inference=None)}):
+            status, _ = self.stream_status("gpt2")
+        self.assertEqual(status, 400)
+
+class TestUndeploy(unittest.TestCase):
+    def test_undeploy_drops_the_pipeline_wrapper(self):
+        with patch.dict(main.pipelines, {"gpt2": SimpleNamespace(inference=None)}), \
+                patch.object(main.model_deployer, "undeploy_model", AsyncMock(return_value={})):
+            status, _ = asyncio.run(call(main.app, "POST", "/undeploy/gpt2"))
+            self.assertEqual(status, 200)
+            self.assertNotIn("gpt2", main.pipelines)
+
+class TestInferenceBatch(ServiceTestCase):
+    def batch(self, model_name, inputs):
+        async def run():
+            try:
+                return await call(main.app, "POST", "/inference/batch", json.dumps(inputs).encode(),
+                                  query=f"model_name={model_name}")
+            finally:
+                await self.batcher.stop()
+
+        return asyncio.run(run())
+
+    def timed_jobs(self, model_name):
+        return REGISTRY.get_sample_value("request_latency_seconds_count",
+                                         {"endpoint": "inference_batch", "model": model_name}) or 0.0
+
+    def test_results_are_streamed_per_input_and_the_job_is_timed(self):
+        jobs = self.timed_jobs("gpt2")
+        status, body = self.batch("gpt2", ["a", "abc"])
+        self.assertEqual(status, 200)
+        events = sorted((json.loads(line) for line in body.decode().splitlines()), key=lambda event: event["index"])
+        self.assertEqual(events, [{"index": 0, "result": {"logits": [1]}}, {"index": 1, "result": {"logits": [3]}}])
+        self.assertEqual(self.timed_jobs("gpt2") - jobs, 1)
+
+    def test_unknown_model_is_rejected_before_any_input_is_queued(self):
+        status, body = self.batch("missing", ["a", "b"])
+        self.assertEqual(status, 404)
+        self.assertIn("missing", json.loads(body)["detail"])
+        self.assertEqual(self.batches, [])
+
+class TestInferenceStream(ServiceTestCase):
+    def stream(self, accept, max_new_tokens=5):
+        stub = StubNIMServer(batch_latency=0.001, vocab_size=32, token_interval=0.002)
+
+        async def run():
+            server = TestServer(stub.make_app())
+            await server.start_server()
+            client = AsyncNIMClient(str(server.make_url("")), wire_format="json")
+            try:
+                with patch.object(main, "inference_backend", client):
+                    body = json.dumps({"model_name": "stub", "input_text": "hello",
+                                       "parameters": {"max_new_tokens": max_new_tokens}}).encode()
+                    return await call(main.app, "POST", "/inference/stream", body, [("Accept", accept)])
+            finally:
+                await client.close()
+                await server.close()
+
+        return asyncio.run(run())
+
+    def metric(self, name):
+        return REGISTRY.get_sample_value(name, {"model": "stub"}) or 0.0
+
+    def test_server_sent_events(self):
+        first_tokens = self.metric("time_to_first_token_seconds_count")
+        gaps = self.metric("inter_token_latency_seconds_count")
+        status, body = self.stream("text/event-stream")
+        self.assertEqual(status, 200)
+        frames = body.decode().split("\n\n")
+        self.assertEqual(frames[-2:], ["data: [DONE]", ""])
+        events = [json.loads(frame[len("data: "):]) for frame in frames[:-2]]
+        self.assertEqual([event["index"] for event in events], list(range(5)))
+        self.assertTrue(all(0 <= event["token_id"] < 32 for event in events))
+        # One time to first token per stream, and one gap between each later token and the last.
+        self.assertEqual(self.metric("time_to_first_token_seconds_count") - first_tokens, 1)
+        self.assertEqual(self.metric("inter_token_latency_seconds_count") - gaps, 4)
+
+    def test_ndjson_without_event_stream_accept(self):
+        status, body = self.stream("application/json", max_new_tokens=3)
+        self.assertEqual(status, 200)
+        events = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([event["index"] for event in events], [0, 1, 2])
+
+    def test_errors_are_reported_in_band(self):
+        async def failing_tokenize(model_name, text):
+            raise RuntimeError("no tokenizer for stub")
+
+        with patch.object(main.tokenizer_registry, "tokenize", failing_tokenize):
+            status, body = self.stream("text/event-stream")
+        self.assertEqual(status, 200)
+        self.assertEqual(body.decode(), 'data: {"error": "no tokenizer for stub"}\n\ndata: [DONE]\n\n')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
+import asyncio
 from unittest.mock import patch, MagicMock
+import numpy as np
 from src.model_deployer import ModelDeployer
 from src.nim_client import NIMClient
 
@@ -9,27 +11,41 @@ class TestModelDeployer(unittest.TestCase):
         self.model_deployer = ModelDeployer(self.nim_client)
 
     @patch('transformers.AutoModelForCausalLM.from_pretrained')
-    @patch('transformers.AutoTokenizer.from_pretrained')
-    def test_prepare_and_deploy_model(self, mock_tokenizer, mock_model):
-        mock_model.return_value = MagicMock()
-        mock_tokenizer.return_value = MagicMock()
+    @patch('transformers.AutoConfig.from_pretrained')
+    def test_prepare_and_deploy_model(self, mock_config, mock_model):
+        mock_config.return_value = MagicMock()
         self.nim_client.deploy_model.return_value = {"status": "success"}
 
-        result = self.model_deployer.prepare_and_deploy_model("test_model", "path/to/model")
+        result = asyncio.run(self.model_deployer.prepare_and_deploy_model("test_model", "path/to/model"))
         self.assertEqual(result, {"status": "success"})
-        mock_model.assert_called_once_with("path/to/model")
-        mock_tokenizer.assert_called_once_with("path/to/model")
+        mock_config.assert_called_once_with("path/to/model")
+        # The weights are left to the ONNX export instead of being loaded here and thrown away.
+        mock_model.assert_not_called()
         self.nim_client.deploy_model.assert_called_once_with("test_model", "path/to/model")
 
-    def test_inference(self):
+    @patch('transformers.AutoTokenizer.from_pretrained')
+    def test_inference(self, mock_from_pretrained):
         mock_tokenizer = MagicMock()
-        mock_tokenizer.return_value = {"input_ids": [1, 2, 3], "attention_mask": [1, 1, 1]}
-        self.model_deployer.inference("test_model", "test input")
-        self.nim_client.inference.assert_called_once_with("test_model", {"input_ids": [1, 2, 3], "attention_mask": [1, 1, 1]})
+        mock_tokenizer.return_value = {"input_ids": [[1, 2, 3]], "attention_mask": [[1, 1, 1]]}
+        mock_from_pretrained.return_value = mock_tokenizer
+        asyncio.run(self.model_deployer.inference("test_model", "test input"))
+        self.nim_client.inference.assert_called_once()
+        model_name, input_data = self.nim_client.inference.call_args[0]
+        self.assertEqual(model_name, "test_model")
+        np.testing.assert_array_equal(input_data["input_ids"], [[1, 2, 3]])
+        np.testing.assert_array_equal(input_data["attention_mask"], [[1, 1, 1]])
 
     def test_undeploy_model(self):
-        self.model_deployer.undeploy_model("test_model")
+        asyncio.run(self.model_deployer.undeploy_model("test_model"))
         self.nim_client.undeploy_model.assert_called_once_with("test_model")
 
+    def test_awaits_async_client(self):
+        async def undeploy(model_name):
+            return {"status": "removed", "model": model_name}
+
+        self.nim_client.undeploy_model.side_effect = undeploy
+        result = asyncio.run(self.model_deployer.undeploy_model("test_model"))
+        self.assertEqual(result, {"status": "removed", "model": "test_model"})
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import json
+import os
+import tempfile
+import numpy as np
+from src.model_optimizer import format_report, optimize_model
+
+class TestModelOptimizer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import torch
+        from transformers import GPT2Config, GPT2LMHeadModel
+
+        torch.manual_seed(0)
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.model = GPT2LMHeadModel(GPT2Config(vocab_size=256, n_positions=64, n_embd=64, n_layer=2, n_head=2)).eval()
+        cls.model_path = os.path.join(cls.tmp.name, "tiny-gpt2")
+        cls.model.save_pretrained(cls.model_path)
+        cls.report = optimize_model(cls.model_path, os.path.join(cls.tmp.name, "onnx"), quantize=True,
+                                    benchmark_shape=(1, 8))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def run_onnx(self, name, input_ids, attention_mask):
+        import onnxruntime
+
+        session = onnxruntime.InferenceSession(os.path.join(self.tmp.name, "onnx", name),
+                                               providers=["CPUExecutionProvider"])
+        return session.run(["logits"], {"input_ids": input_ids, "attention_mask": attention_mask})[0]
+
+    def reference(self, input_ids, attention_mask):
+        import torch
+
+        with torch.no_grad():
+            return self.model(input_ids=torch.tensor(input_ids), attention_mask=torch.tensor(attention_mask)).logits.numpy()
+
+    def test_export_has_dynamic_batch_and_sequence_axes(self):
+        rng = np.random.default_rng(0)
+        for shape in [(1, 5), (3, 17)]:
+            input_ids = rng.integers(0, 256, size=shape).astype(np.int64)
+            attention_mask = np.ones(shape, dtype=np.int64)
+            logits = self.run_onnx("model_optimized.onnx", input_ids, attention_mask)
+            np.testing.assert_allclose(logits, self.reference(input_ids, attention_mask), atol=1e-4)
+
+    def test_left_padded_rows_match_pytorch(self):
+        input_ids = np.array([[0, 0, 5, 6, 7], [1, 2, 3, 4, 5]], dtype=np.int64)
+        attention_mask = np.array([[0, 0, 1, 1, 1], [1, 1, 1, 1, 1]], dtype=np.int64)
+        logits = self.run_onnx("model_optimized.onnx", input_ids, attention_mask)
+        np.testing.assert_allclose(logits[:, 2:], self.reference(input_ids, attention_mask)[:, 2:], atol=1e-4)
+
+    def test_quantized_model_is_smaller_and_close(self):
+        sizes = {step["step"]: step["size_bytes"] for step in self.report["steps"]}
+        self.assertLess(sizes["quantize"], sizes["optimize"] / 2)
+        input_ids = np.arange(12, dtype=np.int64).reshape(2, 6)
+        attention_mask = np.ones_like(input_ids)
+        logits = self.run_onnx("model_quantized.onnx", input_ids, attention_mask)
+        reference = self.reference(input_ids, attention_mask)
+        self.assertEqual(logits.shape, reference.shape)
+        self.assertGreater(np.corrcoef(logits.ravel(), reference.ravel())[0, 1], 0.99)
+
+    def test_report_covers_every_step(self):
+        self.assertEqual([step["step"] for step in self.report["steps"]], ["pytorch", "export", "optimize", "quantize"])
+        self.assertEqual(self.report["artifact"], "model_quantized.onnx")
+        self.assertTrue(all(step["latency_ms"] > 0 for step in self.report["steps"]))
+        with open(os.path.join(self.tmp.name, "onnx", "report.json")) as f:
+            self.assertEqual(json.load(f), self.report)
+        self.assertIn("quantize", format_report(self.report))
+
+if __name__ == '__main__':
+    unittest.main()
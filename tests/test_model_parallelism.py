@@ -0,0 +1,137 @@
+import unittest
+import asyncio
+import time
+import numpy as np
+import torch
+from src.model_parallelism import ModelParallelNIMWrapper, partition_layers
+
+class StageStub:
+    # Runs layers on the CPU in place of NIM stages: layer i adds weights[i] to the hidden
+    # states and takes costs[i] seconds per micro-batch, on top of round_trip seconds per call.
+    # With report_layer_times, profiled calls return each layer's compute time. Fails if a gpu
+    # runs two calls at once.
+    def __init__(self, weights, costs, round_trip=0.0, report_layer_times=False):
+        self.weights = weights
+        self.costs = costs
+        self.round_trip = round_trip
+        self.report_layer_times = report_layer_times
+        self.busy = set()
+        self.calls = []
+
+    def get_model_status(self, model_name):
+        return {"num_layers": len(self.weights)}
+
+    async def inference(self, model_name, input_data):
+        gpu = input_data["gpu"]
+        assert gpu not in self.busy, f"gpu {gpu} is already running a micro-batch"
+        self.busy.add(gpu)
+        self.calls.append((input_data["start_layer"], input_data["end_layer"], gpu))
+        try:
+            if "input_ids" in input_data:
+                hidden_states = input_data["input_ids"].astype(np.float32)
+            else:
+                hidden_states = input_data["hidden_states"]
+            start_layer, end_layer = input_data["start_layer"], input_data["end_layer"]
+            await asyncio.sleep(self.round_trip + sum(self.costs[start_layer:end_layer]))
+            hidden_states = hidden_states + sum(self.weights[start_layer:end_layer]) * input_data["attention_mask"]
+            outputs = {"logits" if end_layer == len(self.weights) else "hidden_states": hidden_states}
+            if self.report_layer_times and input_data.get("profile"):
+                outputs["layer_times"] = self.costs[start_layer:end_layer]
+            return outputs
+        finally:
+            self.busy.discard(gpu)
+
+class TestPartitionLayers(unittest.TestCase):
+    def test_uneven_layer_counts_keep_every_layer(self):
+        counts = partition_layers([1.0] * 10, 4)
+        self.assertEqual(sum(counts), 10)
+        self.assertEqual(sorted(counts), [2, 2, 3, 3])
+
+    def test_balances_by_cost(self):
+        self.assertEqual(partition_layers([1, 1, 1, 1, 4, 4], 3), [4, 1, 1])
+        self.assertEqual(partition_layers([5, 1, 1, 1, 1, 1], 2), [1, 5])
+
+    def test_rejects_more_stages_than_layers(self):
+        with self.assertRaises(ValueError):
+            partition_layers([1.0, 1.0], 3)
+
+class TestModelParallelNIMWrapper(unittest.TestCase):
+    def setUp(self):
+        self.weights = list(range(1, 9))
+        self.input_ids = np.arange(32, dtype=np.int64).reshape(8, 4)
+        self.attention_mask = np.ones((8, 4), dtype=np.int64)
+        self.attention_mask[0, :2] = 0
+
+    def expected(self):
+        return self.input_ids + sum(self.weights) * self.attention_mask
+
+    def test_activations_flow_through_every_stage(self):
+        stub = StageStub(self.weights, [0.0] * 8)
+        wrapper = ModelParallelNIMWrapper(stub, "gpt2", 3, num_micro_batches=4)
+        self.assertEqual(wrapper.stage_ranges, [(0, 2), (2, 5), (5, 8)])
+        result = asyncio.run(wrapper.inference("gpt2", {"input_ids": self.input_ids, "attention_mask": self.attention_mask}))
+        np.testing.assert_array_equal(result["logits"], self.expected())
+        self.assertEqual(len(stub.calls), 4 * 3)
+
+    def test_micro_batches_overlap_across_stages(self):
+        stub = StageStub(self.weights, [0.005] * 8)
+        wrapper = ModelParallelNIMWrapper(stub, "gpt2", 4, num_micro_batches=8)
+        start_time = time.perf_counter()
+        result = asyncio.run(wrapper.forward_async(self.input_ids, self.attention_mask))
+        elapsed = time.perf_counter() - start_time
+        np.testing.assert_array_equal(result["logits"], self.expected())
+        # Sequential stages would take 8 micro-batches x 4 stages x 10ms; a full pipeline takes 11 steps.
+        self.assertLess(elapsed, 0.6 * 8 * 4 * 0.01)
+        stats = wrapper.last_stats
+        self.assertAlmostEqual(stats["ideal_bubble"], 3 / 11)
+        self.assertGreater(stats["utilization"], 0.5)
+        self.assertAlmostEqual(stats["bubble"], 1 - stats["utilization"])
+
+    def test_concurrent_batches_share_the_stages(self):
+        # The batcher runs several batches of a model at once; a gpu still takes one micro-batch
+        # at a time (StageStub fails otherwise).
+        stub = StageStub(self.weights, [0.002] * 8)
+        wrapper = ModelParallelNIMWrapper(stub, "gpt2", 4, num_micro_batches=4)
+
+        async def run():
+            return await asyncio.gather(*[wrapper.forward_async(self.input_ids, self.attention_mask) for _ in range(3)])
+
+        for result in asyncio.run(run()):
+            np.testing.assert_array_equal(result["logits"], self.expected())
+        # A second event loop gets its own locks.
+        np.testing.assert_array_equal(wrapper(self.input_ids, self.attention_mask)["logits"], self.expected())
+
+    def test_rebalance_uses_measured_layer_costs(self):
+        # One layer (say, the embedding) costs more than the other seven together. The round
+        # trip each call pays would make the layers look alike unless it is subtracted.
+        costs = [0.04] + [0.004] * 7
+        stub = StageStub(self.weights, costs, round_trip=0.02)
+        wrapper = ModelParallelNIMWrapper(stub, "gpt2", 2)
+        self.assertEqual(wrapper.layer_distribution, [4, 4])
+        probe = np.ones((1, 4), dtype=np.int64)
+        self.assertEqual(asyncio.run(wrapper.rebalance(probe, probe)), [1, 7])
+        self.assertEqual(wrapper.stage_ranges, [(0, 1), (1, 8)])
+
+    def test_rebalance_prefers_layer_times_reported_by_the_stages(self):
+        costs = [0.001] * 7 + [0.01]
+        stub = StageStub(self.weights, costs, round_trip=0.01, report_layer_times=True)
+        wrapper = ModelParallelNIMWrapper(stub, "gpt2", 2)
+        probe = np.ones((1, 4), dtype=np.int64)
+        self.assertEqual(asyncio.run(wrapper.rebalance(probe, probe, runs=3)), [7, 1])
+        self.assertEqual(wrapper.layer_costs, costs)
+        # One call per stage and run, instead of one per layer.
+        self.assertEqual(len(stub.calls), 2 * 3)
+
+    def test_synchronous_forward_with_torch_tensors(self):
+        class SyncStub(StageStub):
+            def inference(self, model_name, input_data):
+                input_data = {key: value.numpy() if isinstance(value, torch.Tensor) else value
+                              for key, value in input_data.items()}
+                return asyncio.run(StageStub.inference(self, model_name, input_data))
+
+        wrapper = ModelParallelNIMWrapper(SyncStub(self.weights, [0.0] * 8), "gpt2", 2, num_micro_batches=3)
+        result = wrapper(torch.tensor(self.input_ids), torch.tensor(self.attention_mask))
+        np.testing.assert_array_equal(result["logits"], self.expected())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+from prometheus_client import CollectorRegistry
+from src.monitoring import Monitoring
+
+class TestMonitoring(unittest.TestCase):
+    def setUp(self):
+        self.registry = CollectorRegistry()
+        self.monitoring = Monitoring(port=None, latency_buckets=[0.01, 0.1, 1.0], registry=self.registry)
+
+    def sample(self, name, **labels):
+        return self.registry.get_sample_value(name, labels)
+
+    def test_async_handler_is_timed_until_it_completes(self):
+        @self.monitoring.measure_request_time("inference")
+        async def handler(request):
+            await asyncio.sleep(0.05)
+            return "done"
+
+        result = asyncio.run(handler(request=SimpleNamespace(model_name="gpt2")))
+        self.assertEqual(result, "done")
+        self.assertEqual(self.sample("request_latency_seconds_count", endpoint="inference", model="gpt2"), 1)
+        self.assertGreaterEqual(self.sample("request_latency_seconds_sum", endpoint="inference", model="gpt2"), 0.05)
+        self.assertEqual(self.sample("request_latency_seconds_bucket", endpoint="inference", model="gpt2", le="0.01"), 0)
+
+    def test_failed_requests_are_timed(self):
+        @self.monitoring.measure_request_time("undeploy")
+        async def handler(model_name):
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(handler(model_name="bert"))
+        self.assertEqual(self.sample("request_latency_seconds_count", endpoint="undeploy", model="bert"), 1)
+
+    def test_streamed_response_is_timed_until_its_last_chunk(self):
+        async def chunks():
+            yield "first"
+            await asyncio.sleep(0.05)
+            yield "last"
+
+        @self.monitoring.measure_request_time("inference_batch")
+        async def handler(model_name):
+            return SimpleNamespace(body_iterator=chunks())
+
+        async def run():
+            response = await handler(model_name="gpt2")
+            self.assertIsNone(self.sample("request_latency_seconds_count", endpoint="inference_batch", model="gpt2"))
+            return [chunk async for chunk in response.body_iterator]
+
+        self.assertEqual(asyncio.run(run()), ["first", "last"])
+        self.assertEqual(self.sample("request_latency_seconds_count", endpoint="inference_batch", model="gpt2"), 1)
+        self.assertGreaterEqual(self.sample("request_latency_seconds_sum", endpoint="inference_batch", model="gpt2"), 0.05)
+
+    def test_model_latency_uses_configured_buckets(self):
+        self.monitoring.record_model_latency(0.5, "gpt2")
+        self.assertEqual(self.sample("model_inference_latency_seconds_bucket", model="gpt2", le="0.1"), 0)
+        self.assertEqual(self.sample("model_inference_latency_seconds_bucket", model="gpt2", le="1.0"), 1)
+
+    @patch("src.monitoring.GPUtil.getGPUs")
+    def test_collect_metrics_reads_the_cached_snapshot(self, mock_get_gpus):
+        mock_get_gpus.return_value = [MagicMock(load=0.5, memoryUsed=1024)]
+        self.assertEqual(self.monitoring.collect_metrics(), {})
+        self.monitoring.sample_system_metrics()
+        mock_get_gpus.reset_mock()
+
+        snapshot = self.monitoring.collect_metrics()
+        mock_get_gpus.assert_not_called()
+        self.assertEqual(snapshot["gpus"][0]["utilization_percent"], 50)
+        self.assertGreater(snapshot["memory_usage_bytes"], 0)
+
+    @patch("src.monitoring.GPUtil.getGPUs", side_effect=OSError("nvidia-smi not found"))
+    def test_sampler_thread_survives_missing_gpus(self, mock_get_gpus):
+        self.monitoring.start_sampler(interval=0.01)
+        time.sleep(0.05)
+        self.monitoring.stop_sampler()
+        self.assertEqual(self.monitoring.collect_metrics()["gpus"], [])
+        self.assertGreater(mock_get_gpus.call_count, 1)
+
+    def test_queue_depth_is_read_on_the_event_loop(self):
+        threads = []
+
+        def depth():
+            threads.append(threading.get_ident())
+            return 7
+
+        async def run():
+            self.monitoring.track_queue_depth(depth, asyncio.get_running_loop())
+            # A scrape or the autoscaler reads from its own thread.
+            value = await asyncio.get_running_loop().run_in_executor(None, self.monitoring.queue_depth)
+            return value, threading.get_ident()
+
+        value, loop_thread = asyncio.run(run())
+        self.assertEqual(value, 7)
+        self.assertEqual(threads, [loop_thread])
+        self.assertEqual(self.sample("batcher_queue_depth"), 7)
+
+    def test_metrics_server_starts_only_when_asked(self):
+        with patch('src.monitoring.start_http_server', return_value=(MagicMock(), MagicMock())) as mock_start:
+            monitoring = Monitoring(port=9100, registry=CollectorRegistry())
+            mock_start.assert_not_called()
+            monitoring.start_server()
+            monitoring.start_server()
+            mock_start.assert_called_once_with(9100, registry=monitoring.registry)
+            server = monitoring._server
+            monitoring.stop_server()
+            server.shutdown.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,38 @@
 import unittest
+import asyncio
+import json
+import time
 from unittest.mock import patch, MagicMock
-from src.nim_client import NIMClient
+import numpy as np
+from aiohttp import ClientResponseError, web
+from aiohttp.test_utils import TestServer
+from src.endpoint_pool import EndpointPool
+from src.nim_client import NIMClient, AsyncNIMClient
+from src.tensor_codec import TENSOR_CONTENT_TYPE, encode_tensors, decode_tensors
 
 class TestNIMClient(unittest.TestCase):
     def setUp(self):
         self.nim_client = NIMClient("http://localhost:8000")
 
     @patch('requests.post')
-    def test_deploy_model(self, mock_post):
+    @patch.object(NIMClient, '_build_onnx')
+    def test_deploy_model(self, mock_build, mock_post):
         mock_response = MagicMock()
         mock_response.json.return_value = {"status": "success"}
         mock_post.return_value = mock_response
 
         result = self.nim_client.deploy_model("test_model", "path/to/model")
         self.assertEqual(result, {"status": "success"})
-        mock_post.assert_called_once_with("http://localhost:8000/models/test_model", json={"model_path": "path/to/model_onnx_optimized"})
+        mock_build.assert_called_once_with("path/to/model", "path/to/model_onnx")
+        mock_post.assert_called_once_with("http://localhost:8000/models/test_model",
+                                          json={"model_path": "path/to/model_onnx/model_optimized.onnx"})
+
+    @patch('requests.post')
+    @patch.object(NIMClient, '_build_onnx')
+    def test_deploy_quantized_model(self, mock_build, mock_post):
+        NIMClient("http://localhost:8000", quantize=True).deploy_model("test_model", "path/to/model")
+        mock_post.assert_called_once_with("http://localhost:8000/models/test_model",
+                                          json={"model_path": "path/to/model_onnx/model_quantized.onnx"})
 
     @patch('requests.post')
     def test_inference(self, mock_post):
@@ -46,5 +64,238 @@ class TestNIMClient(unittest.TestCase):
         self.assertEqual(result, {"status": "success"})
         mock_delete.assert_called_once_with("http://localhost:8000/models/test_model")
 
+class TestAsyncNIMClient(unittest.TestCase):
+    def run_with_server(self, test, **client_kwargs):
+        peers = set()
+
+        async def infer(request):
+            peers.add(request.transport.get_extra_info("peername"))
+            if request.content_type == TENSOR_CONTENT_TYPE:
+                if request.match_info["model_name"] == "json_only":
+                    return web.Response(status=415)
+                body = decode_tensors(await request.read())
+                logits = body["input_ids"].astype(np.float32)
+                return web.Response(body=bytes(encode_tensors({"logits": logits})), content_type=TENSOR_CONTENT_TYPE)
+            body = await request.json()
+            return web.json_response({"logits": body["input_ids"]})
+
+        async def stream(request):
+            body = await request.json()
+            response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await response.prepare(request)
+            sse = request.match_info["model_name"] == "sse_model"
+            for token_id in body["input_ids"][0][:body["parameters"]["max_new_tokens"]]:
+                line = json.dumps({"token_id": token_id})
+                await response.write((f"data: {line}\n\n" if sse else f"{line}\n").encode())
+                await asyncio.sleep(0.01)
+            if sse:
+                await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+            return response
+
+        async def slow_status(request):
+            await asyncio.sleep(0.5)
+            return web.json_response({"status": "running"})
+
+        async def undeploy(request):
+            return web.json_response({"status": "success", "model": request.match_info["model_name"]})
+
+        async def main():
+            app = web.Application()
+            app.router.add_post("/models/{model_name}/infer", infer)
+            app.router.add_post("/models/{model_name}/infer/stream", stream)
+            app.router.add_get("/models/{model_name}/status", slow_status)
+            app.router.add_delete("/models/{model_name}", undeploy)
+            server = TestServer(app)
+            await server.start_server()
+            client = AsyncNIMClient(str(server.make_url("")).rstrip("/"), **client_kwargs)
+            try:
+                await test(client, peers)
+            finally:
+                await client.close()
+                await server.close()
+
+        asyncio.run(main())
+
+    def test_inference_reuses_pooled_connection(self):
+        async def test(client, peers):
+            for _ in range(3):
+                result = await client.inference("test_model", {"input_ids": np.array([[1, 2, 3]])})
+                self.assertEqual(result, {"logits": [[1, 2, 3]]})
+            self.assertEqual(len(peers), 1)
+
+        self.run_with_server(test, pool_size=1, wire_format="json")
+
+    def test_binary_inference(self):
+        async def test(client, peers):
+            result = await client.inference("test_model", {"input_ids": np.array([[1, 2, 3]])})
+            self.assertEqual(result["logits"].dtype, np.float32)
+            np.testing.assert_array_equal(result["logits"], [[1, 2, 3]])
+
+        self.run_with_server(test)
+
+    def test_binary_falls_back_to_json(self):
+        async def test(client, peers):
+            result = await client.inference("json_only", {"input_ids": np.array([[4, 5]])})
+            self.assertEqual(result, {"logits": [[4, 5]]})
+            self.assertEqual(client.wire_format, "json")
+
+        self.run_with_server(test)
+
+    def test_stream_inference(self):
+        async def test(client, peers):
+            for model_name in ("test_model", "sse_model"):
+                events = [
+                    event async for event in client.stream_inference(
+                        model_name, {"input_ids": np.array([[7, 8, 9, 10]])}, {"max_new_tokens": 3}
+                    )
+                ]
+                self.assertEqual(events, [{"token_id": 7}, {"token_id": 8}, {"token_id": 9}])
+
+        self.run_with_server(test)
+
+    def test_per_request_timeout(self):
+        async def test(client, peers):
+            with self.assertRaises(asyncio.TimeoutError):
+                await client.get_model_status("test_model", timeout=0.05)
+
+        self.run_with_server(test)
+
+    def test_undeploy_model(self):
+        async def test(client, peers):
+            result = await client.undeploy_model("test_model")
+            self.assertEqual(result, {"status": "success", "model": "test_model"})
+
+        self.run_with_server(test)
+
+class TestReplicaRouting(unittest.TestCase):
+    def run_with_replicas(self, test, names=("a", "b"), pool_kwargs=None, **client_kwargs):
+        # Each replica answers with its name; `state` lets a test make one stall, fail or go unhealthy.
+        state = {name: {"stall": set(), "fail": False, "unhealthy": False, "down": False, "requests": []} for name in names}
+
+        def make_app(name):
+            replica = state[name]
+
+            async def infer(request):
+                model_name = request.match_info["model_name"]
+                replica["requests"].append(("infer", model_name))
+                if replica["fail"]:
+                    return web.Response(status=500)
+                await asyncio.sleep(1.0 if model_name in replica["stall"] else 0.02)
+                body = await request.json()
+                return web.json_response({"replica": name, "logits": body["input_ids"]})
+
+            async def status(request):
+                return web.json_response({"status": "running"}, status=503 if replica["unhealthy"] else 200)
+
+            async def ready(request):
+                if replica["down"]:
+                    raise ConnectionResetError()
+                return web.Response(status=503 if replica["unhealthy"] else 200)
+
+            async def deploy(request):
+                replica["requests"].append((request.method, request.match_info["model_name"]))
+                return web.json_response({"status": "success", "replica": name})
+
+            app = web.Application()
+            app.router.add_post("/models/{model_name}/infer", infer)
+            app.router.add_get("/models/{model_name}/status", status)
+            app.router.add_get("/v1/health/ready", ready)
+            app.router.add_post("/models/{model_name}", deploy)
+            app.router.add_delete("/models/{model_name}", deploy)
+            return app
+
+        async def main():
+            servers = [TestServer(make_app(name)) for name in names]
+            for server in servers:
+                await server.start_server()
+            pool = EndpointPool([str(server.make_url("")) for server in servers], **(pool_kwargs or {}))
+            client = AsyncNIMClient(pool, wire_format="json", **client_kwargs)
+            try:
+                await test(client, state)
+            finally:
+                await client.close()
+                for server in servers:
+                    await server.close()
+
+        asyncio.run(main())
+
+    def test_concurrent_calls_spread_across_replicas(self):
+        async def test(client, state):
+            results = await asyncio.gather(*[client.inference("test_model", {"input_ids": [[i]]}) for i in range(10)])
+            self.assertEqual([result["logits"] for result in results], [[[i]] for i in range(10)])
+            self.assertEqual({result["replica"] for result in results}, {"a", "b"})
+            self.assertEqual([endpoint.outstanding for endpoint in client.endpoints], [0, 0])
+
+        self.run_with_replicas(test)
+
+    def test_slow_call_is_hedged_to_another_replica(self):
+        async def test(client, state):
+            for _ in range(20):
+                await client.inference("test_model", {"input_ids": [[1]]})
+            a, b = client.endpoints.endpoints
+            # Make replica a the first choice, then have it stall on the next call.
+            a.ewma_latency, b.ewma_latency = 0.001, 0.5
+            state["a"]["stall"].add("test_model")
+            start_time = time.perf_counter()
+            result = await client.inference("test_model", {"input_ids": [[7]]})
+            self.assertLess(time.perf_counter() - start_time, 0.5)
+            self.assertEqual(result, {"replica": "b", "logits": [[7]]})
+            self.assertEqual(state["a"]["requests"][-1], ("infer", "test_model"))
+            # The abandoned call, cancelled in the background, counts against replica a's latency.
+            await asyncio.sleep(0.01)
+            self.assertGreater(a.ewma_latency, 0.01)
+
+        self.run_with_replicas(test, hedge=True)
+
+    def test_failing_replica_is_ejected(self):
+        async def test(client, state):
+            state["a"]["fail"] = True
+            for _ in range(2):
+                with self.assertRaises(ClientResponseError):
+                    await client.inference("test_model", {"input_ids": [[1]]})
+            for _ in range(3):
+                result = await client.inference("test_model", {"input_ids": [[1]]})
+                self.assertEqual(result["replica"], "b")
+            self.assertEqual(len(state["a"]["requests"]), 2)
+
+        self.run_with_replicas(test, pool_kwargs={"max_failures": 2})
+
+    def test_health_checks_eject_and_reinstate(self):
+        async def test(client, state):
+            a, b = client.endpoints.endpoints
+            state["a"]["unhealthy"] = True
+            self.assertEqual(await client.check_endpoints(), {a.url: False, b.url: True})
+            self.assertEqual(client.endpoints.available(), [b])
+            state["a"]["unhealthy"] = False
+            self.assertEqual(await client.check_endpoints(), {a.url: True, b.url: True})
+            self.assertEqual(client.endpoints.available(), [a, b])
+            state["b"]["down"] = True
+            self.assertEqual(await client.check_endpoints(), {a.url: True, b.url: False})
+            self.assertEqual(client.endpoints.available(), [a])
+
+        self.run_with_replicas(test)
+
+    def test_health_check_4xx_keeps_replica_in_routing(self):
+        async def test(client, state):
+            # The replica answers, just not for this route or model: it is up.
+            self.assertEqual(await client.check_endpoints("/models/missing/health"),
+                             {endpoint.url: True for endpoint in client.endpoints})
+            self.assertEqual(len(client.endpoints.available()), 2)
+            self.assertEqual([endpoint.ejected_until for endpoint in client.endpoints], [0.0, 0.0])
+
+        self.run_with_replicas(test)
+
+    def test_deploy_and_undeploy_reach_every_replica(self):
+        async def test(client, state):
+            with patch.object(client, "prepare_onnx", return_value="model.onnx"):
+                result = await client.deploy_model("test_model", "path/to/model")
+            self.assertEqual(result, {"status": "success", "replica": "a"})
+            await client.undeploy_model("test_model")
+            for replica in state.values():
+                self.assertEqual(replica["requests"], [("POST", "test_model"), ("DELETE", "test_model")])
+
+        self.run_with_replicas(test)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+from src.response_cache import ResponseCache
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.monitoring = MagicMock()
+        self.cache = ResponseCache(max_bytes=10_000, ttl=60.0, monitoring=self.monitoring)
+
+    def test_key_normalizes_whitespace_and_includes_parameters(self):
+        key = ResponseCache.make_key("gpt2", "  Hello   world ", {"temperature": 0.5})
+        self.assertEqual(key, ResponseCache.make_key("gpt2", "Hello world", {"temperature": 0.5}))
+        self.assertNotEqual(key, ResponseCache.make_key("gpt2", "Hello world", {"temperature": 0.7}))
+        self.assertNotEqual(key, ResponseCache.make_key("bert", "Hello world", {"temperature": 0.5}))
+
+    def test_hit_and_miss_are_recorded(self):
+        key = ResponseCache.make_key("gpt2", "hi")
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, "gpt2", {"logits": np.zeros(4)})
+        np.testing.assert_array_equal(self.cache.get(key)["logits"], np.zeros(4))
+        self.monitoring.record_cache_miss.assert_called_once()
+        self.monitoring.record_cache_hit.assert_called_once()
+
+    def test_entries_expire_after_ttl(self):
+        key = ResponseCache.make_key("gpt2", "hi")
+        with patch("src.response_cache.time.monotonic", return_value=100.0):
+            self.cache.put(key, "gpt2", {"logits": np.zeros(4)})
+        with patch("src.response_cache.time.monotonic", return_value=161.0):
+            self.assertIsNone(self.cache.get(key))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_is_evicted_over_budget(self):
+        value = {"logits": np.zeros(500, dtype=np.float32)}
+        keys = [ResponseCache.make_key("gpt2", str(i)) for i in range(5)]
+        for key in keys[:4]:
+            self.cache.put(key, "gpt2", value)
+        self.cache.get(keys[0])
+        self.cache.put(keys[4], "gpt2", value)
+        self.assertLessEqual(self.cache.current_bytes, self.cache.max_bytes)
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertTrue(self.monitoring.record_cache_eviction.called)
+
+    def test_invalidate_model_drops_entries_and_in_flight_results(self):
+        gpt2_key = ResponseCache.make_key("gpt2", "hi")
+        bert_key = ResponseCache.make_key("bert", "hi")
+        self.cache.put(gpt2_key, "gpt2", {"logits": np.zeros(2)})
+        self.cache.put(bert_key, "bert", {"logits": np.zeros(2)})
+        generation = self.cache.generation("gpt2")
+
+        self.cache.invalidate_model("gpt2")
+        self.assertIsNone(self.cache.get(gpt2_key))
+        self.assertIsNotNone(self.cache.get(bert_key))
+
+        self.cache.put(gpt2_key, "gpt2", {"logits": np.ones(2)}, generation)
+        self.assertIsNone(self.cache.get(gpt2_key))
+
+    def test_cached_result_does_not_keep_its_batch_buffer(self):
+        batch = np.frombuffer(np.arange(4000, dtype=np.float32).tobytes(), dtype=np.float32).reshape(40, 100)
+        row = batch[3, :10]
+        key = ResponseCache.make_key("gpt2", "hi")
+        self.cache.put(key, "gpt2", {"logits": row, "pair": (row, [row])})
+        cached = self.cache.get(key)
+        for array in (cached["logits"], cached["pair"][0], cached["pair"][1][0]):
+            self.assertIsNone(array.base)
+            self.assertFalse(np.shares_memory(array, batch))
+            np.testing.assert_array_equal(array, row)
+        self.assertLess(self.cache.current_bytes, batch.nbytes)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import asyncio
+from unittest.mock import MagicMock
+from src.single_flight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.monitoring = MagicMock()
+        self.single_flight = SingleFlight(self.monitoring)
+        self.calls = 0
+
+    async def slow_inference(self, value):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return {"logits": value}
+
+    def test_identical_requests_share_one_call(self):
+        async def test():
+            results = await asyncio.gather(*[
+                self.single_flight.do(("gpt2", b"abc"), lambda: self.slow_inference(1)) for _ in range(5)
+            ])
+            self.assertEqual(results, [{"logits": 1}] * 5)
+            self.assertEqual(self.calls, 1)
+            self.assertEqual(self.monitoring.record_coalesced_request.call_count, 4)
+            self.assertEqual(self.single_flight.in_flight(), 0)
+
+        asyncio.run(test())
+
+    def test_distinct_keys_run_separately(self):
+        async def test():
+            await asyncio.gather(
+                self.single_flight.do(("gpt2", b"abc"), lambda: self.slow_inference(1)),
+                self.single_flight.do(("bert", b"abc"), lambda: self.slow_inference(2)),
+            )
+            self.assertEqual(self.calls, 2)
+
+        asyncio.run(test())
+
+    def test_completed_requests_are_not_reused(self):
+        async def test():
+            await self.single_flight.do("key", lambda: self.slow_inference(1))
+            await self.single_flight.do("key", lambda: self.slow_inference(1))
+            self.assertEqual(self.calls, 2)
+
+        asyncio.run(test())
+
+    def test_errors_reach_every_waiter(self):
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("NIM unavailable")
+
+        async def test():
+            results = await asyncio.gather(
+                self.single_flight.do("key", failing),
+                self.single_flight.do("key", failing),
+                return_exceptions=True,
+            )
+            self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+
+        asyncio.run(test())
+
+    def test_one_waiter_cancelling_keeps_the_shared_call(self):
+        async def test():
+            first = asyncio.create_task(self.single_flight.do("key", lambda: self.slow_inference(1)))
+            second = asyncio.create_task(self.single_flight.do("key", lambda: self.slow_inference(1)))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            self.assertEqual(await second, {"logits": 1})
+
+        asyncio.run(test())
+
+    def test_last_waiter_cancelling_cancels_the_call(self):
+        async def test():
+            work = asyncio.get_running_loop().create_future()
+
+            async def wait_forever():
+                await work
+
+            waiter = asyncio.create_task(self.single_flight.do("key", wait_forever))
+            await asyncio.sleep(0.01)
+            task = self.single_flight._in_flight["key"]
+            waiter.cancel()
+            await asyncio.sleep(0.01)
+            self.assertTrue(task.cancelled())
+            self.assertEqual(self.single_flight.in_flight(), 0)
+
+        asyncio.run(test())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestStartup(unittest.TestCase):
+    def test_importing_the_service_skips_heavy_dependencies(self):
+        # Outside a cluster and without a GPU: nothing at import may need either.
+        script = (
+            "import sys, main; "
+            "print(sorted(m for m in ('torch', 'transformers', 'onnx', 'onnxruntime', 'kubernetes') if m in sys.modules))"
+        )
+        env = dict(os.environ, PYTHONPATH=os.path.join(ROOT_DIR, "src"))
+        output = subprocess.run([sys.executable, "-c", script], env=env, cwd=ROOT_DIR,
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip().splitlines()[-1], "[]")
+
+if __name__ == '__main__':
+    unittest.main()
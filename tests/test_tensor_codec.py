@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from src.tensor_codec import encode_tensors, decode_tensors, ALIGNMENT
+
+class TestTensorCodec(unittest.TestCase):
+    def test_round_trip(self):
+        data = {
+            "input_ids": np.arange(12, dtype=np.int64).reshape(3, 4),
+            "logits": np.random.rand(2, 5, 7).astype(np.float16),
+            "empty": np.zeros((0, 3), dtype=np.float32),
+            "start_layer": 2,
+        }
+        decoded = decode_tensors(bytes(encode_tensors(data)))
+        for name in ("input_ids", "logits", "empty"):
+            self.assertEqual(decoded[name].dtype, data[name].dtype)
+            np.testing.assert_array_equal(decoded[name], data[name])
+        self.assertEqual(decoded["start_layer"], 2)
+
+    def test_decode_is_zero_copy(self):
+        body = bytes(encode_tensors({"logits": np.ones((4, 8), dtype=np.float32)}))
+        logits = decode_tensors(body)["logits"]
+        self.assertFalse(logits.flags.owndata)
+        self.assertFalse(logits.flags.writeable)
+        self.assertTrue(np.shares_memory(logits, np.frombuffer(body, dtype=np.uint8)))
+
+    def test_buffers_are_aligned(self):
+        body = encode_tensors({"a": np.ones(3, dtype=np.int8), "b": np.ones(3, dtype=np.float64)})
+        decoded = decode_tensors(body)
+        base = np.frombuffer(body, dtype=np.uint8).ctypes.data
+        for array in decoded.values():
+            self.assertEqual((array.ctypes.data - base) % ALIGNMENT, 0)
+
+    def test_non_contiguous_input(self):
+        array = np.arange(20, dtype=np.int32).reshape(4, 5)[:, ::2]
+        np.testing.assert_array_equal(decode_tensors(encode_tensors({"x": array}))["x"], array)
+
+    def test_rejects_foreign_payload(self):
+        with self.assertRaises(ValueError):
+            decode_tensors(b"JSON{}\x00\x00\x00\x00")
+
+    def test_rejects_object_arrays(self):
+        with self.assertRaises(ValueError):
+            encode_tensors({"x": np.array(["a", None], dtype=object)})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import asyncio
+from unittest.mock import patch
+import numpy as np
+from src.tokenizer_registry import TokenizerRegistry
+
+class FakeTokenizer:
+    pad_token_id = None
+    eos_token_id = 50256
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        input_ids = [[len(word) for word in text.split()] for text in texts]
+        return {"input_ids": input_ids, "attention_mask": [[1] * len(ids) for ids in input_ids]}
+
+class TestTokenizerRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = TokenizerRegistry({"gpt2": {"model_path": "path/to/gpt2"}}, max_loaded=2)
+
+    def tearDown(self):
+        self.registry.close()
+
+    @patch('transformers.AutoTokenizer.from_pretrained')
+    def test_loads_each_tokenizer_once(self, mock_from_pretrained):
+        mock_from_pretrained.side_effect = lambda path: FakeTokenizer()
+        first = self.registry.get("gpt2")
+        self.assertIs(self.registry.get("gpt2"), first)
+        mock_from_pretrained.assert_called_once_with("path/to/gpt2")
+
+    @patch('transformers.AutoTokenizer.from_pretrained')
+    def test_least_recently_used_is_evicted(self, mock_from_pretrained):
+        mock_from_pretrained.side_effect = lambda path: FakeTokenizer()
+        self.registry.get("gpt2")
+        self.registry.get("bert")
+        self.registry.get("gpt2")
+        self.registry.get("t5")
+        self.assertEqual(self.registry.loaded_models(), ["gpt2", "t5"])
+
+    @patch('transformers.AutoTokenizer.from_pretrained')
+    def test_concurrent_calls_are_tokenized_as_one_batch(self, mock_from_pretrained):
+        tokenizer = FakeTokenizer()
+        mock_from_pretrained.return_value = tokenizer
+
+        async def test():
+            return await asyncio.gather(
+                self.registry.tokenize("gpt2", "hello there"),
+                self.registry.tokenize("gpt2", "a longer prompt here"),
+            )
+
+        first, second = asyncio.run(test())
+        self.assertEqual(tokenizer.calls, [["hello there", "a longer prompt here"]])
+        np.testing.assert_array_equal(first["input_ids"], [5, 5])
+        np.testing.assert_array_equal(second["attention_mask"], [1, 1, 1, 1])
+
+    @patch('transformers.AutoTokenizer.from_pretrained')
+    def test_pad_token_falls_back_to_eos(self, mock_from_pretrained):
+        mock_from_pretrained.return_value = FakeTokenizer()
+        self.assertEqual(self.registry.pad_token_id("gpt2"), 50256)
+
+    @patch('transformers.AutoTokenizer.from_pretrained')
+    def test_special_ids_survive_eviction_without_a_reload(self, mock_from_pretrained):
+        mock_from_pretrained.side_effect = lambda path: FakeTokenizer()
+        asyncio.run(self.registry.tokenize("gpt2", "hello"))
+        self.registry.evict("gpt2")
+        self.assertEqual(self.registry.pad_token_id("gpt2"), 50256)
+        self.assertEqual(self.registry.eos_token_id("gpt2"), 50256)
+        self.assertEqual(mock_from_pretrained.call_count, 1)
+        self.assertEqual(self.registry.loaded_models(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+import numpy as np
+from prometheus_client import CollectorRegistry
+from src.monitoring import Monitoring
+from src.tracing import Tracer
+from src.dynamic_batcher import DynamicBatcher, batch_inference
+
+class FakeNIMClient:
+    async def inference(self, model_name, input_data):
+        await asyncio.sleep(0.01)
+        return {"logits": np.zeros((input_data["input_ids"].shape[0], 4), dtype=np.float32)}
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.registry = CollectorRegistry()
+        self.monitoring = Monitoring(port=None, registry=self.registry)
+        self.directory = tempfile.TemporaryDirectory()
+        self.trace_file = os.path.join(self.directory.name, "traces", "traces.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def stage_count(self, stage, model):
+        return self.registry.get_sample_value("inference_stage_seconds_count", {"stage": stage, "model": model})
+
+    def read_traces(self):
+        with open(self.trace_file) as f:
+            return [json.loads(line) for line in f]
+
+    def test_spans_feed_the_stage_histogram(self):
+        tracer = Tracer(self.monitoring)
+        with tracer.trace("inference", "gpt2"):
+            with tracer.span("tokenize"):
+                pass
+        with tracer.span("tokenize", model_name="bert"):
+            pass
+        self.assertEqual(self.stage_count("tokenize", "gpt2"), 1)
+        self.assertEqual(self.stage_count("tokenize", "bert"), 1)
+
+    def test_sampled_traces_are_written_to_file(self):
+        tracer = Tracer(self.monitoring, sample_rate=1.0, trace_file=self.trace_file)
+        with tracer.trace("inference", "gpt2") as trace:
+            with tracer.span("tokenize"):
+                pass
+            with tracer.span("serialize"):
+                pass
+        tracer.close()
+        [written] = self.read_traces()
+        self.assertEqual(written["trace_id"], trace.trace_id)
+        self.assertEqual([span["stage"] for span in written["spans"]], ["tokenize", "serialize"])
+        self.assertGreaterEqual(written["duration_ms"], 0)
+
+    def test_unsampled_traces_are_not_written(self):
+        tracer = Tracer(self.monitoring, sample_rate=0.0, trace_file=self.trace_file)
+        with tracer.trace("inference", "gpt2") as trace:
+            with tracer.span("tokenize"):
+                pass
+        tracer.close()
+        self.assertEqual(trace.spans, [])
+        self.assertFalse(os.path.exists(self.trace_file))
+        self.assertEqual(self.stage_count("tokenize", "gpt2"), 1)
+
+    def test_batch_stages_are_attributed_to_every_request(self):
+        tracer = Tracer(self.monitoring, sample_rate=1.0, trace_file=self.trace_file)
+
+        async def handler(model_name, batch):
+            return await batch_inference(FakeNIMClient(), model_name, batch, tracer=tracer)
+
+        async def request(batcher, length):
+            with tracer.trace("inference", "gpt2"):
+                await batcher.add_request("gpt2", {"input_ids": np.ones(length, dtype=np.int64)})
+
+        async def run():
+            batcher = DynamicBatcher(2, 1.0, handler, tracer=tracer)
+            await asyncio.gather(request(batcher, 3), request(batcher, 5))
+            await batcher.stop()
+
+        asyncio.run(run())
+        tracer.close()
+        traces = self.read_traces()
+        self.assertEqual(len(traces), 2)
+        for written in traces:
+            stages = [span["stage"] for span in written["spans"]]
+            self.assertEqual(stages, ["queue_wait", "batch_assembly", "result_split"])
+        batch_ids = {span["batch_id"] for written in traces for span in written["spans"] if "batch_id" in span}
+        self.assertEqual(len(batch_ids), 1)
+        self.assertEqual(self.stage_count("queue_wait", "gpt2"), 2)
+        self.assertEqual(self.stage_count("batch_assembly", "gpt2"), 1)
+
+if __name__ == '__main__':
+    unittest.main()